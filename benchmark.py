@@ -0,0 +1,137 @@
+from whitespace.Runner import load, run, ENGINES
+from whitespace.Runtime import Runtime
+from whitespace.Program import Program
+from whitespace.Fusion import Profile
+from whitespace import Api
+
+import io
+import os
+import sys
+import time
+from argparse import ArgumentParser, Namespace
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "examples")
+
+# Counts down from a number, doing a heap write and read on every iteration
+COUNTDOWN = ("[Space][Space][Space][Tab][LF] push 1 (heap address)\n"
+             + "[Space][Space][Space]{count}[LF] push the count\n"
+             + "[LF][Space][Space][Tab][LF] mark label 1\n"
+             + "[LF][Tab][Space][Space][LF] jump to label 0 if zero\n"
+             + "[Space][Space][Space][Tab][LF] push 1\n"
+             + "[Tab][Space][Space][Tab] subtract\n"
+             + "[Space][LF][Space] duplicate\n"
+             + "[Space][Tab][Space][Space][Tab][Space][LF] copy the address\n"
+             + "[Space][LF][Tab] swap\n"
+             + "[Tab][Tab][Space] store the count\n"
+             + "[Space][Space][Space][Tab][LF] push 1\n"
+             + "[Tab][Tab][Tab] read it back\n"
+             + "[Space][LF][LF] discard\n"
+             + "[LF][Space][LF][Tab][LF] jump to label 1\n"
+             + "[LF][Space][Space][Space][LF] mark label 0\n"
+             + "[LF][LF][LF] end\n")
+
+
+def parse_args() -> Namespace:
+    parser = ArgumentParser(description="Compare the instructions per second of the execution engines")
+    parser.add_argument('-n', dest='repeat', metavar="N", type=int, default=5,
+                        help="best of N runs (default: 5)")
+    parser.add_argument('--count', dest='count', metavar="N", type=int, default=100_000,
+                        help="iterations of the countdown loop (default: 100000)")
+    parser.add_argument('--threads', dest='threads', metavar="N", type=int, default=0,
+                        help="also measure runs per second of one shared program on 1 up to N threads")
+    parser.add_argument('--runs', dest='runs', metavar="N", type=int, default=2000,
+                        help="runs per thread count measurement (default: 2000)")
+    return parser.parse_args(sys.argv[1:])
+
+
+def example(name: str) -> Program:
+    with open(os.path.join(EXAMPLES, name), "rb") as source:
+        return load(source, True)
+
+
+def binary(n: int) -> str:
+    return "".join("[Tab]" if bit == "1" else "[Space]" for bit in bin(n)[2:])
+
+
+# Number of instructions the program executes with this input
+def count_steps(program: Program, stdin: str) -> int:
+    runtime = Runtime(file_in=io.StringIO(stdin), file_out=io.StringIO())
+    steps = 0
+    while runtime.PC != -1 and runtime.PC < len(program):
+        runtime.PC = program[runtime.PC].execute(runtime)
+        steps += 1
+    return steps
+
+
+def time_engine(program: Program, stdin: str, engine: str, times: int, repeat: int, superinstructions: Profile | None = None) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(times):
+            runtime = Runtime(file_in=io.StringIO(stdin), file_out=io.StringIO())
+            run(program, False, False, False, engine, runtime, superinstructions=superinstructions)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def record_profile(program: Program, stdin: str) -> Profile:
+    profile = Profile()
+    run(program, False, False, False, runtime=Runtime(file_in=io.StringIO(stdin), file_out=io.StringIO()), profile=profile)
+    return profile
+
+
+def time_threads(program: Api.CompiledProgram, inputs: list[str], threads: int, engine: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for state in program.map(inputs, threads, engine=engine):
+            if not state.ok:
+                raise state.error
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+# Thread counts to measure: powers of two up to most
+def thread_counts(most: int) -> list[int]:
+    counts = [1]
+    while counts[-1] * 2 < most:
+        counts.append(counts[-1] * 2)
+    return counts + [most] if most > 1 else counts
+
+
+def main() -> None:
+    args = parse_args()
+    # Name, program, input and how many times to run it per measurement
+    cases = [
+        ("hello-world.ws", example("hello-world.ws"), "", 2000),
+        ("cat.ws", example("cat.ws"), "All work and no play makes Jack a dull boy.\n" * 2000, 1),
+        ("countdown", load(COUNTDOWN.format(count=binary(args.count)), True), "", 1),
+    ]
+
+    # Each engine, then the loop and threaded engines with superinstructions from a profile of the same run
+    columns = list(ENGINES) + ["loop+fused", "threaded+fused"]
+    print(f"{'program':<16}{'steps':>10}" + "".join(f"{column:>16}" for column in columns))
+    for (name, program, stdin, times) in cases:
+        steps = count_steps(program, stdin) * times
+        profile = record_profile(program, stdin)
+        seconds = [time_engine(program, stdin, engine, times, args.repeat) for engine in ENGINES]
+        seconds += [time_engine(program, stdin, engine, times, args.repeat, profile) for engine in ("loop", "threaded")]
+        print(f"{name:<16}{steps:>10}" + "".join(f"{steps / elapsed:>16,.0f}" for elapsed in seconds))
+    print("(instructions per second)")
+
+    if args.threads:
+        # Many short runs of one shared program, as a service running it on many inputs would
+        program = Api.CompiledProgram(example("cat.ws"))
+        inputs = [f"request {i}: " + "All work and no play makes Jack a dull boy.\n" * 4 for i in range(args.runs)]
+        counts = thread_counts(args.threads)
+        gil = getattr(sys, "_is_gil_enabled", lambda: True)()
+        print(f"\ncat.ws, {args.runs} runs ({'with' if gil else 'without'} the GIL)")
+        print(f"{'threads':<16}" + "".join(f"{engine:>16}" for engine in ENGINES))
+        for threads in counts:
+            seconds = [time_threads(program, inputs, threads, engine, args.repeat) for engine in ENGINES]
+            print(f"{threads:<16}" + "".join(f"{args.runs / elapsed:>16,.0f}" for elapsed in seconds))
+        print("(runs per second)")
+
+
+if __name__ == "__main__":
+    main()
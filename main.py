@@ -1,6 +1,15 @@
-from whitespace.Runner import execute, minify
+from whitespace.Runner import load_file, run, minify, ENGINES
 from whitespace.Compiler import compile
+from whitespace.Fusion import Profile
+from whitespace.Visitor import visit_optimize, OPTIMIZATION_LEVELS
+from whitespace.Runtime import Runtime, Limits, INT_MODES
+from whitespace.Batch import read_manifest, run_batch
+from whitespace.Heap import MappedHeap
+from whitespace.Output import OUTPUT_BUFFER_SIZE
+from whitespace.Constants_errors import WORD_TYPE
 import sys, os
+import json
+import time
 import subprocess
 from argparse import ArgumentParser, Namespace
 
@@ -12,32 +21,134 @@ def parse_args() -> Namespace:
     parser.add_argument('-v', dest='verbose', metavar="verbose", action="store_const", const=True, default=False)
     parser.add_argument('-c', dest='compile', metavar="compile", action="store_const", const=True, default=False)
     parser.add_argument('-d', dest='debug', metavar="debug", action="store_const", const=True, default=False)
-    parser.add_argument('file', metavar='file', nargs=1, default=None, type=str)
+    parser.add_argument('--no-cache', dest='no_cache', action="store_const", const=True, default=False,
+                        help="don't read or write the parsed program cache")
+    parser.add_argument('-j', '--jobs', dest='jobs', metavar="N", type=int, default=1,
+                        help="tokenize the file with N processes (for very large files)")
+    parser.add_argument('--engine', dest='engine', choices=ENGINES, default="loop",
+                        help="how to execute the program; threaded is faster (default: loop)")
+    parser.add_argument('--profile', dest='profile', metavar="FILE", default=None,
+                        help="count which sequences of commands run, adding the counts to FILE")
+    parser.add_argument('--superinstructions', dest='superinstructions', metavar="FILE", default=None,
+                        help="fuse the sequences that ran most in the profile FILE into single instructions")
+    parser.add_argument('-O', dest='optimize', metavar="LEVEL", type=int, choices=sorted(OPTIMIZATION_LEVELS), default=0,
+                        help="peephole optimize the program before running or compiling it (0-2, default: 0)")
+    parser.add_argument('--int-mode', dest='int_mode', choices=INT_MODES, default=None,
+                        help="wrap32 or wrap64 to wrap results around to 32 or 64 bits, bigint for unbounded numbers "
+                             "(default: native words, which raise on overflow)")
+    parser.add_argument('--heap-file', dest='heap_file', metavar="FILE", default=None,
+                        help="keep the heap in FILE, memory-mapped, instead of in memory; FILE holds the heap after the run")
+    parser.add_argument('--output-buffer', dest='output_buffer', metavar="BYTES", type=int, default=OUTPUT_BUFFER_SIZE,
+                        help=f"hold up to BYTES of the program's output before writing it (default: {OUTPUT_BUFFER_SIZE})")
+    parser.add_argument('--raw-output', dest='raw_output', action="store_const", const=True, default=False,
+                        help="write the program's output as raw UTF-8 bytes to stdout's binary buffer")
+    parser.add_argument('file', metavar='file', nargs=1, default=None, type=str,
+                        help="the program to run; 'batch' runs a manifest instead (see main.py batch -h), "
+                             "so run a program named batch as ./batch")
     args = parser.parse_args(sys.argv[1:])
+    if args.heap_file and args.int_mode == "bigint":
+        parser.error("--heap-file holds fixed-size words, so it can't be used with --int-mode bigint")
 
     print(f"Loose mode: {args.loose}, minify: {args.minify}, file to interpret: {args.file[0]}, compiling? {args.compile}\n")
 
     return args
 
 
+def parse_batch_args() -> Namespace:
+    parser = ArgumentParser(prog="main.py batch", description="Run every case of a manifest, writing results as JSON lines")
+    parser.add_argument('-l', dest='loose', action="store_const", const=True, default=False,
+                        help="the programs may be in readable mode")
+    parser.add_argument('-O', dest='optimize', metavar="LEVEL", type=int, choices=sorted(OPTIMIZATION_LEVELS), default=0)
+    parser.add_argument('--engine', dest='engine', choices=ENGINES, default="threaded",
+                        help="how to execute the programs (default: threaded)")
+    parser.add_argument('--int-mode', dest='int_mode', choices=INT_MODES, default=None)
+    parser.add_argument('--no-cache', dest='no_cache', action="store_const", const=True, default=False,
+                        help="don't read or write the parsed program cache")
+    parser.add_argument('-j', '--jobs', dest='jobs', metavar="N", type=int, default=None,
+                        help="run cases on N processes (default: one per core)")
+    parser.add_argument('--steps', dest='steps', metavar="N", type=int, default=None,
+                        help="stop a program after N instructions")
+    parser.add_argument('--max-output', dest='max_output', metavar="BYTES", type=int, default=None,
+                        help="stop a program once it writes more than BYTES")
+    parser.add_argument('-o', dest='output', metavar="FILE", default=None,
+                        help="write the results to FILE instead of stdout")
+    parser.add_argument('manifest', metavar='manifest', type=str,
+                        help='JSON lines like {"program": "cat.ws", "input": "cat.in", "expected": "cat.out"}')
+    return parser.parse_args(sys.argv[2:])
+
+
+def batch() -> None:
+    args = parse_batch_args()
+    cases = read_manifest(args.manifest)
+    results = run_batch(cases, args.jobs, loose=args.loose, optimize=args.optimize, use_cache=not args.no_cache,
+                        engine=args.engine, int_mode=args.int_mode, limits=Limits(args.steps, args.max_output))
+    counts = dict.fromkeys(("pass", "fail", "ok", "error"), 0)
+    start = time.perf_counter()
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for result in results:
+            counts[result["status"]] += 1
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(", ".join(f"{count} {status}" for (status, count) in counts.items())
+          + f" of {len(cases)} cases in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+    if counts["fail"] or counts["error"]:
+        sys.exit(1)
+
+
 def main() -> None:
+    # batch is reserved as the first argument; a program of that name is run as ./batch
+    if sys.argv[1:2] == ["batch"]:
+        batch()
+        return
     args = parse_args()
 
     if len(args.file) > 0:
         filename = args.file[0]
-        with open(filename, "r", encoding="utf-8") as f:
-            contents = f.read()
+        # Sources are opened in binary and handed over as files, so they are read in chunks
         if args.minify:
-            minified = minify(contents, args.loose)
+            with open(filename, "rb") as source:
+                minified = minify(source, args.loose)
             out_filename = os.path.splitext(filename)[0] + ".min.ws"
             with open(out_filename, "w", encoding="utf-8") as f:
                 f.write(minified)
                 print("Wrote minified file to " + out_filename)
         elif args.compile:
             out_filename = os.path.splitext(filename)[0]
-            compile(contents, out_filename, args.loose, args.print, args.verbose)
+            with open(filename, "rb") as source:
+                compile(source, out_filename, args.loose, args.print, args.verbose, args.optimize)
         else:
-            execute(contents, args.loose, args.print, args.verbose, args.debug)
+            program = load_file(filename, args.loose, use_cache=not args.no_cache, jobs=args.jobs)
+            if args.optimize:
+                optimized = visit_optimize(program, args.optimize, args.int_mode)
+                print(f"Optimizer removed {len(program) - len(optimized)} of {len(program)} instructions\n")
+                program = optimized
+            profile = Profile() if args.profile else None
+            superinstructions = Profile.load(args.superinstructions) if args.superinstructions else None
+            heap = None
+            if args.heap_file:
+                heap = MappedHeap(args.heap_file, INT_MODES[args.int_mode][0] if args.int_mode else WORD_TYPE)
+            file_out = sys.stdout
+            if args.raw_output:
+                # Whatever was printed so far goes first
+                sys.stdout.flush()
+                file_out = sys.stdout.buffer
+            runtime = Runtime(heap=heap, file_out=file_out, int_mode=args.int_mode,
+                              output_buffer=args.output_buffer, raw_output=args.raw_output)
+            try:
+                run(program, args.print, args.verbose, args.debug, args.engine, runtime,
+                    profile=profile, superinstructions=superinstructions)
+            finally:
+                if heap is not None:
+                    heap.close()
+                if profile is not None:
+                    # Profiles accumulate over runs
+                    if os.path.exists(args.profile):
+                        profile.merge(Profile.load(args.profile))
+                    profile.save(args.profile)
 
     else:
         print("ERROR: no file")
@@ -0,0 +1,178 @@
+from whitespace.Program import Program
+from whitespace.Runner import load, load_file, run, ENGINES
+from whitespace.Jit import compile_blocks
+from whitespace.Fusion import out_strings
+from whitespace.Runtime import Runtime, Limits
+from whitespace.Visitor import visit_optimize
+from whitespace.Heap import Heap, MappedHeap
+from whitespace.Stack import Stack
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import BinaryIO, Iterable, Iterator, TextIO
+import io
+import os
+import threading
+
+# Runs queued per worker thread of CompiledProgram.map, ahead of the exit states taken
+MAP_WINDOW = 4
+
+
+class ExitState():
+    """How a run of a CompiledProgram ended.
+
+    error is the exception that stopped the program (eg. a StackError, or
+    LimitExceeded), or None if it ended normally. output is what it wrote,
+    if run without stdout. stack, heap and pc are as the program left them.
+    """
+    def __init__(self, runtime: Runtime, output: str | None, error: Exception | None):
+        self.stack: Stack | list[int] = runtime.stack
+        self.heap: Heap | MappedHeap = runtime.heap
+        self.pc = runtime.PC
+        self.output = output
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self) -> str:
+        ending = "ok" if self.error is None else f"failed with {self.error!r}"
+        return f"Exit state {ending} at PC {self.pc}, stack {self.stack}"
+
+
+class CompiledProgram():
+    """A program parsed once, with its labels resolved, to run any number of times.
+
+    Build one with fromSource or fromFile. Its instructions don't change once
+    built, so one CompiledProgram can be shared by any number of runs and
+    threads; each run gets a Runtime of its own. What does change is the code
+    compiled from it (the JIT's blocks, the coalesced constant strings), which
+    is added to the program's code_cache under a lock, by the first run (or
+    prepare) with each engine, int mode and step limit, and shared by the runs
+    after it.
+    """
+    def __init__(self, program: Program, int_mode: str | None = None, optimized: bool = False):
+        self._program = program
+        # The int mode runs use by default; an optimized program was folded for it, so runs may only use it
+        self.int_mode = int_mode
+        self.optimized = optimized
+        # The engines, int modes and step limits prepare has compiled the code for. Only added
+        # to under the lock; run reads it without, to skip the lock once its code is there
+        self._prepared: set[tuple[str, str | None, bool]] = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def fromSource(cls, source: str | bytes | BinaryIO, detect_readable: bool = False, optimize: int = 0,
+                   int_mode: str | None = None) -> "CompiledProgram":
+        """Parses source (see Runner.load), optimized at the level optimize (see -O) for
+        runs with the int mode int_mode"""
+        program = load(source, detect_readable)
+        return cls(visit_optimize(program, optimize, int_mode) if optimize else program, int_mode, optimize > 0)
+
+    @classmethod
+    def fromFile(cls, filename: str, detect_readable: bool = False, optimize: int = 0, use_cache: bool = True,
+                 int_mode: str | None = None) -> "CompiledProgram":
+        """Parses the file, or reuses its cached parse (see Runner.load_file)"""
+        program = load_file(filename, detect_readable, use_cache)
+        return cls(visit_optimize(program, optimize, int_mode) if optimize else program, int_mode, optimize > 0)
+
+    def run(self, stdin: str | bytes | TextIO | BinaryIO = "", stdout: TextIO | BinaryIO | None = None,
+            limits: Limits | None = None, engine: str = "threaded", int_mode: str | None = None) -> ExitState:
+        """Runs the program on stdin (a string, bytes or a file), returning how it ended.
+
+        What it writes goes to stdout if given (binary files get UTF-8), and
+        is otherwise returned in the exit state. Errors the program runs into
+        end up in the exit state rather than being raised. int_mode defaults to
+        the one the program was built for.
+        """
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine {engine}, expected one of {', '.join(ENGINES)}")
+        int_mode = self._int_mode(int_mode)
+        if isinstance(stdin, str):
+            stdin = io.StringIO(stdin)
+        elif isinstance(stdin, bytes):
+            stdin = io.BytesIO(stdin)
+        # A fast path: prepare checks again under the lock
+        if self._prepare_key(engine, int_mode, limits) not in self._prepared:
+            self.prepare(engine, int_mode, limits)
+        captured = io.BytesIO() if stdout is None else None
+        file_out = captured if stdout is None else stdout
+        runtime = Runtime(file_in=stdin, file_out=file_out, int_mode=int_mode, limits=limits,
+                          raw_output=not isinstance(file_out, io.TextIOBase))
+        error = None
+        try:
+            run(self._program, False, False, False, engine, runtime)
+        except Exception as e:
+            error = e
+        output = None if captured is None else captured.getvalue().decode("utf-8", "surrogatepass")
+        return ExitState(runtime, output, error)
+
+    def prepare(self, engine: str = "threaded", int_mode: str | None = None, limits: Limits | None = None) -> None:
+        """Compiles the code runs with the engine share, so runs starting at once don't all compile it"""
+        int_mode = self._int_mode(int_mode)
+        key = self._prepare_key(engine, int_mode, limits)
+        with self._lock:
+            if key in self._prepared:
+                return
+            if engine == "jit":
+                runtime = Runtime(file_in=io.StringIO(), file_out=io.StringIO(), int_mode=int_mode, limits=limits)
+                compile_blocks(self._program, runtime, cache_top=runtime.limits.steps is None)
+            else:
+                out_strings(self._program)
+            self._prepared.add(key)
+
+    @staticmethod
+    def _prepare_key(engine: str, int_mode: str | None, limits: Limits | None) -> tuple[str, str | None, bool]:
+        """What the code compiled for a run depends on: the JIT's on the int mode and whether
+        steps are limited, the other engines' (constant strings) on nothing"""
+        if engine == "jit":
+            return (engine, int_mode, limits is None or limits.steps is None)
+        return ("strings", None, False)
+
+    def map(self, inputs: Iterable[str | bytes | TextIO | BinaryIO], workers: int | None = None,
+            limits: Limits | None = None, engine: str = "threaded", int_mode: str | None = None) -> Iterator[ExitState]:
+        """Runs the program on each input on a pool of workers threads, giving the
+        exit states in the order of the inputs (see run; the output is returned).
+
+        Runs only share the program and its compiled code, so on a free-threaded
+        build of Python they run in parallel. Inputs are taken as workers free
+        up, so they may be endless; closing the iterator drops the runs queued.
+        """
+        # Compiled now, rather than when the first exit state is asked for
+        self.prepare(engine, int_mode, limits)
+        # As many workers as ThreadPoolExecutor has by default
+        workers = workers or min(32, (os.cpu_count() or 1) + 4)
+        return self._map(inputs, workers, limits, engine, int_mode)
+
+    def _map(self, inputs: Iterable[str | bytes | TextIO | BinaryIO], workers: int,
+             limits: Limits | None, engine: str, int_mode: str | None) -> Iterator[ExitState]:
+        pool = ThreadPoolExecutor(workers)
+        pending: deque[Future[ExitState]] = deque()
+        try:
+            for stdin in inputs:
+                pending.append(pool.submit(self.run, stdin, None, limits, engine, int_mode))
+                if len(pending) >= workers * MAP_WINDOW:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # Runs already started finish in the background
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _int_mode(self, int_mode: str | None) -> str | None:
+        """The int mode a run asking for int_mode uses"""
+        if int_mode is None:
+            return self.int_mode
+        if self.optimized and int_mode != self.int_mode:
+            raise ValueError(f"Program was optimized for int mode {self.int_mode or 'default'}, cannot run it with {int_mode}")
+        return int_mode
+
+    def __len__(self) -> int:
+        return len(self._program)
+
+    def __iter__(self) -> Iterator:
+        return iter(self._program)
+
+    def __repr__(self) -> str:
+        return f"Compiled program of {len(self)} commands, ready to run"
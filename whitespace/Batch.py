@@ -0,0 +1,110 @@
+from whitespace.Api import CompiledProgram
+from whitespace.Runtime import Limits
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Iterator
+import json
+import os
+import time
+
+# Programs this process has parsed, by path and how they were parsed, so each
+# worker parses a program once however many cases run it
+_programs: dict[tuple[str, bool, int, str | None], CompiledProgram] = {}
+
+
+class Case():
+    """A line of a manifest: the program to run, the file it reads (None for no input)
+    and the file holding the output expected (None to only run it)"""
+    def __init__(self, index: int, program: str, input: str | None = None, expected: str | None = None):
+        self.index = index
+        self.program = program
+        self.input = input
+        self.expected = expected
+
+    def __repr__(self) -> str:
+        return f"Case {self.index}: {self.program} on {self.input}, expecting {self.expected}"
+
+
+def read_manifest(path: str) -> list[Case]:
+    """The cases of a manifest: one JSON object per line, like
+    {"program": "cat.ws", "input": "cat.in", "expected": "cat.out"}, where input and
+    expected may be left out. Paths are relative to the manifest; blank lines and
+    lines starting with # are skipped."""
+    directory = os.path.dirname(os.path.abspath(path))
+    def resolve(name: str | None) -> str | None:
+        return None if name is None else os.path.join(directory, name)
+
+    cases = []
+    with open(path, encoding="utf-8") as f:
+        for (number, line) in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                entry = json.loads(line)
+                cases.append(Case(len(cases), resolve(entry["program"]), resolve(entry.get("input")), resolve(entry.get("expected"))))
+            except (ValueError, KeyError, TypeError) as e:
+                raise ValueError(f"{path}, line {number}: expected an object with a program, got {line!r}") from e
+    return cases
+
+
+def run_case(case: Case, loose: bool = False, optimize: int = 0, use_cache: bool = True, engine: str = "threaded",
+             int_mode: str | None = None, limits: Limits | None = None) -> dict:
+    """Runs a case, returning its result as a dict for JSON.
+
+    status is "pass" or "fail" if the output was checked, "ok" if not, and
+    "error" if the program failed or couldn't be run (error then says why).
+    The output is included when it didn't match, or wasn't checked.
+    """
+    result: dict = {"case": case.index, "program": case.program, "input": case.input}
+    parse_seconds = 0.0
+    run_seconds = 0.0
+    try:
+        key = (case.program, loose, optimize, int_mode)
+        program = _programs.get(key)
+        if program is None:
+            start = time.perf_counter()
+            program = _programs[key] = CompiledProgram.fromFile(case.program, loose, optimize, use_cache, int_mode)
+            parse_seconds = time.perf_counter() - start
+        stdin = b""
+        if case.input is not None:
+            with open(case.input, "rb") as f:
+                stdin = f.read()
+        start = time.perf_counter()
+        state = program.run(stdin, limits=limits, engine=engine, int_mode=int_mode)
+        run_seconds = time.perf_counter() - start
+        expected = None
+        if case.expected is not None:
+            with open(case.expected, encoding="utf-8", newline="") as f:
+                expected = f.read()
+    except Exception as e:
+        result.update(status="error", error=f"{type(e).__name__}: {e}",
+                      parse_seconds=parse_seconds, run_seconds=run_seconds)
+        return result
+
+    if state.error is not None:
+        status = "error"
+        result["error"] = f"{type(state.error).__name__}: {state.error}"
+    elif expected is None:
+        status = "ok"
+    else:
+        status = "pass" if state.output == expected else "fail"
+    result.update(status=status, pc=state.pc, parse_seconds=parse_seconds, run_seconds=run_seconds)
+    if status != "pass":
+        result["output"] = state.output
+    return result
+
+
+def run_batch(cases: list[Case], jobs: int | None = None, **options) -> Iterator[dict]:
+    """Runs the cases on jobs worker processes (all cores by default), giving their results
+    (see run_case, which takes the options) in the order of the cases, each as soon as it
+    and those before it are done"""
+    run = partial(run_case, **options)
+    if jobs == 1:
+        yield from map(run, cases)
+        return
+    with ProcessPoolExecutor(jobs) as pool:
+        # Chunks keep neighbouring cases, which often share a program, on one worker
+        chunk = max(1, min(64, len(cases) // (4 * (jobs or os.cpu_count() or 1))))
+        yield from pool.map(run, cases, chunksize=chunk)
@@ -0,0 +1,101 @@
+from whitespace.Constants_errors import CACHE_VERSION
+from whitespace.Program import Program
+
+from array import array
+import hashlib
+import marshal
+import os
+import struct
+import sys
+
+# Like __pycache__, caches live in a directory next to the source
+CACHE_DIR = "__wscache__"
+CACHE_SUFFIX = ".wsc"
+
+_MAGIC = b"WSC\0"
+# Magic, cache version, readable flag, key digest, number of instructions
+_HEADER = struct.Struct("<4sIB32sQ")
+# Typecode (or b"O" for a marshalled list) and size of one column
+_COLUMN = struct.Struct("<cQ")
+_COLUMNS = ("ops", "args", "labels", "targets", "lines")
+_HASH_CHUNK_SIZE = 1 << 20
+
+
+def cache_path(source_path: str) -> str:
+    directory, name = os.path.split(source_path)
+    return os.path.join(directory, CACHE_DIR, name + CACHE_SUFFIX)
+
+
+def source_key(source_path: str, detect_readable: bool) -> bytes:
+    """Hash of the source contents, readable flag, cache version and platform word sizes"""
+    digest = hashlib.sha256()
+    digest.update(f"{CACHE_VERSION} {detect_readable} {sys.byteorder} {array('l').itemsize}\n".encode())
+    with open(source_path, "rb") as f:
+        while True:
+            chunk = f.read(_HASH_CHUNK_SIZE)
+            if not chunk:
+                return digest.digest()
+            digest.update(chunk)
+
+
+def read(source_path: str, detect_readable: bool, key: bytes) -> Program | None:
+    """Returns the cached program for the source, or None if there is no valid cache"""
+    try:
+        with open(cache_path(source_path), "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+
+    try:
+        (magic, version, readable, digest, length) = _HEADER.unpack_from(data, 0)
+        if magic != _MAGIC or version != CACHE_VERSION or readable != detect_readable or digest != key:
+            return None
+
+        program = Program()
+        offset = _HEADER.size
+        for name in _COLUMNS:
+            (typecode, size) = _COLUMN.unpack_from(data, offset)
+            offset += _COLUMN.size
+            raw = data[offset:offset + size]
+            offset += size
+            if typecode == b"O":
+                column = marshal.loads(raw)
+            else:
+                column = array(typecode.decode())
+                column.frombytes(raw)
+            if len(column) != length:
+                return None
+            setattr(program, name, column)
+        # Only resolved programs without label errors are cached
+        program.resolved = True
+        return program
+    except (struct.error, ValueError, EOFError, TypeError):
+        # Truncated or otherwise corrupt
+        return None
+
+
+def write(source_path: str, detect_readable: bool, key: bytes, program: Program) -> None:
+    """Caches a parsed, label-resolved program. Failing to write the cache is not an error."""
+    path = cache_path(source_path)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(temp_path, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, CACHE_VERSION, detect_readable, key, len(program)))
+            for name in _COLUMNS:
+                column = getattr(program, name)
+                if isinstance(column, array):
+                    raw = column.tobytes()
+                    f.write(_COLUMN.pack(column.typecode.encode(), len(raw)))
+                else:
+                    # Columns holding numbers wider than 64 bits are lists
+                    raw = marshal.dumps(column)
+                    f.write(_COLUMN.pack(b"O", len(raw)))
+                f.write(raw)
+        # Replace in one step, so a concurrent reader never sees a partial file
+        os.replace(temp_path, path)
+    except OSError:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
@@ -0,0 +1,213 @@
+from whitespace.Program import Program, PUSH, DUPLICATE, SWAP, DISCARD, COPY, SLIDE
+from whitespace.Program import PLUS, MINUS, TIMES, INT_DIVIDE, MODULO
+from whitespace.Program import OUT_CHAR, OUT_NUM, READ_CHAR, READ_NUM
+from whitespace.Program import END, CALL_SUB, END_SUB, JUMP, JUMP_ZERO, JUMP_NEGATIVE
+from whitespace.Program import READ_HEAP, WRITE_HEAP
+
+from bisect import bisect_right
+from typing import Iterable, Iterator
+
+# Instructions that end a basic block
+TERMINATORS = frozenset((END, CALL_SUB, END_SUB, JUMP, JUMP_ZERO, JUMP_NEGATIVE))
+
+
+def find_leaders(program: Program, entries: Iterable[int] = ()) -> list[int]:
+    """PCs that start a basic block: the entries given, labelled instructions,
+    instructions after a branch, and calls (since returns go back to the call)"""
+    ops = program.ops
+    leaders = {0}
+    leaders.update(entries)
+    for (pc, label) in enumerate(program.labels):
+        if label != -1:
+            leaders.add(pc)
+    for (pc, op) in enumerate(ops):
+        if op in TERMINATORS:
+            leaders.add(pc + 1)
+            if op == CALL_SUB:
+                leaders.add(pc)
+    return sorted(pc for pc in leaders if 0 <= pc < len(ops))
+
+
+class BasicBlock():
+    """Instructions from start up to end, which only the first is jumped to and only the last branches.
+
+    Blocks are named by their start PC, in successors and predecessors too.
+    """
+    def __init__(self, start: int, end: int):
+        self.start = start
+        self.end = end
+        self.successors: list[int] = []
+        self.predecessors: list[int] = []
+
+    @property
+    def last(self) -> int:
+        return self.end - 1
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def __repr__(self) -> str:
+        return f"Block {self.start}-{self.end} to {self.successors}"
+
+
+class ControlFlowGraph():
+    """The basic blocks of a resolved program, with the edges between them.
+
+    entries are PCs execution may start at besides 0 (eg. return addresses on
+    a callstack). A call's successor is its target. Since returns go back to
+    the call (see CallSub), the successors of a block ending in a return are
+    the calls to every subroutine the block belongs to. A subroutine is the
+    code reachable from a call target (or 0, for the main program) without
+    following calls, and calls maps each one to the subroutines it calls.
+    """
+    def __init__(self, program: Program, entries: Iterable[int] = ()):
+        self.program = program
+        self.entries = sorted(set(entries) | {0})
+        self.leaders = find_leaders(program, self.entries)
+        ends = self.leaders[1:] + [len(program)]
+        self.blocks = {start: BasicBlock(start, end) for (start, end) in zip(self.leaders, ends)}
+
+        ops = program.ops
+        targets = program.targets
+        # Successors within a subroutine, and calls made from each block
+        local: dict[int, list[int]] = {}
+        call_sites: dict[int, int] = {}
+        for block in self.blocks.values():
+            op = ops[block.last]
+            target = targets[block.last]
+            if op == CALL_SUB:
+                successors = []
+                if target != -1:
+                    call_sites[block.start] = target
+            elif op == JUMP:
+                successors = [target]
+            elif op == JUMP_ZERO or op == JUMP_NEGATIVE:
+                successors = [target, block.end]
+            elif op == END or op == END_SUB:
+                successors = []
+            else:
+                successors = [block.end]
+            local[block.start] = [pc for pc in dict.fromkeys(successors) if pc in self.blocks]
+
+        # Entry of each subroutine, with the blocks it spans
+        self.subroutines: dict[int, set[int]] = {}
+        for entry in [0, *sorted(set(call_sites.values()))]:
+            if entry in self.blocks:
+                self.subroutines[entry] = _reach(local, [entry])
+        self.calls: dict[int, set[int]] = {
+            entry: {call_sites[pc] for pc in blocks if pc in call_sites}
+            for (entry, blocks) in self.subroutines.items()}
+
+        # The calls to each subroutine, and the subroutines each block belongs to,
+        # so returns find their successors without going through every call
+        callers: dict[int, list[int]] = {}
+        for (pc, target) in call_sites.items():
+            callers.setdefault(target, []).append(pc)
+        owners: dict[int, list[int]] = {}
+        for (entry, blocks) in self.subroutines.items():
+            for start in blocks:
+                owners.setdefault(start, []).append(entry)
+
+        for block in self.blocks.values():
+            successors = local[block.start]
+            if block.start in call_sites and call_sites[block.start] in self.blocks:
+                successors = [call_sites[block.start]]
+            elif ops[block.last] == END_SUB:
+                successors = sorted(pc for entry in owners.get(block.start, ()) for pc in callers.get(entry, ()))
+            block.successors = successors
+            for successor in successors:
+                self.blocks[successor].predecessors.append(block.start)
+
+    def block_at(self, pc: int) -> BasicBlock:
+        """The block containing pc"""
+        return self.blocks[self.leaders[bisect_right(self.leaders, pc) - 1]]
+
+    def reachable(self, starts: Iterable[int] | None = None) -> set[int]:
+        """Starts of the blocks reachable from the blocks starting at starts (the entries by default)"""
+        successors = {start: block.successors for (start, block) in self.blocks.items()}
+        return _reach(successors, self.entries if starts is None else starts)
+
+    def __iter__(self) -> Iterator[BasicBlock]:
+        return iter(self.blocks.values())
+
+    def __len__(self) -> int:
+        return len(self.blocks)
+
+
+def _reach(successors: dict[int, list[int]], starts: Iterable[int]) -> set[int]:
+    seen = {start for start in starts if start in successors}
+    work = list(seen)
+    while work:
+        for successor in successors[work.pop()]:
+            if successor not in seen:
+                seen.add(successor)
+                work.append(successor)
+    return seen
+
+
+def stack_effect(op: int, num: int = 0) -> tuple[int, int]:
+    """How many values an instruction needs on the stack, and how many it adds (negative if it removes them)"""
+    if op == PUSH:
+        return (0, 1)
+    elif op == DUPLICATE:
+        return (1, 1)
+    elif op == SWAP or op == WRITE_HEAP:
+        return (2, 0 if op == SWAP else -2)
+    elif op == COPY:
+        # Negative indexes count from the bottom, and fail by indexing past the top instead
+        return (max(num + 1, 0), 1)
+    elif op == SLIDE:
+        # Keeps the top value; a negative slide removes nothing and copies it
+        return (max(num + 2, 0), min(-num, 1))
+    elif op in (PLUS, MINUS, TIMES, INT_DIVIDE, MODULO):
+        return (2, -1)
+    elif op in (DISCARD, OUT_CHAR, OUT_NUM, READ_CHAR, READ_NUM):
+        return (1, -1)
+    elif op in (READ_HEAP, JUMP_ZERO, JUMP_NEGATIVE):
+        return (1, 0)
+    return (0, 0)
+
+
+def block_stack_effect(program: Program, block: BasicBlock) -> tuple[int, int]:
+    """How many values the block needs on the stack to run without an underflow, and how many it adds"""
+    ops = program.ops
+    args = program.args
+    need = 0
+    net = 0
+    for pc in range(block.start, block.end):
+        (instruction_need, instruction_net) = stack_effect(ops[pc], args[pc])
+        need = max(need, instruction_need - net)
+        net += instruction_net
+    return (need, net)
+
+
+# Lowering a block's depth more than this many times means it is in a loop
+# that shrinks the stack, and it goes straight to 0 instead
+_WIDEN_AFTER = 3
+
+def stack_depths(cfg: ControlFlowGraph, entry_depths: dict[int, int] | None = None) -> dict[int, int]:
+    """The smallest number of values on the stack whenever each reachable block starts.
+
+    entry_depths holds the depth at entries of the graph (0 for those not
+    given). A block that underflows stops the program, so the depth after a
+    block is at least what it needs, plus what it adds.
+    """
+    effects = {block.start: block_stack_effect(cfg.program, block) for block in cfg}
+    depths = {entry: (entry_depths or {}).get(entry, 0) for entry in cfg.entries if entry in cfg.blocks}
+    lowered = dict.fromkeys(depths, 0)
+    work = list(depths)
+    while work:
+        start = work.pop()
+        (need, net) = effects[start]
+        depth = max(depths[start], need) + net
+        for successor in cfg.blocks[start].successors:
+            if successor not in depths:
+                depths[successor] = depth
+                lowered[successor] = 0
+            elif depth < depths[successor]:
+                lowered[successor] += 1
+                depths[successor] = 0 if lowered[successor] > _WIDEN_AFTER else depth
+            else:
+                continue
+            work.append(successor)
+    return depths
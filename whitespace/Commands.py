@@ -1,5 +1,6 @@
 from whitespace.Constants_errors import StackError, CannotFindJumpTarget
-from whitespace.Runtime import Runtime
+from whitespace.Runtime import Runtime, wrap
+from whitespace.Stack import Stack, stack_slide, stack_copy
 
 from abc import ABC, abstractmethod
 
@@ -80,7 +81,10 @@ class Push(Command):
         self.num = num
     
     def execute(self, runtime: Runtime) -> int:
-        runtime.stack.append(self.num)
+        try:
+            runtime.stack.append(self.num)
+        except OverflowError as e:
+            runtime.push_wrapped(self.num, e)
         return runtime.PC + 1
     
     def __eq__(self, value: object) -> bool:
@@ -176,9 +180,11 @@ class Copy(Command):
         self.num = num
     
     def execute(self, runtime: Runtime) -> int:
-        if len(runtime.stack) <= self.num:
-            raise StackError(f"Cannot copy {self.num}th num from stack, it is only {len(runtime.stack)} long")
-        runtime.stack.append(runtime.stack[-self.num - 1])
+        stack = runtime.stack
+        if isinstance(stack, Stack):
+            stack.copy(self.num)
+        else:
+            stack_copy(stack, self.num)
 
         return runtime.PC + 1
 
@@ -201,13 +207,11 @@ class Slide(Command):
         self.num = num
     
     def execute(self, runtime: Runtime) -> int:
-        # When slide n off the stack, need n+1 to be there since we keep the top element
-        if len(runtime.stack) <= self.num + 1:
-            raise StackError(f"Cannot slide {self.num} from stack, it is only {len(runtime.stack)} long")
-        old_stack = runtime.stack
-        runtime.stack = old_stack[0:len(runtime.stack) - self.num - 1]
-        # Add back last element
-        runtime.stack.append(old_stack[-1])
+        stack = runtime.stack
+        if isinstance(stack, Stack):
+            stack.slide(self.num)
+        else:
+            stack_slide(stack, self.num)
 
         return runtime.PC + 1
 
@@ -238,7 +242,10 @@ class Plus(Command):
         if len(runtime.stack) < 2:
             raise StackError("Need two elements to add")
         second, first = (runtime.stack.pop(), runtime.stack.pop())
-        runtime.stack.append(first + second)
+        try:
+            runtime.stack.append(first + second)
+        except OverflowError as e:
+            runtime.push_wrapped(first + second, e)
 
         return runtime.PC + 1
 
@@ -262,7 +269,10 @@ class Minus(Command):
         if len(runtime.stack) < 2:
             raise StackError("Need two elements to subtract")
         second, first = (runtime.stack.pop(), runtime.stack.pop())
-        runtime.stack.append(first - second)
+        try:
+            runtime.stack.append(first - second)
+        except OverflowError as e:
+            runtime.push_wrapped(first - second, e)
 
         return runtime.PC + 1
 
@@ -286,7 +296,10 @@ class Times(Command):
         if len(runtime.stack) < 2:
             raise StackError("Need two elements to multiply")
         second, first = (runtime.stack.pop(), runtime.stack.pop())
-        runtime.stack.append(first * second)
+        try:
+            runtime.stack.append(first * second)
+        except OverflowError as e:
+            runtime.push_wrapped(first * second, e)
 
         return runtime.PC + 1
 
@@ -311,7 +324,10 @@ class IntDivide(Command):
         if len(runtime.stack) < 2:
             raise StackError("Need two elements to int divide")
         second, first = (runtime.stack.pop(), runtime.stack.pop())
-        runtime.stack.append(first // second)
+        try:
+            runtime.stack.append(first // second)
+        except OverflowError as e:
+            runtime.push_wrapped(first // second, e)
 
         return runtime.PC + 1
 
@@ -336,7 +352,10 @@ class Modulo(Command):
         if len(runtime.stack) < 2:
             raise StackError("Need two elements to modulo")
         second, first = (runtime.stack.pop(), runtime.stack.pop())
-        runtime.stack.append(first % second)
+        try:
+            runtime.stack.append(first % second)
+        except OverflowError as e:
+            runtime.push_wrapped(first % second, e)
 
         return runtime.PC + 1
 
@@ -364,7 +383,7 @@ class OutChar(Command):
         if len(runtime.stack) == 0:
             raise StackError("Empty runtime.stack")
 
-        print(chr(runtime.stack.pop()), file=runtime.file_out, end="")
+        runtime.output.write_char(runtime.stack.pop())
 
         return runtime.PC + 1
     
@@ -389,7 +408,7 @@ class OutNum(Command):
         if len(runtime.stack) == 0:
             raise StackError("Empty runtime.stack")
 
-        print(runtime.stack.pop(), file=runtime.file_out, end="")
+        runtime.output.write_num(runtime.stack.pop())
 
         return runtime.PC + 1
     
@@ -414,13 +433,8 @@ class ReadChar(Command):
         if len(runtime.stack) == 0:
             raise StackError("Empty runtime.stack")
         
-        # Read one char
-        read_result = runtime.file_in.read(1)
-        # If a Ctrl-D is input, that should be interpreted as a null
-        if len(read_result) == 0:
-            read_byte = 0
-        else:
-            read_byte = ord(read_result[0])
+        # Read one char; if a Ctrl-D is input, that should be interpreted as a null
+        read_byte = runtime.input.read_char()
         runtime.heap.write(runtime.stack.pop(), read_byte)
 
         return runtime.PC + 1
@@ -445,12 +459,11 @@ class ReadNum(Command):
     def execute(self, runtime: Runtime) -> int:
         if len(runtime.stack) == 0:
             raise StackError("Empty runtime.stack")
-        try:
-            line = runtime.file_in.readline()
-            read_int = int(line)
-        except EOFError:
-            read_int = 0
-            
+        # 0 at the end of input, like ReadChar
+        read_int = runtime.input.read_num()
+        if runtime.wrap_bits is not None:
+            read_int = wrap(read_int, runtime.wrap_bits)
+
         runtime.heap.write(runtime.stack.pop(), read_int)
 
         return runtime.PC + 1
@@ -476,6 +489,7 @@ class End(Command):
         super().__init__(line, label)
 
     def execute(self, runtime: Runtime) -> int:
+        runtime.output.flush()
         return -1
 
     def __eq__(self, value: object) -> bool:
@@ -1,12 +1,17 @@
 from whitespace.Parser import Parser
 from whitespace.Runtime import Runtime
-from whitespace.Visitor import visit_flow_control, visit_asm_generation
+from whitespace.Visitor import visit_flow_control, visit_optimize, visit_asm_generation
 import subprocess
+from typing import BinaryIO
 
-def generate_asm(source: str, detect_readable: bool, print_out: bool, verbose: bool) -> str:
+def generate_asm(source: str | bytes | BinaryIO, detect_readable: bool, print_out: bool, verbose: bool, optimize: int = 0) -> str:
     p = Parser(source, detect_readable)
     program = p.allCommands()
     visit_flow_control(program)
+    if optimize:
+        optimized = visit_optimize(program, optimize)
+        print(f"Optimizer removed {len(program) - len(optimized)} of {len(program)} instructions")
+        program = optimized
 
     if print_out:
         print("Program:")
@@ -16,11 +21,11 @@ def generate_asm(source: str, detect_readable: bool, print_out: bool, verbose: b
     return visit_asm_generation(program)
 
 # NOTE: assumes executable_name does not end with an extension
-def compile(file_contents: str, executable_name: str, detect_readable: bool, print_out: bool, verbose: bool) -> None:
+def compile(file_contents: str | bytes | BinaryIO, executable_name: str, detect_readable: bool, print_out: bool, verbose: bool, optimize: int = 0) -> None:
     assembly_filename = executable_name + ".s"
     object_filename = executable_name + ".o"
 
-    assembly = generate_asm(file_contents, detect_readable, print_out, verbose)
+    assembly = generate_asm(file_contents, detect_readable, print_out, verbose, optimize)
     with open(assembly_filename, "w", encoding="utf-8") as f:
         # Write assembly so it can be compiled and linked
         f.write(assembly)
@@ -1,5 +1,8 @@
 WORD_TYPE = 'l'
 
+# Version of the cached program format; bump when parsing or Program changes
+CACHE_VERSION = 1
+
 
 class HeapError(Exception):
     pass
@@ -12,3 +15,6 @@ class CannotFindJumpTarget(Exception):
 
 class DuplicateLabels(Exception):
     pass
+
+class LimitExceeded(Exception):
+    pass
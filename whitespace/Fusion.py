@@ -0,0 +1,187 @@
+from whitespace.Program import Program, COMMAND_TYPES
+from whitespace.Cfg import TERMINATORS
+from whitespace.Commands import Command
+from whitespace.Runtime import Runtime
+from whitespace.Jit import generate_function, exec_source
+from whitespace.Visitor import find_constant_strings
+
+from collections import Counter
+from typing import Callable, Sequence
+import json
+
+# Longest sequence of instructions fused into one
+MAX_LENGTH = 4
+# How many of the most profitable sequences in a profile get fused
+MAX_SEQUENCES = 16
+PROFILE_VERSION = 1
+
+_OPCODES_BY_NAME = {cls.__name__: op for (op, cls) in enumerate(COMMAND_TYPES)}
+
+
+def fusable_length(program: Program, pc: int, max_length: int = MAX_LENGTH) -> int:
+    """Length of the longest sequence starting at pc that can run as one instruction.
+
+    Nothing may jump into the sequence, so only its first instruction may have
+    a label, and only its last may branch.
+    """
+    ops = program.ops
+    labels = program.labels
+    end = min(pc + max_length, len(ops))
+    length = 1
+    while pc + length < end and labels[pc + length] == -1 and ops[pc + length - 1] not in TERMINATORS:
+        length += 1
+    return length
+
+
+class Profile():
+    """How many times each sequence of commands ran, keyed by command names (eg ("Push", "Plus"))"""
+    def __init__(self, counts: dict[tuple[str, ...], int] | None = None):
+        self.counts: Counter[tuple[str, ...]] = Counter(counts or {})
+
+    def record(self, program: Program, executed: Sequence[int]) -> None:
+        """Adds a run of the program, in which the instruction at each PC ran executed[PC] times"""
+        ops = program.ops
+        for (pc, times) in enumerate(executed):
+            if times:
+                # Every instruction of a fusable sequence runs whenever the first does
+                names = tuple(COMMAND_TYPES[op].__name__ for op in ops[pc:pc + fusable_length(program, pc)])
+                for length in range(2, len(names) + 1):
+                    self.counts[names[:length]] += times
+
+    def merge(self, other: "Profile") -> None:
+        self.counts.update(other.counts)
+
+    def best(self, count: int = MAX_SEQUENCES) -> list[tuple[str, ...]]:
+        """The sequences that would save the most dispatches if fused"""
+        ranked = sorted(self.counts.items(), key=lambda item: (-item[1] * (len(item[0]) - 1), item[0]))
+        return [names for (names, _) in ranked[:count]]
+
+    def save(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"version": PROFILE_VERSION,
+                       "sequences": {" ".join(names): times for (names, times) in self.counts.most_common()}}, f, indent=1)
+
+    @classmethod
+    def load(cls, path: str) -> "Profile":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != PROFILE_VERSION:
+            raise ValueError(f"{path} is not a version {PROFILE_VERSION} profile")
+        return cls({tuple(names.split()): times for (names, times) in data["sequences"].items()})
+
+
+class Fused(Command):
+    """Superinstruction running a sequence of commands with one dispatch.
+
+    Only replaces the first command; the others keep their PCs, so returns
+    into the middle of the sequence still work. bind(runtime) gives a function
+    running the sequence on that runtime, for engines whose stack never changes.
+    """
+    def __init__(self, commands: list[Command], function: Callable[[Runtime], int], bind: Callable[[Runtime], Callable[[], int]]):
+        super().__init__(commands[0].line, commands[0].label)
+        self.commands = commands
+        self.function = function
+        self.bind = bind
+
+    def execute(self, runtime: Runtime) -> int:
+        return self.function(runtime)
+
+    def __eq__(self, value: object) -> bool:
+        if type(value) == Fused:
+            return self.commands == value.commands
+        else:
+            return False
+
+    def __repr__(self) -> str:
+        return "Fused (" + "; ".join(map(str, self.commands)) + ")"
+
+    def minified(self) -> str:
+        return "".join(command.minified() for command in self.commands)
+
+
+class OutString(Command):
+    """Superinstruction writing a constant string: a run of Push c; OutChar (see
+    Visitor.find_constant_strings) as one write, rather than two dispatches per character.
+
+    Like Fused, it only replaces the first command, and bind(runtime) gives a
+    function running it on that runtime. end is the PC after the run.
+    """
+    def __init__(self, commands: list[Command], text: str, end: int):
+        super().__init__(commands[0].line, commands[0].label)
+        self.commands = commands
+        self.text = text
+        self.end = end
+
+    def execute(self, runtime: Runtime) -> int:
+        runtime.output.write(self.text)
+        return self.end
+
+    def bind(self, runtime: Runtime) -> Callable[[], int]:
+        write = runtime.output.write
+        text = self.text
+        nxt = self.end
+        def out_string() -> int:
+            write(text)
+            return nxt
+        return out_string
+
+    def __eq__(self, value: object) -> bool:
+        if type(value) == OutString:
+            return self.commands == value.commands
+        else:
+            return False
+
+    def __repr__(self) -> str:
+        return f"OutString {self.text!r} (" + "; ".join(map(str, self.commands)) + ")"
+
+    def minified(self) -> str:
+        return "".join(command.minified() for command in self.commands)
+
+
+def out_strings(program: Program) -> dict[int, OutString]:
+    """The program's constant strings (see Visitor.find_constant_strings) as commands, by the PC of their first instruction"""
+    strings = program.code_cache.get("strings")
+    if strings is None:
+        strings = program.code_cache["strings"] = {
+            pc: OutString([program[i] for i in range(pc, end)], text, end)
+            for (pc, (end, text)) in find_constant_strings(program).items()}
+    return strings
+
+
+def fuse(program: Program, profile: Profile, word_range: tuple[int, int] | None, count: int = MAX_SEQUENCES,
+         wraps: bool = False) -> dict[int, Fused]:
+    """Fuses the most profitable sequences of the profile wherever they appear in the program.
+
+    Returns the fused commands by the PC of their first instruction. Like the
+    JIT, the code depends on the range of values the stack holds (see
+    Jit.stack_range), and whether results outside it wrap around.
+    """
+    scores = {}
+    for names in profile.best(count):
+        if all(name in _OPCODES_BY_NAME for name in names):
+            scores[tuple(_OPCODES_BY_NAME[name] for name in names)] = profile.counts[names] * (len(names) - 1)
+
+    # Fused commands take the runtime as an argument, so they are reused across runs
+    key = ("fused", tuple(sorted(scores.items())), word_range, wraps)
+    fused = program.code_cache.get(key)
+    if fused is None:
+        sites = []
+        ops = program.ops
+        pc = 0
+        while pc < len(ops):
+            candidates = [tuple(ops[pc:pc + length]) for length in range(2, fusable_length(program, pc) + 1)]
+            candidates = [sequence for sequence in candidates if sequence in scores]
+            if candidates:
+                sequence = max(candidates, key=lambda sequence: scores[sequence])
+                sites.append((pc, len(sequence)))
+                pc += len(sequence)
+            else:
+                pc += 1
+        source = "".join(generate_function(program, pc, pc + length, word_range, f"fused_{pc}", wraps=wraps)
+                         + generate_function(program, pc, pc + length, word_range, f"bind_{pc}", bound=True, wraps=wraps)
+                         for (pc, length) in sites)
+        namespace = exec_source(compile(source, "<whitespace superinstructions>", "exec"))
+        fused = program.code_cache[key] = {
+            pc: Fused([program[i] for i in range(pc, pc + length)], namespace[f"fused_{pc}"], namespace[f"bind_{pc}"])
+            for (pc, length) in sites}
+    return fused
@@ -1,25 +1,147 @@
 from whitespace.Constants_errors import WORD_TYPE, HeapError
 from array import array
+import mmap
+import tempfile
+
+# Cells in each page of the sparse part of the heap
+PAGE_SIZE = 1024
+# Largest the dense part of the heap grows to
+MAX_DENSE = 1 << 22
 
 class Heap:
-    def __init__(self):
-        self.arr = array(WORD_TYPE, [0, 0, 0, 0])
+    """Cells indexed by address, which read as 0 until written.
+
+    Cells from address 0 up to len(arr) are stored densely in arr, which
+    doubles to fit writes just past its end. Writes further out (programs
+    using addresses like 10^9 as keys) go to pages of PAGE_SIZE cells, kept
+    in a dict by page number, so memory grows with what is written rather
+    than with the largest address. Reads never allocate, and negative
+    addresses raise HeapError.
+    """
+    # Cells are an array of typecode, or a list (holding any int) if it is None
+    def __init__(self, typecode: str | None = WORD_TYPE):
+        self.typecode = typecode
+        self.arr: array | list[int] = self._cells(4)
+        self.pages: dict[int, array | list[int]] = {}
+
+    def _cells(self, count: int) -> array | list[int]:
+        if self.typecode is None:
+            return [0] * count
+        return array(self.typecode, bytes(array(self.typecode).itemsize * count))
 
     def read(self, address: int) -> int:
-        if address < len(self.arr):
-            return self.arr[address]
-        else:
-            # Double size, and recurse
-            self.arr.extend([0] * len(self.arr))
-            return self.read(address)
-    
+        arr = self.arr
+        if 0 <= address < len(arr):
+            return arr[address]
+        if address < 0:
+            raise HeapError(f"Cannot read from negative heap address {address}")
+        page = self.pages.get(address // PAGE_SIZE)
+        return 0 if page is None else page[address % PAGE_SIZE]
+
     def write(self, address: int, value: int) -> None:
-        if address < len(self.arr):
-            self.arr[address] = value
+        arr = self.arr
+        if 0 <= address < len(arr):
+            arr[address] = value
+        elif address < 0:
+            raise HeapError(f"Cannot write to negative heap address {address}")
+        elif address < 2 * len(arr) <= MAX_DENSE:
+            # Filling the heap from the bottom up, so stay dense
+            self._grow(2 * len(arr))
+            arr[address] = value
         else:
-            # Double size, and recurse
-            self.arr.extend([0] * len(self.arr))
-            self.write(address, value)
-    
+            number = address // PAGE_SIZE
+            page = self.pages.get(number)
+            if page is None:
+                page = self.pages[number] = self._cells(PAGE_SIZE)
+            page[address % PAGE_SIZE] = value
+
+    # Grows the dense part to size cells, moving what pages hold below size into it
+    def _grow(self, size: int) -> None:
+        old = len(self.arr)
+        self.arr.extend(self._cells(size - old))
+        for number in [number for number in self.pages if number * PAGE_SIZE < size]:
+            page = self.pages[number]
+            start = number * PAGE_SIZE
+            low = max(start, old)
+            high = min(start + PAGE_SIZE, size)
+            self.arr[low:high] = page[low - start:high - start]
+            if start + PAGE_SIZE <= size:
+                del self.pages[number]
+
+    def __repr__(self) -> str:
+        return f"Heap {self.arr} and {len(self.pages)} pages"
+
+
+class MappedHeap:
+    """Heap whose cells live in a memory-mapped file, for heaps of hundreds of millions of cells.
+
+    The file is sparse, so only the pages the program touches take memory or
+    disk. cells is a memoryview of the mapping cast to typecode (which must be
+    a fixed-size word, so not bigint's None). The mapping doubles to fit
+    writes past its end. If path is given the file is kept, holding the heap
+    image once the heap is closed; otherwise it is a temporary file. Pass it
+    to Runtime(heap=...).
+    """
+    def __init__(self, path: str | None = None, typecode: str | None = WORD_TYPE, capacity: int = 1 << 20):
+        if typecode is None:
+            raise ValueError("A mapped heap needs fixed-size cells")
+        self.typecode = typecode
+        self.path = path
+        self.file = open(path, "w+b") if path is not None else tempfile.TemporaryFile()
+        self._map(capacity)
+
+    def _map(self, capacity: int) -> None:
+        size = capacity * array(self.typecode).itemsize
+        self.file.truncate(size)
+        self.mmap = mmap.mmap(self.file.fileno(), size)
+        self.cells = memoryview(self.mmap).cast(self.typecode)
+
+    def read(self, address: int) -> int:
+        cells = self.cells
+        if 0 <= address < len(cells):
+            return cells[address]
+        if address < 0:
+            raise HeapError(f"Cannot read from negative heap address {address}")
+        return 0
+
+    def write(self, address: int, value: int) -> None:
+        cells = self.cells
+        if not 0 <= address < len(cells):
+            if address < 0:
+                raise HeapError(f"Cannot write to negative heap address {address}")
+            capacity = len(cells)
+            while capacity <= address:
+                capacity *= 2
+            try:
+                self.file.truncate(capacity * cells.itemsize)
+            except (OSError, OverflowError):
+                raise HeapError(f"Cannot map heap address {address}") from None
+            self._unmap()
+            self._map(capacity)
+            cells = self.cells
+        try:
+            cells[address] = value
+        except ValueError:
+            # Like an array heap would
+            raise OverflowError(f"{value} does not fit in a heap cell") from None
+
+    def _unmap(self) -> None:
+        self.cells.release()
+        self.mmap.close()
+
+    def close(self) -> None:
+        """Writes the heap out to the file and closes it"""
+        if not self.mmap.closed:
+            self.mmap.flush()
+            self._unmap()
+            self.file.close()
+
+    def __enter__(self) -> "MappedHeap":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
     def __repr__(self) -> str:
-        return f"Heap {self.arr}, max addr is {self.max_written}"
\ No newline at end of file
+        return f"Heap of {len(self.cells)} cells mapped from {self.path or 'a temporary file'}"
+
@@ -0,0 +1,103 @@
+from whitespace.Output import Output
+
+from typing import BinaryIO, TextIO
+import io
+
+# Bytes of input asked for at a time
+INPUT_BUFFER_SIZE = 1 << 16
+
+
+class Input():
+    """What the program reads, taken from file a block at a time and served from a buffer.
+
+    Input is read as UTF-8 bytes: a text file with a binary buffer underneath
+    (like sys.stdin) is read through the buffer, skipping the text layer, and
+    blocks read from other text files are encoded. Blocks are read with read1
+    where the file has it, which returns what is available rather than
+    waiting for a whole block, so interactive programs still see each line
+    as it is entered. tie is flushed before each block is read, so prompts
+    show up before the program waits for input, and, when file is a terminal,
+    before every read, as a block may hold lines typed ahead of their prompt.
+    """
+    def __init__(self, file: TextIO | BinaryIO, size: int = INPUT_BUFFER_SIZE, tie: Output | None = None):
+        self.file = file
+        self.size = size
+        self.tie = tie
+        self.flush_each = tie is not None and hasattr(file, "isatty") and file.isatty()
+        if isinstance(file, io.TextIOBase) and hasattr(file, "buffer"):
+            file = file.buffer
+        self.read_block = getattr(file, "read1", file.read)
+        self.buffer = b""
+        self.pos = 0
+
+    def read_char(self) -> int:
+        """The next character, or 0 at the end of input"""
+        if self.flush_each:
+            self.tie.flush()
+        buffer = self.buffer
+        pos = self.pos
+        if pos < len(buffer):
+            byte = buffer[pos]
+            if byte < 0x80:
+                self.pos = pos + 1
+                return byte
+        if not self._fill(1):
+            return 0
+        # The lead byte of a UTF-8 sequence gives its length
+        byte = self.buffer[self.pos]
+        length = 1 if byte < 0xC0 else 2 if byte < 0xE0 else 3 if byte < 0xF0 else 4
+        self._fill(length)
+        # Raises UnicodeDecodeError for input that isn't UTF-8, like the text layer
+        char = self.buffer[self.pos:self.pos + length].decode("utf-8")
+        self.pos += length
+        return ord(char)
+
+    def read_num(self) -> int:
+        """The next line as a number, or 0 at the end of input"""
+        line = self._read_line()
+        if not line:
+            return 0
+        return int(line)
+
+    def read_line(self) -> str:
+        """The next line, without its newline, from the same buffer the program reads.
+
+        Raises EOFError at the end of input, like input(). The debugger reads
+        its commands with this, so it doesn't miss lines already buffered, nor
+        take the program's input from under the buffer.
+        """
+        line = self._read_line()
+        if not line:
+            raise EOFError("End of input")
+        return line.decode("utf-8").removesuffix("\n")
+
+    # The next line as bytes, with its newline if it has one (b"" at the end of input)
+    def _read_line(self) -> bytes:
+        if self.flush_each:
+            self.tie.flush()
+        end = self.buffer.find(b"\n", self.pos)
+        while end == -1:
+            searched = len(self.buffer) - self.pos
+            if not self._fill(searched + 1):
+                break
+            end = self.buffer.find(b"\n", self.pos + searched)
+        line = self.buffer[self.pos:] if end == -1 else self.buffer[self.pos:end + 1]
+        self.pos += len(line)
+        return line
+
+    # Reads blocks until count bytes are buffered, returning False if the input ends first
+    def _fill(self, count: int) -> bool:
+        while len(self.buffer) - self.pos < count:
+            if self.tie is not None:
+                self.tie.flush()
+            block = self.read_block(self.size)
+            if not block:
+                return False
+            if isinstance(block, str):
+                block = block.encode("utf-8", "surrogatepass")
+            self.buffer = self.buffer[self.pos:] + block
+            self.pos = 0
+        return True
+
+    def __repr__(self) -> str:
+        return f"Input of {len(self.buffer) - self.pos} bytes from {self.file}"
@@ -0,0 +1,541 @@
+from whitespace.Program import Program, PUSH, DUPLICATE, SWAP, DISCARD, COPY, SLIDE
+from whitespace.Program import PLUS, MINUS, TIMES, INT_DIVIDE, MODULO
+from whitespace.Program import OUT_CHAR, OUT_NUM, READ_CHAR, READ_NUM
+from whitespace.Program import END, CALL_SUB, END_SUB, JUMP, JUMP_ZERO, JUMP_NEGATIVE
+from whitespace.Program import READ_HEAP, WRITE_HEAP
+from whitespace.Runtime import Runtime, PC_RUNNING
+from whitespace.Cfg import ControlFlowGraph, TERMINATORS, stack_depths
+from whitespace.Visitor import find_constant_strings
+from whitespace.Constants_errors import StackError, CannotFindJumpTarget, LimitExceeded
+
+from array import array
+from types import CodeType
+from typing import Callable
+import re
+
+# A compiled basic block: runs it and returns the next PC (-1 to end)
+Block = Callable[[], int]
+
+# Arithmetic opcodes, with their Python operator and the error for a short stack
+_ARITHMETIC = {
+    PLUS: ("+", "Need two elements to add"),
+    MINUS: ("-", "Need two elements to subtract"),
+    TIMES: ("*", "Need two elements to multiply"),
+    INT_DIVIDE: ("//", "Need two elements to int divide"),
+    MODULO: ("%", "Need two elements to modulo"),
+}
+
+def stack_range(stack: array | list[int]) -> tuple[int, int] | None:
+    """Range of the values an array stack can hold, or None for a list"""
+    if isinstance(stack, array):
+        bits = stack.itemsize * 8
+        return (-(1 << (bits - 1)), (1 << (bits - 1)) - 1)
+    return None
+
+
+def generate_source(cfg: ControlFlowGraph, word_range: tuple[int, int] | None = None,
+                    depths: dict[int, int] | None = None, cache_top: bool = True, wraps: bool = False) -> str:
+    """Python source of a module defining each block as a function, and compiled, the functions by PC.
+
+    The blocks are flat, module-level functions rather than closures, so
+    compiling them takes time linear in their number. They find the
+    runtime, its stack and IO in the module's globals, which compile_blocks
+    fills in for each run (see _bindings).
+
+    Values pushed within a block live in local variables, and only reach the
+    stack at the end of the block (or before anything fails, so a failing
+    program leaves the stack as Command.execute would). word_range is the range
+    of values the stack can hold, if it is an array; if wraps, results outside
+    it wrap around (see Runtime.INT_MODES) instead of raising OverflowError.
+
+    depths holds the number of values each block can count on finding on the
+    stack (see Cfg.stack_depths). A block needing more checks the stack once
+    on entry, running a copy checking each instruction if that fails, so the
+    error still comes from the instruction that underflows.
+
+    If cache_top, blocks that only jump between each other (typically loops)
+    keep the top of the stack in the global tos, shared by all blocks,
+    instead of pushing it at the end of one block and popping it in the next.
+    See cached_blocks for which blocks start that way.
+    """
+    depths = depths or {}
+    cached = cached_blocks(cfg, depths) if cache_top else set()
+    source = []
+    if cached:
+        source.append("tos = 0")
+    for block in cfg:
+        start = block.start
+        top_cached = start in cached
+        keep_top = _keeps_top(cfg, block, cached, depths)
+        # The top of the stack isn't on it when it is cached
+        depth = max(depths.get(start, 0) - top_cached, 0)
+        checked = _BlockCompiler(cfg.program, start, block.end, word_range, " " * 4, depth, top_cached, keep_top, wraps)
+        lines = checked.compile()
+        if checked.required > depth:
+            source.append(f"def checked_{start}():")
+            if top_cached or keep_top:
+                source.append("    global tos")
+            source.extend(lines)
+            source.append(f"def block_{start}():")
+            if top_cached or keep_top:
+                source.append("    global tos")
+            source.append(f"    if len(stack) < {checked.required}:")
+            source.append(f"        return checked_{start}()")
+            lines = _BlockCompiler(cfg.program, start, block.end, word_range, " " * 4, checked.required,
+                                   top_cached, keep_top, wraps).compile()
+        else:
+            source.append(f"def block_{start}():")
+            if top_cached or keep_top:
+                source.append("    global tos")
+        source.extend(lines)
+    source.append("compiled = {" + ", ".join(f"{block.start}: block_{block.start}" for block in cfg) + "}")
+    return "\n".join(source) + "\n"
+
+
+def cached_blocks(cfg: ControlFlowGraph, depths: dict[int, int]) -> set[int]:
+    """Starts of the blocks entered with the top of the stack in tos rather than on the stack.
+
+    Those are blocks always finding a value on the stack, reached only by
+    jumping or falling through from blocks that end by going to one of them.
+    Entries of the graph and calls (which returns go back to) never are, so
+    control only ever reaches them from a block that cached the top.
+    """
+    cached = {start for (start, depth) in depths.items()
+              if depth >= 1 and start not in cfg.entries and cfg.program.ops[start] != CALL_SUB}
+    changed = True
+    while changed:
+        changed = False
+        for start in list(cached):
+            if not all(_keeps_top(cfg, cfg.blocks[pc], cached, depths) for pc in cfg.blocks[start].predecessors):
+                cached.discard(start)
+                changed = True
+    return cached
+
+
+# Whether a block ends with the top of the stack in tos: it must go on to a block in cached whichever way it goes
+def _keeps_top(cfg: ControlFlowGraph, block, cached: set[int], depths: dict[int, int]) -> bool:
+    if block.start not in depths:
+        return False
+    op = cfg.program.ops[block.last]
+    target = cfg.program.targets[block.last]
+    if op == JUMP:
+        successors = [target]
+    elif op == JUMP_ZERO or op == JUMP_NEGATIVE:
+        successors = [target, block.end]
+    elif op in TERMINATORS:
+        return False
+    else:
+        successors = [block.end]
+    return all(pc in cached for pc in successors)
+
+
+# The globals blocks compiled for a run look up: the runtime, its stack and what they call
+def _bindings(runtime: Runtime) -> dict:
+    stack = runtime.stack
+    return {
+        "runtime": runtime, "stack": stack, "append": stack.append, "pop": stack.pop, "extend": stack.extend,
+        "heap_read": runtime.heap.read, "heap_write": runtime.heap.write,
+        "write_char": runtime.output.write_char, "write_num": runtime.output.write_num, "write": runtime.output.write,
+        "read_char": runtime.input.read_char, "read_num": runtime.input.read_num,
+        "callstack_append": runtime.callstack.append, "callstack_pop": runtime.callstack.pop,
+    }
+
+
+# What the code of a block may call, and how to get it from the runtime
+_BINDINGS = {
+    "append": "stack.append",
+    "pop": "stack.pop",
+    "extend": "stack.extend",
+    "heap_read": "runtime.heap.read",
+    "heap_write": "runtime.heap.write",
+    "write_char": "runtime.output.write_char",
+    "write_num": "runtime.output.write_num",
+    "write": "runtime.output.write",
+    "read_char": "runtime.input.read_char",
+    "read_num": "runtime.input.read_num",
+    "callstack_append": "runtime.callstack.append",
+    "callstack_pop": "runtime.callstack.pop",
+}
+
+
+def generate_function(program: Program, start: int, end: int, word_range: tuple[int, int] | None = None,
+                      name: str = "run", bound: bool = False, wraps: bool = False) -> str:
+    """Python source of a function name(runtime) that runs the instructions from start up to
+    end (which must not branch before the last one) and returns the next PC.
+
+    If bound, name(runtime) instead returns a function without arguments doing
+    this, with the runtime's stack, heap and IO already looked up.
+    """
+    indent = " " * (8 if bound else 4)
+    body = _BlockCompiler(program, start, end, word_range, indent, wraps=wraps).compile()
+    code = "\n".join(body)
+    source = [f"def {name}(runtime):", "    stack = runtime.stack"]
+    source.extend(f"    {local} = {value}" for (local, value) in _BINDINGS.items() if re.search(rf"\b{local}\(", code))
+    if bound:
+        source.append("    def run():")
+    source.extend(body)
+    if bound:
+        source.append("    return run")
+    return "\n".join(source) + "\n"
+
+
+def exec_source(code: CodeType | str, bindings: dict | None = None) -> dict:
+    """Runs generated source with bindings among its globals, returning its namespace"""
+    namespace = dict(_NAMESPACE)
+    if bindings:
+        namespace.update(bindings)
+    exec(code, namespace)
+    return namespace
+
+
+def compile_blocks(program: Program, runtime: Runtime, cache_top: bool = True) -> list[Block | None]:
+    """Compiles the program into one function per basic block, bound to the runtime.
+
+    Returns a list indexed by PC, which is None for PCs inside a block.
+    """
+    stack = runtime.stack
+    word_range = stack_range(stack)
+    # The code only depends on where it starts, the word size and starting depth, so it is reused
+    # across runs, which then don't even build the graph
+    wraps = runtime.wrap_bits is not None
+    key = ("jit", runtime.PC, tuple(runtime.callstack), word_range, wraps, len(stack), cache_top)
+    code = program.code_cache.get(key)
+    if code is None:
+        cfg = ControlFlowGraph(program, [runtime.PC, *runtime.callstack])
+        depths = stack_depths(cfg, {runtime.PC: len(stack)})
+        source = generate_source(cfg, word_range, depths, cache_top, wraps)
+        code = program.code_cache[key] = compile(source, "<whitespace jit>", "exec")
+    compiled = exec_source(code, _bindings(runtime))["compiled"]
+    blocks: list[Block | None] = [None] * len(program)
+    for (pc, block) in compiled.items():
+        blocks[pc] = block
+    return blocks
+
+
+def run_jit(program: Program, runtime: Runtime) -> None:
+    steps = runtime.limits.steps
+    # Stopping between blocks must leave the whole stack on the stack, so limited runs don't cache its top
+    blocks = compile_blocks(program, runtime, cache_top=steps is None)
+    end = len(blocks)
+    pc = runtime.PC
+    runtime.PC = PC_RUNNING
+    try:
+        if steps is None:
+            while 0 <= pc < end:
+                pc = blocks[pc]()
+        else:
+            # Instructions in the block starting at each PC
+            lengths = [0] * end
+            starts = [start for (start, block) in enumerate(blocks) if block is not None]
+            for (start, following) in zip(starts, starts[1:] + [end]):
+                lengths[start] = following - start
+            while 0 <= pc < end:
+                steps -= lengths[pc]
+                if steps < 0:
+                    raise LimitExceeded(f"Ran more than {runtime.limits.steps} instructions")
+                pc = blocks[pc]()
+    except BaseException:
+        # Blocks record the failing instruction; otherwise the best we know is the block
+        if runtime.PC == PC_RUNNING:
+            runtime.PC = pc
+        raise
+    runtime.PC = pc
+
+
+# Called by generated code when an instruction fails
+def _fail(runtime: Runtime, pc: int, message: str, pending: tuple) -> None:
+    _fault(runtime, pc, pending)
+    raise StackError(message.format(length=len(runtime.stack)))
+
+def _fault(runtime: Runtime, pc: int, pending: tuple) -> None:
+    # Puts back the values the block held in locals, as they would be at pc
+    runtime.PC = pc
+    runtime.stack.extend(pending)
+
+# Globals of generated code
+_NAMESPACE = {"fail": _fail, "fault": _fault, "StackError": StackError, "CannotFindJumpTarget": CannotFindJumpTarget}
+
+
+class _BlockCompiler():
+    def __init__(self, program: Program, start: int, end: int, word_range: tuple[int, int] | None, indent: str,
+                 depth: int = 0, top_cached: bool = False, keep_top: bool = False, wraps: bool = False):
+        self.program = program
+        self.start = start
+        self.end = end
+        self.word_range = word_range
+        self.wraps = wraps and word_range is not None
+        self.indent = indent
+        self.lines: list[str] = []
+        # Values pushed by the block but not yet on the stack, as Python
+        # expressions (literals or local names), top last
+        self.values: list[str] = ["tos"] if top_cached else []
+        self.keep_top = keep_top
+        self.temps = 0
+        # Values known to be on the stack on entry, how many more (or fewer)
+        # there are now, and how many the block needs on entry to never underflow
+        self.depth = depth
+        self.offset = 0
+        self.required = 0
+
+    def compile(self) -> list[str]:
+        program = self.program
+        strings = find_constant_strings(program, self.start, self.end)
+        pc = self.start
+        while pc < self.end:
+            self.pc = pc
+            if pc in strings:
+                # Runs of Push c; OutChar write their text at once, leaving the stack as it was
+                (pc, text) = strings[pc]
+                self.guarded(f"write({text!r})")
+                continue
+            op = program.ops[pc]
+            if op in TERMINATORS:
+                self.terminator(op, program.args[pc], program.targets[pc])
+                return self.lines
+            self.instruction(op, program.args[pc])
+            pc += 1
+        # Falls through into the next block
+        self.leave()
+        self.emit(f"return {self.end}")
+        return self.lines
+
+    def emit(self, line: str, indent: int = 0) -> None:
+        self.lines.append(self.indent + "    " * indent + line)
+
+    def temp(self) -> str:
+        self.temps += 1
+        return f"t{self.temps}"
+
+    def pending(self) -> str:
+        return "(" + "".join(value + ", " for value in self.values) + ")"
+
+    # Writes the held values to the stack
+    def flush(self) -> None:
+        if len(self.values) == 1:
+            self.emit(f"append({self.values[0]})")
+        elif self.values:
+            self.emit(f"extend({self.pending()})")
+        self.offset += len(self.values)
+        self.values = []
+
+    # Writes the held values to the stack at the end of the block, except the top one if it stays in tos
+    def leave(self) -> None:
+        if not self.keep_top:
+            self.flush()
+        elif self.values:
+            top = self.values.pop()
+            self.flush()
+            if top != "tos":
+                self.emit(f"tos = {top}")
+        else:
+            # The blocks it goes to all start with a value on the stack
+            self.emit("tos = pop()")
+
+    # Raises the StackError of this instruction if the stack has fewer than depth values,
+    # unless there are known to be enough
+    def check(self, depth: int, message: str) -> None:
+        missing = depth - len(self.values)
+        if missing > 0:
+            self.required = max(self.required, missing - self.offset)
+            if self.depth + self.offset < missing:
+                self.emit(f"if len(stack) < {missing}:")
+                self.emit(f"fail(runtime, {self.pc}, {message!r}, {self.pending()})", 1)
+
+    # Makes sure the top count values are held, popping them off the stack if need be.
+    # Must come after check.
+    def take(self, count: int) -> None:
+        missing = count - len(self.values)
+        if missing > 0:
+            popped = [self.temp() for _ in range(missing)]
+            for name in popped:
+                self.emit(f"{name} = pop()")
+            self.values[0:0] = reversed(popped)
+            self.offset -= missing
+
+    # Runs a statement which may raise; if it does, the stack is as it would be at this instruction
+    def guarded(self, statement: str) -> None:
+        self.emit("try:")
+        self.emit(statement, 1)
+        self.emit("except BaseException:")
+        self.emit(f"fault(runtime, {self.pc}, {self.pending()})", 1)
+        self.emit("raise", 1)
+
+    # Holds a new value, which must fit on the stack if it is an array (or wraps around to fit)
+    def push_result(self, name: str) -> None:
+        if self.word_range is not None:
+            (low, high) = self.word_range
+            self.emit(f"if not {low} <= {name} <= {high}:")
+            if self.wraps:
+                self.emit(f"{name} = ({name} - {low}) % {high - low + 1} + {low}", 1)
+            else:
+                self.emit(f"fault(runtime, {self.pc}, {self.pending()})", 1)
+                # Raises OverflowError, like the array would have
+                self.emit(f"append({name})", 1)
+        self.values.append(name)
+
+    def fits(self, value: int) -> bool:
+        return self.word_range is None or self.word_range[0] <= value <= self.word_range[1]
+
+    # A constant as it ends up on the stack
+    def word(self, value: int) -> int:
+        if self.wraps and not self.fits(value):
+            (low, high) = self.word_range
+            return (value - low) % (high - low + 1) + low
+        return value
+
+    def instruction(self, op: int, num: int) -> None:
+        values = self.values
+        if op == PUSH:
+            num = self.word(num)
+            if self.fits(num):
+                values.append(repr(num))
+            else:
+                self.flush()
+                self.guarded(f"append({num!r})")
+
+        elif op == DUPLICATE:
+            self.check(1, "Empty runtime.stack")
+            self.take(1)
+            values.append(values[-1])
+
+        elif op == SWAP:
+            self.check(2, "Need two items on the runtime.stack to swap")
+            self.take(2)
+            values[-1], values[-2] = values[-2], values[-1]
+
+        elif op == DISCARD:
+            self.check(1, "Cannot discard on empty runtime.stack")
+            self.take(1)
+            values.pop()
+
+        elif op == COPY:
+            if 0 <= num < len(values):
+                values.append(values[-num - 1])
+                return
+            if num < 0:
+                # Indexes from the bottom of the stack
+                self.flush()
+            held = len(self.values)
+            self.check(num + 1, f"Cannot copy {num}th num from stack, it is only {{length}} long")
+            name = self.temp()
+            if num < 0:
+                # Can be past the top
+                self.guarded(f"{name} = stack[{-num - 1}]")
+            else:
+                self.emit(f"{name} = stack[{-(num - held) - 1}]")
+            self.values.append(name)
+
+        elif op == SLIDE:
+            if 0 <= num and len(values) > num + 1:
+                values[len(values) - num - 1:] = [values[-1]]
+                return
+            self.flush()
+            self.check(num + 2, f"Cannot slide {num} from stack, it is only {{length}} long")
+            name = self.temp()
+            if num < 0:
+                # The stack can be empty
+                self.guarded(f"{name} = stack[-1]")
+            else:
+                self.emit(f"{name} = stack[-1]")
+            self.emit(f"del stack[len(stack) - {num + 1}:]")
+            self.offset -= max(num + 1, 0)
+            self.values.append(name)
+
+        elif op in _ARITHMETIC:
+            (operator, message) = _ARITHMETIC[op]
+            self.check(2, message)
+            self.take(2)
+            second = values.pop()
+            first = values.pop()
+            name = self.temp()
+            if op == INT_DIVIDE or op == MODULO:
+                self.guarded(f"{name} = {first} {operator} {second}")
+            else:
+                self.emit(f"{name} = {first} {operator} {second}")
+            self.push_result(name)
+
+        elif op == OUT_CHAR or op == OUT_NUM:
+            self.check(1, "Empty runtime.stack")
+            self.take(1)
+            value = values.pop()
+            self.guarded(f"{'write_char' if op == OUT_CHAR else 'write_num'}({value})")
+
+        elif op == READ_CHAR or op == READ_NUM:
+            # Input is slow anyway, so this works on the stack directly
+            self.check(1, "Empty runtime.stack")
+            self.flush()
+            self.emit("try:")
+            if op == READ_CHAR:
+                # If a Ctrl-D is input, that should be interpreted as a null
+                self.emit("heap_write(pop(), read_char())", 1)
+            else:
+                self.emit("read_int = read_num()", 1)
+                if self.wraps:
+                    (low, high) = self.word_range
+                    self.emit(f"read_int = (read_int - {low}) % {high - low + 1} + {low}", 1)
+                self.emit("heap_write(pop(), read_int)", 1)
+            self.emit("except BaseException:")
+            self.emit(f"fault(runtime, {self.pc}, ())", 1)
+            self.emit("raise", 1)
+            self.offset -= 1
+
+        elif op == READ_HEAP:
+            self.check(1, "Need one runtime.stack elements to heap read")
+            self.take(1)
+            address = values.pop()
+            name = self.temp()
+            self.guarded(f"{name} = heap_read({address})")
+            values.append(name)
+
+        elif op == WRITE_HEAP:
+            self.check(2, "Need two elements to heap write")
+            self.take(2)
+            value = values.pop()
+            address = values.pop()
+            self.guarded(f"heap_write({address}, {value})")
+
+        else:
+            raise ValueError(f"Unknown opcode {op} at PC {self.pc}")
+
+    def terminator(self, op: int, label: int, target: int) -> None:
+        pc = self.pc
+        if op == END:
+            self.flush()
+            self.emit("return -1")
+
+        elif op == JUMP:
+            self.leave()
+            self.emit(f"return {target}")
+
+        elif op == JUMP_ZERO or op == JUMP_NEGATIVE:
+            if op == JUMP_ZERO:
+                self.check(1, "Stack is empty, yet a jump if top of stack is 0 is desired")
+                (condition, test) = ("== 0", lambda value: value == 0)
+            else:
+                self.check(1, "Stack is empty, yet a jump if top of stack is negative is desired")
+                (condition, test) = ("< 0", lambda value: value < 0)
+            self.take(1)
+            top = self.values[-1]
+            self.leave()
+            if top.lstrip("-").isdigit():
+                # Pushed in this block, so known now
+                self.emit(f"return {target if test(int(top)) else pc + 1}")
+            else:
+                self.emit(f"return {target} if {top} {condition} else {pc + 1}")
+
+        elif op == CALL_SUB:
+            self.flush()
+            if target == -1:
+                self.emit(f"runtime.PC = {pc}")
+                self.emit("raise CannotFindJumpTarget(\"This node was not visited, doesn't have the target PC\")")
+            else:
+                self.emit(f"callstack_append({pc})")
+                self.emit(f"return {target}")
+
+        elif op == END_SUB:
+            self.flush()
+            self.emit("try:")
+            self.emit("return callstack_pop()", 1)
+            self.emit("except IndexError:")
+            self.emit(f"runtime.PC = {pc}", 1)
+            self.emit("raise StackError(\"Callstack is empty, yet a end subroutine is desired\") from None", 1)
@@ -0,0 +1,66 @@
+from whitespace.Constants_errors import LimitExceeded
+
+from typing import BinaryIO, TextIO
+
+# Bytes of output held before they are written out
+OUTPUT_BUFFER_SIZE = 1 << 16
+
+
+class Output():
+    """What the program writes, held as UTF-8 in a bytearray until size bytes build up.
+
+    Writing a character is then an append rather than a call into the file
+    (and often a write syscall). flush() writes the buffer out and flushes the
+    file; the engines call it before reading input, so prompts show up, and
+    Runner.run calls it when the program stops. If raw, file is a binary file
+    (eg. sys.stdout.buffer) and gets the bytes as they are, skipping the text
+    layer; otherwise it gets them decoded. If limit is set, flush() raises
+    LimitExceeded once more than limit bytes were written, having written limit.
+    """
+    def __init__(self, file: TextIO | BinaryIO, size: int = OUTPUT_BUFFER_SIZE, raw: bool = False,
+                 limit: int | None = None):
+        self.file = file
+        self.size = size
+        self.raw = raw
+        self.limit = limit
+        self.written = 0
+        self.buffer = bytearray()
+
+    def write_char(self, value: int) -> None:
+        buffer = self.buffer
+        if 0 <= value < 128:
+            buffer.append(value)
+        else:
+            # Raises ValueError for values that aren't characters, like chr
+            buffer += chr(value).encode("utf-8", "surrogatepass")
+        if len(buffer) >= self.size:
+            self.flush()
+
+    def write_num(self, value: int) -> None:
+        self.buffer += b"%d" % value
+        if len(self.buffer) >= self.size:
+            self.flush()
+
+    def write(self, text: str) -> None:
+        self.buffer += text.encode("utf-8", "surrogatepass")
+        if len(self.buffer) >= self.size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.buffer:
+            exceeded = self.limit is not None and self.written + len(self.buffer) > self.limit
+            if exceeded:
+                del self.buffer[self.limit - self.written:]
+            if self.raw:
+                self.file.write(self.buffer)
+            else:
+                # A character cut off by the limit is dropped
+                self.file.write(self.buffer.decode("utf-8", "ignore" if exceeded else "surrogatepass"))
+            self.written += len(self.buffer)
+            self.buffer.clear()
+            self.file.flush()
+            if exceeded:
+                raise LimitExceeded(f"Wrote more than {self.limit} bytes of output")
+
+    def __repr__(self) -> str:
+        return f"Output of {len(self.buffer)} bytes to {self.file}"
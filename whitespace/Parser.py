@@ -1,230 +1,268 @@
-from whitespace.Tokenizer import Tokenizer, TokenType
-from whitespace.Commands import Command, End, Push, OutChar, OutNum, ReadChar, ReadNum, Duplicate, Swap, Discard
-from whitespace.Commands import Plus, Minus, Times, IntDivide, Modulo
-from whitespace.Commands import Read_Heap, Write_Heap
-from whitespace.Commands import CallSub, EndSub, Jump, JumpZero, JumpNegative
-from whitespace.Commands import Copy, Slide
+from whitespace.Tokenizer import Tokenizer, TAB, SPACE, LINEFEED
+from whitespace.Commands import Command
+from whitespace.Program import Program, PUSH, DUPLICATE, SWAP, DISCARD, COPY, SLIDE
+from whitespace.Program import PLUS, MINUS, TIMES, INT_DIVIDE, MODULO
+from whitespace.Program import OUT_CHAR, OUT_NUM, READ_CHAR, READ_NUM
+from whitespace.Program import END, CALL_SUB, END_SUB, JUMP, JUMP_ZERO, JUMP_NEGATIVE
+from whitespace.Program import READ_HEAP, WRITE_HEAP
+from whitespace.Visitor import resolve_labels
+
+from bisect import bisect_right
+from typing import BinaryIO
+from itertools import product, repeat
+
+# What follows the IMP/opcode prefix of an instruction
+NO_ARG, NUMBER_ARG, LABEL_ARG, LABEL_MARK = range(4)
+
+# Token prefix of every instruction, with the opcode it decodes to and its argument.
+# A label mark is not an instruction; its label applies to the next instruction.
+INSTRUCTION_PREFIXES: tuple[tuple[tuple[int, ...], int, int], ...] = (
+    # Stack manipulation
+    ((SPACE, SPACE), PUSH, NUMBER_ARG),
+    ((SPACE, LINEFEED, SPACE), DUPLICATE, NO_ARG),
+    ((SPACE, LINEFEED, TAB), SWAP, NO_ARG),
+    ((SPACE, LINEFEED, LINEFEED), DISCARD, NO_ARG),
+    ((SPACE, TAB, SPACE), COPY, NUMBER_ARG),
+    ((SPACE, TAB, LINEFEED), SLIDE, NUMBER_ARG),
+    # Arithmetic
+    ((TAB, SPACE, SPACE, SPACE), PLUS, NO_ARG),
+    ((TAB, SPACE, SPACE, TAB), MINUS, NO_ARG),
+    ((TAB, SPACE, SPACE, LINEFEED), TIMES, NO_ARG),
+    ((TAB, SPACE, TAB, SPACE), INT_DIVIDE, NO_ARG),
+    ((TAB, SPACE, TAB, TAB), MODULO, NO_ARG),
+    # Heap
+    ((TAB, TAB, SPACE), WRITE_HEAP, NO_ARG),
+    ((TAB, TAB, TAB), READ_HEAP, NO_ARG),
+    # IO
+    ((TAB, LINEFEED, SPACE, SPACE), OUT_CHAR, NO_ARG),
+    ((TAB, LINEFEED, SPACE, TAB), OUT_NUM, NO_ARG),
+    ((TAB, LINEFEED, TAB, SPACE), READ_CHAR, NO_ARG),
+    ((TAB, LINEFEED, TAB, TAB), READ_NUM, NO_ARG),
+    # Flow control
+    ((LINEFEED, SPACE, SPACE), -1, LABEL_MARK),
+    ((LINEFEED, SPACE, TAB), CALL_SUB, LABEL_ARG),
+    ((LINEFEED, SPACE, LINEFEED), JUMP, LABEL_ARG),
+    ((LINEFEED, TAB, SPACE), JUMP_ZERO, LABEL_ARG),
+    ((LINEFEED, TAB, TAB), JUMP_NEGATIVE, LABEL_ARG),
+    ((LINEFEED, TAB, LINEFEED), END_SUB, NO_ARG),
+    ((LINEFEED, LINEFEED, LINEFEED), END, NO_ARG),
+)
+
+
+# Decoding table, keyed by the next (up to) four token codes, which is the
+# longest instruction prefix. Each entry is
+# (opcode, kind, consumed, linefeeds before the last token, linefeeds),
+# where kind says what follows the prefix and consumed is the length of the
+# prefix. Linefeeds are counted to track line numbers in normal mode.
+# A kind of PARSE_ERROR means the prefix is invalid after `consumed` tokens;
+# TRUNCATED means the source ends in the middle of a prefix.
+PARSE_ERROR, TRUNCATED = 4, 5
+
+def _build_decode_table(prefixes: tuple[tuple[tuple[int, ...], int, int], ...]) -> dict[bytes, tuple[int, int, int, int, int]]:
+    leaves = {prefix: (op, arg) for (prefix, op, arg) in prefixes}
+    table: dict[bytes, tuple[int, int, int, int, int]] = {}
+    for length in range(5):
+        for window in product((TAB, SPACE, LINEFEED), repeat=length):
+            entry = (-1, TRUNCATED, length, 0, 0)
+            for consumed in range(1, length + 1):
+                prefix = window[:consumed]
+                if prefix in leaves:
+                    entry = leaves[prefix] + (consumed, prefix[:-1].count(LINEFEED), prefix.count(LINEFEED))
+                    break
+                if not any(p[:consumed] == prefix for p in leaves):
+                    entry = (-1, PARSE_ERROR, consumed, 0, 0)
+                    break
+            table[bytes(window)] = entry
+    return table
+
+_DECODE_TABLE = _build_decode_table(INSTRUCTION_PREFIXES)
+
+# Number and label digits: space is 0, tab is 1
+_BIT_TABLE = bytes.maketrans(bytes([SPACE, TAB]), b"01")
+_LINEFEED_CODE = bytes([LINEFEED])
+
+
+# Decodes the digits starting at index, up to a linefeed (consumed) or the end.
+# Returns the value and the index after it.
+def decode_bits(codes: bytes, index: int) -> tuple[int, int]:
+    end = codes.find(_LINEFEED_CODE, index)
+    if end == -1:
+        end = len(codes)
+        after = end
+    else:
+        after = end + 1
+    if end == index:
+        return 0, after
+    return int(codes[index:end].translate(_BIT_TABLE), 2), after
+
+
+# Decodes a sign then digits. A number without a sign (ie starting with a
+# linefeed, which is consumed) is -1.
+def decode_number(codes: bytes, index: int) -> tuple[int, int]:
+    if index >= len(codes):
+        return -1, index
+    sign = codes[index]
+    if sign == LINEFEED:
+        return -1, index + 1
+    value, index = decode_bits(codes, index + 1)
+    return (value if sign == SPACE else -value), index
+
 
 class Parser(Tokenizer):
-    def __init__(self, text: str, detect_readable: bool):
-        super().__init__(text, detect_readable)
+    def __init__(self, source: str | bytes | BinaryIO, detect_readable: bool, jobs: int = 1):
+        super().__init__(source, detect_readable, jobs)
+        # Label of a mark waiting for the instruction it applies to
         self.label = -1
+        self.program = Program()
+        # Labels are resolved while parsing: where each label is marked, the
+        # PCs of the branches waiting on each label, and the first duplicate mark
+        self.label_pcs: dict[int, int] = {}
+        self.references: dict[int, list[int]] = {}
+        self.duplicate = -1
 
-    def get_label(self):
+
+    def allCommands(self) -> Program:
+        self.decode(-1)
+        return self.program
+
+
+    def nextCommand(self) -> Command | None:
+        if self.nextInstruction():
+            return self.program[-1]
+        return None
+
+
+    # Parses the next instruction into the program. Returns False at the end of the source.
+    def nextInstruction(self) -> bool:
+        return self.decode(1) == 1
+
+
+    # Decodes up to count instructions (or all of them, if count is negative)
+    # into the program, returning how many were decoded. Everything used in
+    # the loop is held in locals, since this runs once per instruction.
+    def decode(self, count: int) -> int:
+        codes = self.codes
+        length = len(codes)
+        index = self.index
         label = self.label
-        # Reset current label so only the next instruction has this label
-        self.label = -1
-        return label
+        breaks = self.breaks
+        # Number of linefeed tokens before index
+        counted_lines = self.lineAt(index) - 1 if breaks is None else 0
+        program = self.program
+        ops_append = program.ops.append
+        lines_append = program.lines.append
+        args_append = program.args.append
+        labels_append = program.labels.append
+        decode_table = _DECODE_TABLE
+        find = codes.find
+        linefeed = _LINEFEED_CODE
+        bit_table = _BIT_TABLE
+        label_pcs = self.label_pcs
+        references = self.references
+        pc = len(program.ops)
+        decoded = 0
 
+        try:
+            while decoded != count:
+                (op, kind, consumed, linefeeds_before, linefeeds) = decode_table[codes[index:index + 4]]
+                index += consumed
+                if kind >= PARSE_ERROR:
+                    if kind == TRUNCATED:
+                        self.read_eof = True
+                        if consumed == 0 and label == -1:
+                            if not program.resolved:
+                                self.resolveLabels()
+                            return decoded
+                    raise self.parseError(index)
 
-    def allCommands(self) -> list[Command]:
-        out: list[Command] = []
-        c = self.nextCommand()
-        while c is not None:
-            out.append(c)
-            c = self.nextCommand()
-        return out
+                # The line of an instruction is that of the last token of its prefix
+                if breaks is None:
+                    line = counted_lines + linefeeds_before + 1
+                else:
+                    line = bisect_right(breaks, index - 1) + 1
+                counted_lines += linefeeds
 
+                if kind == NO_ARG:
+                    arg = 0
+                else:
+                    # Same as decode_number/decode_bits, inlined
+                    end = find(linefeed, index)
+                    if end == -1:
+                        end = length
+                        after = length
+                    else:
+                        after = end + 1
+                        counted_lines += 1
+                    if kind != NUMBER_ARG:
+                        arg = int(codes[index:end].translate(bit_table), 2) if end > index else 0
+                    elif end == index:
+                        # No sign
+                        arg = -1
+                    else:
+                        arg = int(codes[index + 1:end].translate(bit_table), 2) if end > index + 1 else 0
+                        if codes[index] == TAB:
+                            arg = -arg
+                    index = after
 
-    def nextCommand(self) -> Command | None:
-        lookahead = self.nextToken()
-        if lookahead.type == TokenType.EOF:
-            return None
-
-        token = None
-        if lookahead.type == TokenType.SPACE:
-            token = self.parseStackManip()
-        elif lookahead.type == TokenType.LINEFEED:
-            token = self.parseFlowControl()
-        elif lookahead.type == TokenType.TAB:
-            lookahead = self.nextToken()
-            if lookahead.type == TokenType.SPACE:
-                token = self.parseArith()
-            elif lookahead.type == TokenType.LINEFEED:
-                token = self.parseIO()
-            elif lookahead.type == TokenType.TAB:
-                token = self.parseHeap()
-
-        if token == None:
-            # In this case, the parse failed somewhere along the way.
-            # For now, this is detected here and we raise an error.
-            raise Exception(f"Cannot parse command, on line {self.line} index {self.index}")
-        else:
-            return token
-    
-        
-    def parseStackManip(self) -> Command | None:
-        lookahead = self.nextToken()
-        if lookahead.type == TokenType.SPACE:
-            return Push(lookahead.line, self.parseNumber(), self.get_label())
-        elif lookahead.type == TokenType.LINEFEED:
-            lookahead = self.nextToken()
-            if lookahead.type == TokenType.SPACE:
-                return Duplicate(lookahead.line, self.get_label())
-            elif lookahead.type == TokenType.TAB:
-                return Swap(lookahead.line, self.get_label())
-            elif lookahead.type == TokenType.LINEFEED:
-                return Discard(lookahead.line, self.get_label())
-            else:
-                return None
-        elif lookahead.type == TokenType.TAB:
-            lookahead = self.nextToken()
-            if lookahead.type == TokenType.SPACE:
-                return Copy(lookahead.line, self.parseNumber(), self.get_label())
-            elif lookahead.type == TokenType.LINEFEED:
-                return Slide(lookahead.line, self.parseNumber(), self.get_label())
-            else:
-                return None
-        else:
-            return None
-    
+                    if kind == LABEL_MARK:
+                        # Label marks are not instructions; the label goes on the next one
+                        label = arg
+                        continue
+                    if kind == LABEL_ARG:
+                        waiting = references.get(arg)
+                        if waiting is None:
+                            references[arg] = [pc]
+                        else:
+                            waiting.append(pc)
 
-    def parseNumber(self) -> int:
-        lookahead = self.nextToken()
-        out: int = 0
-
-        # A number starts with a sign; Space is 0, tab 1
-        if lookahead.type == TokenType.SPACE:
-            sign = 1
-        elif lookahead.type == TokenType.TAB:
-            sign = -1
-        else:
-            return -1
-        lookahead = self.nextToken()
-
-        # For the rest of the number, space is 0, tab is 1 (ends on LF)
-        while lookahead.type == TokenType.SPACE or lookahead.type == TokenType.TAB:
-            if lookahead.type == TokenType.SPACE:
-                # Add 0 to number
-                out = out << 1
-            elif lookahead.type == TokenType.TAB:
-                # Add 1 to number
-                out = out << 1
-                out += 1
-
-            lookahead = self.nextToken()
-        out *= sign
+                ops_append(op)
+                lines_append(line)
+                try:
+                    args_append(arg)
+                except OverflowError:
+                    # Numbers can be arbitrarily large; fall back to a list for them
+                    program.args = list(program.args)
+                    args_append = program.args.append
+                    args_append(arg)
+                try:
+                    labels_append(label)
+                except OverflowError:
+                    program.labels = list(program.labels)
+                    labels_append = program.labels.append
+                    labels_append(label)
+                if label != -1:
+                    if label not in label_pcs:
+                        label_pcs[label] = pc
+                    elif self.duplicate == -1:
+                        self.duplicate = pc
+                    label = -1
+                pc += 1
+                decoded += 1
+            return decoded
+        finally:
+            # Targets are only known once labels are resolved
+            program.targets.extend(repeat(-1, len(program.ops) - len(program.targets)))
+            self.index = index
+            self.label = label
+
+
+    # Backpatches branch targets once the whole source is parsed
+    def resolveLabels(self) -> None:
+        program = self.program
+        program.targets.extend(repeat(-1, len(program.ops) - len(program.targets)))
+        resolve_labels(program, self.label_pcs, self.references, self.duplicate)
 
-        return out
-    
-    def parseLabel(self) -> int:
-        lookahead = self.nextToken()
-        out: int = 0
 
-        # For the label, space is 0, tab is 1 (ends on LF; the LF is consumed)
-        while lookahead.type == TokenType.SPACE or lookahead.type == TokenType.TAB:
-            if lookahead.type == TokenType.SPACE:
-                # Add 0 to number
-                out = out << 1
-            elif lookahead.type == TokenType.TAB:
-                # Add 1 to number
-                out = out << 1
-                out += 1
+    def parseError(self, index: int) -> Exception:
+        # In this case, the parse failed somewhere along the way.
+        self.index = index
+        return Exception(f"Cannot parse command, on line {self.line} index {self.index}")
 
-            lookahead = self.nextToken()
 
+    def parseNumber(self) -> int:
+        out, self.index = decode_number(self.codes, self.index)
+        return out
+
+    def parseLabel(self) -> int:
+        out, self.index = decode_bits(self.codes, self.index)
         return out
-    
-
-    def parseFlowControl(self) -> Command | None:
-        lookahead = self.nextToken()
-
-        if lookahead.type == TokenType.LINEFEED:
-            lookahead = self.nextToken()
-
-            if lookahead.type == TokenType.LINEFEED:
-                return End(lookahead.line, self.get_label())
-            else:
-                return None
-        elif lookahead.type == TokenType.SPACE:
-            lookahead = self.nextToken()
-            
-            if lookahead.type == TokenType.SPACE:
-                # The next part of the source is a label, ending with LF
-                # Will be applied to the next instruction
-                self.label = self.parseLabel()
-                # Recurse to parse next thing
-                return self.nextCommand()
-            elif lookahead.type == TokenType.LINEFEED:
-                target_label = self.parseLabel()
-                return Jump(lookahead.line, self.get_label(), target_label)
-            elif lookahead.type == TokenType.TAB:
-                return CallSub(lookahead.line, self.get_label(), self.parseLabel())
-            else:
-                return None
-        elif lookahead.type == TokenType.TAB:
-            lookahead = self.nextToken()
-
-            if lookahead.type == TokenType.LINEFEED:
-                return EndSub(lookahead.line, self.get_label())
-            elif lookahead.type == TokenType.SPACE:
-                return JumpZero(lookahead.line, self.get_label(), self.parseLabel())
-            elif lookahead.type == TokenType.TAB:
-                return JumpNegative(lookahead.line, self.get_label(), self.parseLabel())
-            else:
-                return None
-        else:
-            return None
-    
-
-    def parseIO(self) -> Command | None:
-        lookahead = self.nextToken()
-
-        if lookahead.type == TokenType.SPACE:
-            lookahead = self.nextToken()
-
-            if lookahead.type == TokenType.SPACE:
-                return OutChar(lookahead.line, label=self.get_label())
-            elif lookahead.type == TokenType.TAB:
-                return OutNum(lookahead.line, self.get_label())
-            else:
-                return None
-        elif lookahead.type == TokenType.TAB:
-            lookahead = self.nextToken()
-
-            if lookahead.type == TokenType.SPACE:
-                return ReadChar(lookahead.line, self.get_label())
-            elif lookahead.type == TokenType.TAB:
-                return ReadNum(lookahead.line, self.get_label())
-            else:
-                return None
-        else:
-            return None
-    
-
-    def parseArith(self) -> Command | None:
-        lookahead = self.nextToken()
-
-        if lookahead.type == TokenType.SPACE:
-            lookahead = self.nextToken()
-            
-            if lookahead.type == TokenType.SPACE:
-                return Plus(lookahead.line, self.get_label())
-            elif lookahead.type == TokenType.TAB:
-                return Minus(lookahead.line, self.get_label())
-            elif lookahead.type == TokenType.LINEFEED:
-                return Times(lookahead.line, self.get_label())
-            else:
-                return None
-        elif lookahead.type == TokenType.TAB:
-            lookahead = self.nextToken()
-
-            if lookahead.type == TokenType.SPACE:
-                return IntDivide(lookahead.line, self.get_label())
-            elif lookahead.type == TokenType.TAB:
-                return Modulo(lookahead.line, self.get_label())
-            else:
-                return None
-        else:
-            return None
-            
-    
-    def parseHeap(self) -> Command | None:
-        lookahead = self.nextToken()
-
-        if lookahead.type == TokenType.SPACE:
-            return Write_Heap(lookahead.line, self.get_label())
-        elif lookahead.type == TokenType.TAB:
-            return Read_Heap(lookahead.line, self.get_label())
-        else:
-            return None
@@ -0,0 +1,118 @@
+from whitespace.Commands import Command, Push, Duplicate, Swap, Discard, Copy, Slide
+from whitespace.Commands import Plus, Minus, Times, IntDivide, Modulo
+from whitespace.Commands import OutChar, OutNum, ReadChar, ReadNum
+from whitespace.Commands import End, CallSub, EndSub, Jump, JumpZero, JumpNegative
+from whitespace.Commands import Read_Heap, Write_Heap
+
+from typing import Iterator
+from array import array
+
+# Opcodes; each one is the index of its command class in COMMAND_TYPES
+PUSH, DUPLICATE, SWAP, DISCARD, COPY, SLIDE = range(0, 6)
+PLUS, MINUS, TIMES, INT_DIVIDE, MODULO = range(6, 11)
+OUT_CHAR, OUT_NUM, READ_CHAR, READ_NUM = range(11, 15)
+END, CALL_SUB, END_SUB, JUMP, JUMP_ZERO, JUMP_NEGATIVE = range(15, 21)
+READ_HEAP, WRITE_HEAP = range(21, 23)
+
+COMMAND_TYPES: tuple[type[Command], ...] = (
+    Push, Duplicate, Swap, Discard, Copy, Slide,
+    Plus, Minus, Times, IntDivide, Modulo,
+    OutChar, OutNum, ReadChar, ReadNum,
+    End, CallSub, EndSub, Jump, JumpZero, JumpNegative,
+    Read_Heap, Write_Heap,
+)
+OPCODES: dict[type[Command], int] = {cls: op for (op, cls) in enumerate(COMMAND_TYPES)}
+
+# Opcodes whose argument is a number, and those whose argument is a target label
+NUMBER_OPS = frozenset((PUSH, COPY, SLIDE))
+BRANCH_OPS = frozenset((CALL_SUB, JUMP, JUMP_ZERO, JUMP_NEGATIVE))
+
+
+class Program():
+    """A parsed program, stored as one array per field instead of one Command per instruction.
+
+    For each instruction (indexed by its PC), ops holds the opcode, args the
+    number or target label, labels the label (-1 if none), targets the
+    resolved target PC of branches (-1 until resolved) and lines the source
+    line. Indexing or iterating builds Command objects on demand.
+
+    resolved is set once targets are filled in; label_error then holds the
+    duplicate or missing label found while resolving, if any. code_cache holds
+    compiled forms of the program (see Jit.py), and is cleared when it changes.
+    """
+    def __init__(self):
+        self.ops = array('B')
+        self.args: array | list[int] = array('q')
+        self.labels: array | list[int] = array('q')
+        self.targets = array('l')
+        self.lines = array('l')
+        self.resolved = False
+        self.label_error: Exception | None = None
+        self.code_cache: dict = {}
+
+    def append(self, op: int, line: int, arg: int = 0, label: int = -1) -> None:
+        self.resolved = False
+        self.code_cache.clear()
+        self.ops.append(op)
+        self.lines.append(line)
+        self.targets.append(-1)
+        try:
+            self.args.append(arg)
+        except OverflowError:
+            # Numbers can be arbitrarily large; fall back to a list for them
+            self.args = list(self.args)
+            self.args.append(arg)
+        try:
+            self.labels.append(label)
+        except OverflowError:
+            self.labels = list(self.labels)
+            self.labels.append(label)
+
+    def appendCommand(self, command: Command) -> None:
+        op = OPCODES[type(command)]
+        if op in NUMBER_OPS:
+            arg = command.num
+        elif op in BRANCH_OPS:
+            arg = command.target_label
+        else:
+            arg = 0
+        self.append(op, command.line, arg, command.label)
+        if op in BRANCH_OPS:
+            self.targets[-1] = command.target_pc
+
+    @classmethod
+    def fromCommands(cls, commands: list[Command]) -> "Program":
+        program = cls()
+        for command in commands:
+            program.appendCommand(command)
+        return program
+
+    def __len__(self) -> int:
+        return len(self.ops)
+
+    def __getitem__(self, pc: int) -> Command:
+        if pc < 0:
+            pc += len(self.ops)
+        op = self.ops[pc]
+        cls = COMMAND_TYPES[op]
+        if op in NUMBER_OPS:
+            return cls(self.lines[pc], self.args[pc], self.labels[pc])
+        elif op in BRANCH_OPS:
+            command = cls(self.lines[pc], self.labels[pc], self.args[pc])
+            command.target_pc = self.targets[pc]
+            return command
+        else:
+            return cls(self.lines[pc], self.labels[pc])
+
+    def __iter__(self) -> Iterator[Command]:
+        for pc in range(len(self.ops)):
+            yield self[pc]
+
+    def __eq__(self, value: object) -> bool:
+        if isinstance(value, (Program, list)):
+            return len(self) == len(value) and all(a == b for (a, b) in zip(self, value))
+        else:
+            return False
+
+    def __repr__(self) -> str:
+        return f"Program of {len(self)} commands"
@@ -1,39 +1,129 @@
 from whitespace.Parser import Parser
+from whitespace.Program import Program
+from whitespace import Cache
+from whitespace.Commands import Command
 from whitespace.Runtime import Runtime
 from whitespace.Visitor import visit_flow_control
+from whitespace.Threaded import run_threaded
+from whitespace.Jit import run_jit, stack_range
+from whitespace.Fusion import Profile, Fused, OutString, fuse, out_strings
+from whitespace.Constants_errors import LimitExceeded
 from whitespace.colours import TerminalColors
 
-def execute(source: str, detect_readable: bool, print_out: bool, verbose: bool, debug: bool) -> None:
-    p = Parser(source, detect_readable)
+from typing import BinaryIO
+from array import array
+
+# Ways to run a program: "loop" calls Command.execute for every step, "threaded"
+# compiles the program to closures first (see Threaded.py) and "jit" compiles
+# it to Python source, one function per basic block (see Jit.py)
+ENGINES = ("loop", "threaded", "jit")
+
+# Parses and resolves labels
+def load(source: str | bytes | BinaryIO, detect_readable: bool, jobs: int = 1) -> Program:
+    p = Parser(source, detect_readable, jobs)
     program = p.allCommands()
     visit_flow_control(program)
+    return program
+
+# Like load, but reuses the cached program if the file has not changed since it was cached
+def load_file(filename: str, detect_readable: bool, use_cache: bool = True, jobs: int = 1) -> Program:
+    if use_cache:
+        key = Cache.source_key(filename, detect_readable)
+        program = Cache.read(filename, detect_readable, key)
+        if program is not None:
+            return program
+
+    with open(filename, "rb") as source:
+        program = load(source, detect_readable, jobs)
+    if use_cache:
+        Cache.write(filename, detect_readable, key, program)
+    return program
+
+def execute(source: str | bytes | BinaryIO, detect_readable: bool, print_out: bool, verbose: bool, debug: bool, engine: str = "loop") -> None:
+    run(load(source, detect_readable), print_out, verbose, debug, engine)
 
+# Stepping through instructions (verbose and debug) always uses the loop engine, as does
+# recording a profile (which counts the sequences of commands run into profile).
+# superinstructions is a profile whose most frequent sequences are fused (see Fusion.py);
+# the JIT, which compiles whole blocks, ignores it. Unless stepping through instructions or
+# profiling, runs of Push c; OutChar write their text at once (see Fusion.OutString).
+def run(program: Program, print_out: bool, verbose: bool, debug: bool, engine: str = "loop", runtime: Runtime | None = None,
+        profile: Profile | None = None, superinstructions: Profile | None = None) -> Runtime:
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine}, expected one of {', '.join(ENGINES)}")
     if print_out:
         print("Program:")
         print("\n".join(map(str, program)))
-        print() # add newline
+        # add newline, before any raw output (see --raw-output) goes around the text layer
+        print(flush=True)
 
-    runtime = Runtime()
+    if runtime is None:
+        runtime = Runtime()
+    try:
+        _run(program, runtime, verbose, debug, engine, profile, superinstructions)
+    finally:
+        # Whatever was written before the program stopped (or failed)
+        runtime.output.flush()
+    return runtime
 
+def _run(program: Program, runtime: Runtime, verbose: bool, debug: bool, engine: str,
+         profile: Profile | None, superinstructions: Profile | None) -> None:
+    fast = not (verbose or debug or profile)
+    if engine == "jit" and fast:
+        run_jit(program, runtime)
+        return
+    fused: dict[int, Command] = {}
+    if profile is None:
+        if fast:
+            # Constant strings are written at once, taking precedence over superinstructions starting with them
+            fused.update(out_strings(program))
+        if superinstructions is not None:
+            for (pc, command) in fuse(program, superinstructions, stack_range(runtime.stack),
+                                      wraps=runtime.wrap_bits is not None).items():
+                fused.setdefault(pc, command)
+    if engine == "threaded" and fast:
+        run_threaded(program, runtime, fused)
+        return
+
+    # Commands are only built for the instructions that actually run
+    commands: dict[int, Command] = dict(fused)
+    # Times each instruction ran, when profiling
+    executed = array('Q', bytes(8 * len(program))) if profile is not None else None
+
+    try:
+        _loop(program, runtime, commands, executed, verbose, debug)
+    finally:
+        if profile is not None:
+            profile.record(program, executed)
+
+def _loop(program: Program, runtime: Runtime, commands: dict[int, Command], executed: array | None, verbose: bool, debug: bool) -> None:
+    steps = runtime.limits.steps
     while runtime.PC != -1 and runtime.PC < len(program):
-        statement = program[runtime.PC]
+        if executed is not None:
+            executed[runtime.PC] += 1
+        statement = commands.get(runtime.PC)
+        if statement is None:
+            statement = commands[runtime.PC] = program[runtime.PC]
+        if steps is not None:
+            steps -= len(statement.commands) if isinstance(statement, (Fused, OutString)) else 1
+            if steps < 0:
+                raise LimitExceeded(f"Ran more than {runtime.limits.steps} instructions")
         if verbose or debug:
-            print(TerminalColors.OKCYAN + str(statement) + TerminalColors.ENDC)
+            # So the output so far comes before the instruction
+            runtime.output.flush()
+            # Flushed, as raw output (see --raw-output) skips the text layer's buffer
+            print(TerminalColors.OKCYAN + str(statement) + TerminalColors.ENDC, flush=True)
         if debug:
             while True:
-                print(TerminalColors.OKBLUE + "(ws) " + TerminalColors.ENDC, end="")
-                command = input()
+                print(TerminalColors.OKBLUE + "(ws) " + TerminalColors.ENDC, end="", flush=True)
+                # From the program's input buffer, which may already hold the next lines
+                command = runtime.input.read_line()
                 if command == "ni" or command == "nexti":
                     break
         runtime.PC = statement.execute(runtime)
 
-def minify(source: str, detect_readable: bool) -> str:
+def minify(source: str | bytes | BinaryIO, detect_readable: bool) -> str:
     p = Parser(source, detect_readable)
     program = p.allCommands()
     
-    out = ""
-
-    for command in program:
-        out += command.minified()
-    
-    return out
\ No newline at end of file
+    return "".join(command.minified() for command in program)
\ No newline at end of file
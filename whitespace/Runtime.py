@@ -1,19 +1,87 @@
 from whitespace.Constants_errors import WORD_TYPE
 from whitespace.Heap import Heap
+from whitespace.Stack import Stack
+from whitespace.Output import Output, OUTPUT_BUFFER_SIZE
+from whitespace.Input import Input, INPUT_BUFFER_SIZE
 
-from typing import TextIO
+from typing import BinaryIO, TextIO
 import sys
 from array import array
 
+# runtime.PC while a compiled engine runs, until a failing instruction records where it failed
+PC_RUNNING = -2
+
+# Integer semantics (--int-mode): the typecode of the stack and heap arrays, and
+# whether results that don't fit wrap around. bigint keeps them in lists, so
+# numbers can grow without bound. Without a mode, words are WORD_TYPE and
+# results that don't fit raise OverflowError.
+INT_MODES: dict[str, tuple[str | None, bool]] = {
+    "wrap32": ('i', True),
+    "wrap64": ('q', True),
+    "bigint": (None, False),
+}
+
+
+class Limits():
+    """What a run may use: at most steps instructions, and output bytes of output.
+
+    Going over raises LimitExceeded. Engines that run several instructions at
+    a time (blocks, superinstructions) stop before starting any that would
+    take them over, so they may stop a little earlier than the loop engine.
+    None means no limit.
+    """
+    def __init__(self, steps: int | None = None, output: int | None = None):
+        self.steps = steps
+        self.output = output
+
+    def __repr__(self) -> str:
+        return f"Limits of {self.steps} steps and {self.output} bytes of output"
+
+
+def wrap(value: int, bits: int) -> int:
+    """value as a signed two's complement number of that many bits"""
+    half = 1 << (bits - 1)
+    return ((value + half) & ((half << 1) - 1)) - half
+
 
 class Runtime():
-    def __init__(self, stack: array | None = None, heap: Heap | None = None, callstack: array | None = None, PC: int = 0, file_in: TextIO = sys.stdin, file_out: TextIO = sys.stdout):
-        self.stack = stack if stack is not None else array(WORD_TYPE)
-        self.heap = heap if heap is not None else Heap()
+    def __init__(self, stack: Stack | array | list[int] | None = None, heap: Heap | None = None, callstack: array | None = None, PC: int = 0, file_in: TextIO | BinaryIO = sys.stdin, file_out: TextIO | BinaryIO = sys.stdout,
+                 int_mode: str | None = None, output_buffer: int = OUTPUT_BUFFER_SIZE, raw_output: bool = False,
+                 input_buffer: int = INPUT_BUFFER_SIZE, limits: Limits | None = None):
+        self.int_mode = int_mode
+        # Bits of a word, if results wrap around to fit in one
+        self.wrap_bits: int | None = None
+        if int_mode is None:
+            self.stack = stack if stack is not None else Stack()
+            self.heap = heap if heap is not None else Heap()
+        else:
+            if int_mode not in INT_MODES:
+                raise ValueError(f"Unknown int mode {int_mode}, expected one of {', '.join(INT_MODES)}")
+            (typecode, wraps) = INT_MODES[int_mode]
+            if typecode is None:
+                self.stack = stack if isinstance(stack, list) else list(stack or ())
+            else:
+                if wraps:
+                    self.wrap_bits = array(typecode).itemsize * 8
+                # The values given are copied into a stack of the mode's width
+                self.stack = Stack((wrap(value, self.wrap_bits) for value in stack or ()), typecode)
+            self.heap = heap if heap is not None else Heap(typecode)
         self.callstack = callstack if callstack is not None else array(WORD_TYPE)
         self.PC = PC
         self.file_in = file_in
         self.file_out = file_out
+        # Output goes through a buffer of output_buffer bytes; file_out is binary if raw_output
+        self.limits = limits if limits is not None else Limits()
+        self.output = Output(file_out, output_buffer, raw_output, self.limits.output)
+        # Input is read input_buffer bytes at a time, writing out the output before waiting for it
+        self.input = Input(file_in, input_buffer, self.output)
+
+    # Called when pushing value overflowed the stack with error: pushes it wrapped around
+    # if the int mode wraps, and otherwise raises error
+    def push_wrapped(self, value: int, error: OverflowError) -> None:
+        if self.wrap_bits is None:
+            raise error
+        self.stack.append(wrap(value, self.wrap_bits))
 
     def __repr__(self) -> str:
         return f"Runtime, stack {self.stack} heap {self.heap} callstack {self.callstack} PC {self.PC}"
\ No newline at end of file
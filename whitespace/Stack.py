@@ -0,0 +1,57 @@
+from whitespace.Constants_errors import WORD_TYPE, StackError
+
+from array import array
+from typing import Iterable, MutableSequence
+
+
+# Slide and copy for any stack: a Stack, the list bigint mode uses, or an array
+# a caller passed in. Both work in place, so the stack stays the same object.
+def stack_slide(stack: MutableSequence[int], num: int) -> None:
+    # When slide n off the stack, need n+1 to be there since we keep the top element
+    length = len(stack)
+    if length <= num + 1:
+        raise StackError(f"Cannot slide {num} from stack, it is only {length} long")
+    top = stack[-1]
+    del stack[length - num - 1:]
+    stack.append(top)
+
+
+def stack_copy(stack: MutableSequence[int], num: int) -> None:
+    if len(stack) <= num:
+        raise StackError(f"Cannot copy {num}th num from stack, it is only {len(stack)} long")
+    stack.append(stack[-num - 1])
+
+
+class Stack(array):
+    """The operand stack: an array of words (of typecode, WORD_TYPE by default) with in-place slide and copy.
+
+    Being an array, pushes and pops run in C and the buffer grows by
+    over-allocating, so it only reallocates now and then. Nothing ever
+    replaces the stack, so outside references (and the engines' bound
+    append/pop) stay valid. view() gives a zero-copy memoryview of the values,
+    bottom first; the stack cannot grow or shrink until it is released.
+    """
+    def __new__(cls, values: Iterable[int] = (), typecode: str = WORD_TYPE):
+        return super().__new__(cls, typecode, values)
+
+    def slide(self, num: int) -> None:
+        """Removes num values from under the top one; O(num)"""
+        stack_slide(self, num)
+
+    def copy(self, num: int) -> None:
+        """Pushes the value num below the top; O(1)"""
+        stack_copy(self, num)
+
+    def view(self) -> memoryview:
+        return memoryview(self)
+
+    def __reduce__(self):
+        return (Stack, (self.tolist(), self.typecode))
+
+    def __reduce_ex__(self, protocol):
+        return self.__reduce__()
+
+    def __repr__(self) -> str:
+        if self.typecode != WORD_TYPE:
+            return f"Stack({self.tolist()}, {self.typecode!r})"
+        return f"Stack({self.tolist()})"
@@ -0,0 +1,248 @@
+from whitespace.Program import Program, PUSH, DUPLICATE, SWAP, DISCARD, COPY, SLIDE
+from whitespace.Program import PLUS, MINUS, TIMES, INT_DIVIDE, MODULO
+from whitespace.Program import OUT_CHAR, OUT_NUM, READ_CHAR, READ_NUM
+from whitespace.Program import END, CALL_SUB, END_SUB, JUMP, JUMP_ZERO, JUMP_NEGATIVE
+from whitespace.Program import READ_HEAP, WRITE_HEAP
+from whitespace.Runtime import Runtime, PC_RUNNING, wrap
+from whitespace.Stack import Stack, stack_slide, stack_copy
+from whitespace.Fusion import Fused, OutString
+from whitespace.Constants_errors import StackError, CannotFindJumpTarget, LimitExceeded
+
+from functools import partial
+from typing import Callable
+import operator
+
+# A compiled instruction: runs it and returns the next PC (-1 to end)
+Closure = Callable[[], int]
+
+# Arithmetic opcodes, with their operation and the error for a short stack
+_ARITHMETIC: dict[int, tuple[Callable[[int, int], int], str]] = {
+    PLUS: (operator.add, "Need two elements to add"),
+    MINUS: (operator.sub, "Need two elements to subtract"),
+    TIMES: (operator.mul, "Need two elements to multiply"),
+    INT_DIVIDE: (operator.floordiv, "Need two elements to int divide"),
+    MODULO: (operator.mod, "Need two elements to modulo"),
+}
+
+
+def compile_closures(program: Program, runtime: Runtime, fused: dict[int, Fused | OutString] | None = None) -> list[Closure]:
+    """Compiles every instruction into a closure bound to the runtime's stack, heap and IO.
+
+    Behaves like Command.execute (same errors, same quirks). Superinstructions
+    and constant strings in fused (see Fusion.py) replace the instructions at their PCs.
+    """
+    ops = program.ops
+    args = program.args
+    targets = program.targets
+    code = [_bind(ops[pc], pc, args[pc], targets[pc], runtime) for pc in range(len(ops))]
+    for (pc, command) in (fused or {}).items():
+        code[pc] = command.bind(runtime)
+    return code
+
+
+def run_threaded(program: Program, runtime: Runtime, fused: dict[int, Fused | OutString] | None = None) -> None:
+    code = compile_closures(program, runtime, fused)
+    end = len(code)
+    pc = runtime.PC
+    steps = runtime.limits.steps
+    runtime.PC = PC_RUNNING
+    try:
+        if steps is None:
+            while 0 <= pc < end:
+                pc = code[pc]()
+        else:
+            # Instructions run by the closure at each PC
+            lengths = [1] * end
+            for (start, command) in (fused or {}).items():
+                lengths[start] = len(command.commands)
+            while 0 <= pc < end:
+                steps -= lengths[pc]
+                if steps < 0:
+                    raise LimitExceeded(f"Ran more than {runtime.limits.steps} instructions")
+                pc = code[pc]()
+    except BaseException:
+        # Fused commands record which of their instructions failed
+        if runtime.PC == PC_RUNNING:
+            runtime.PC = pc
+        raise
+    runtime.PC = pc
+
+
+# Builds the closure for one instruction. This is a function of its own so
+# every closure gets its own num/target/next cells.
+def _bind(op: int, pc: int, num: int, target: int, runtime: Runtime) -> Closure:
+    stack = runtime.stack
+    append = stack.append
+    pop = stack.pop
+    nxt = pc + 1
+    bits = runtime.wrap_bits
+
+    if op == PUSH:
+        if bits is not None:
+            num = wrap(num, bits)
+        def push() -> int:
+            append(num)
+            return nxt
+        return push
+
+    elif op == DUPLICATE:
+        def duplicate() -> int:
+            try:
+                append(stack[-1])
+            except IndexError:
+                raise StackError("Empty runtime.stack") from None
+            return nxt
+        return duplicate
+
+    elif op == SWAP:
+        def swap() -> int:
+            if len(stack) < 2:
+                raise StackError("Need two items on the runtime.stack to swap")
+            stack[-1], stack[-2] = stack[-2], stack[-1]
+            return nxt
+        return swap
+
+    elif op == DISCARD:
+        def discard() -> int:
+            try:
+                pop()
+            except IndexError:
+                raise StackError("Cannot discard on empty runtime.stack") from None
+            return nxt
+        return discard
+
+    elif op == COPY:
+        copy_num = stack.copy if isinstance(stack, Stack) else partial(stack_copy, stack)
+        def copy() -> int:
+            copy_num(num)
+            return nxt
+        return copy
+
+    elif op == SLIDE:
+        slide_num = stack.slide if isinstance(stack, Stack) else partial(stack_slide, stack)
+        def slide() -> int:
+            slide_num(num)
+            return nxt
+        return slide
+
+    elif op in _ARITHMETIC:
+        (operation, message) = _ARITHMETIC[op]
+        if bits is not None:
+            def wrapping() -> int:
+                if len(stack) < 2:
+                    raise StackError(message)
+                second = pop()
+                value = operation(pop(), second)
+                try:
+                    append(value)
+                except OverflowError:
+                    append(wrap(value, bits))
+                return nxt
+            return wrapping
+        def arithmetic() -> int:
+            if len(stack) < 2:
+                raise StackError(message)
+            second = pop()
+            append(operation(pop(), second))
+            return nxt
+        return arithmetic
+
+    elif op == OUT_CHAR or op == OUT_NUM:
+        write = runtime.output.write_char if op == OUT_CHAR else runtime.output.write_num
+        def out() -> int:
+            try:
+                value = pop()
+            except IndexError:
+                raise StackError("Empty runtime.stack") from None
+            write(value)
+            return nxt
+        return out
+
+    elif op == READ_CHAR:
+        read = runtime.input.read_char
+        heap_write = runtime.heap.write
+        def read_char() -> int:
+            if len(stack) == 0:
+                raise StackError("Empty runtime.stack")
+            # If a Ctrl-D is input, that should be interpreted as a null
+            heap_write(pop(), read())
+            return nxt
+        return read_char
+
+    elif op == READ_NUM:
+        read = runtime.input.read_num
+        heap_write = runtime.heap.write
+        def read_num() -> int:
+            if len(stack) == 0:
+                raise StackError("Empty runtime.stack")
+            read_int = read()
+            if bits is not None:
+                read_int = wrap(read_int, bits)
+            heap_write(pop(), read_int)
+            return nxt
+        return read_num
+
+    elif op == END:
+        return lambda: -1
+
+    elif op == CALL_SUB:
+        callstack_append = runtime.callstack.append
+        def call_sub() -> int:
+            if target == -1:
+                raise CannotFindJumpTarget("This node was not visited, doesn't have the target PC")
+            callstack_append(pc)
+            return target
+        return call_sub
+
+    elif op == END_SUB:
+        callstack_pop = runtime.callstack.pop
+        def end_sub() -> int:
+            try:
+                return callstack_pop()
+            except IndexError:
+                raise StackError("Callstack is empty, yet a end subroutine is desired") from None
+        return end_sub
+
+    elif op == JUMP:
+        return lambda: target
+
+    elif op == JUMP_ZERO:
+        def jump_zero() -> int:
+            try:
+                top = stack[-1]
+            except IndexError:
+                raise StackError("Stack is empty, yet a jump if top of stack is 0 is desired") from None
+            return target if top == 0 else nxt
+        return jump_zero
+
+    elif op == JUMP_NEGATIVE:
+        def jump_negative() -> int:
+            try:
+                top = stack[-1]
+            except IndexError:
+                raise StackError("Stack is empty, yet a jump if top of stack is negative is desired") from None
+            return target if top < 0 else nxt
+        return jump_negative
+
+    elif op == READ_HEAP:
+        heap_read = runtime.heap.read
+        def read_heap() -> int:
+            try:
+                addr = pop()
+            except IndexError:
+                raise StackError("Need one runtime.stack elements to heap read") from None
+            append(heap_read(addr))
+            return nxt
+        return read_heap
+
+    elif op == WRITE_HEAP:
+        heap_write = runtime.heap.write
+        def write_heap() -> int:
+            if len(stack) < 2:
+                raise StackError("Need two elements to heap write")
+            value = pop()
+            heap_write(pop(), value)
+            return nxt
+        return write_heap
+
+    raise ValueError(f"Unknown opcode {op} at PC {pc}")
@@ -1,5 +1,13 @@
 from whitespace.colours import TerminalColors
 from enum import Enum
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import mmap
+import os
+import re
+from typing import BinaryIO
+from array import array
+from bisect import bisect_left, bisect_right
 
 
 class TokenType(Enum):
@@ -34,57 +42,241 @@ class Token():
         return f"Token {self.type} at {self.line}"
 
 
+# Compact token codes produced by the Tokenizer. They match the TokenType
+# values, so TokenType(code) gives back the enum member.
+TAB = TokenType.TAB.value
+SPACE = TokenType.SPACE.value
+LINEFEED = TokenType.LINEFEED.value
+EOF = TokenType.EOF.value
+
+# Maps source whitespace to token codes; every other byte is a comment and is
+# dropped in bulk by bytes.translate
+_CODE_TABLE = bytes.maketrans(b" \t\n", bytes([SPACE, TAB, LINEFEED]))
+_COMMENT_BYTES = bytes(b for b in range(256) if b not in b" \t\n")
+_LINEFEED_CODE = bytes([LINEFEED])
+
+_READABLE_TOKENS = ((b"[Space]", SPACE), (b"[Tab]", TAB), (b"[LF]", LINEFEED))
+_LONGEST_READABLE_TOKEN = max(len(lexeme) for (lexeme, _) in _READABLE_TOKENS)
+
+
+# Size of the blocks in which source files are read
+CHUNK_SIZE = 1 << 20
+
+
+# Finds readable tokens, and the newlines between them (for line numbers)
+_READABLE_PATTERN = re.compile(rb"\[Space\]|\[Tab\]|\[LF\]|\n")
+_READABLE_TOKEN_PATTERN = re.compile(rb"\[Space\]|\[Tab\]|\[LF\]")
+_NEWLINE_PATTERN = re.compile(rb"\n")
+
+
+def scan_readable(data: bytes, codes: bytearray, breaks: array) -> None:
+    """Scan readable-mode source into token codes, appending to codes.
+
+    For each newline of the source, appends to breaks the token index at
+    which it was found (used to recover line numbers).
+    """
+    # One regex pass keeps only the tokens and newlines; the tokens are then
+    # swapped for their codes, leaving newlines in place
+    tokens = b"".join(_READABLE_PATTERN.findall(data))
+    for (lexeme, code) in _READABLE_TOKENS:
+        tokens = tokens.replace(lexeme, bytes([code]))
+
+    offset = len(codes)
+    for (newlines_before, match) in enumerate(_NEWLINE_PATTERN.finditer(tokens)):
+        breaks.append(offset + match.start() - newlines_before)
+    codes += tokens.replace(b"\n", b"")
+
+
+class SourceScanner():
+    """Turns source bytes, fed one chunk at a time, into token codes.
+
+    Both the normal-mode and readable-mode codes are built in the same pass,
+    since the mode is only known once a readable token is seen; the
+    normal-mode codes are dropped as soon as readable mode is detected.
+    """
+    def __init__(self, detect_readable: bool):
+        self.detect_readable = detect_readable
+        self.normal_codes = bytearray()
+        self.readable_codes = bytearray()
+        self.breaks = array('l')
+        self.readable_found = False
+        # Newlines before the first readable token (breaks at token index 0)
+        self._leading_breaks = 0
+        # End of the previous chunk that may be the start of a readable token
+        self._tail = b""
+
+    def feed(self, chunk: bytes) -> None:
+        if not (self.readable_found and self.detect_readable):
+            self.normal_codes += chunk.translate(_CODE_TABLE, _COMMENT_BYTES)
+        if self.readable_found and not self.detect_readable:
+            # Only needed to know whether to warn
+            return
+
+        data = self._tail + chunk
+        bracket = data.rfind(b"[", max(0, len(data) - _LONGEST_READABLE_TOKEN + 1))
+        if bracket != -1 and any(lexeme.startswith(data[bracket:]) and len(data) - bracket < len(lexeme)
+                                 for (lexeme, _) in _READABLE_TOKENS):
+            self._tail = data[bracket:]
+            data = data[:bracket]
+        else:
+            self._tail = b""
+
+        if not self.readable_found:
+            # Until a readable token shows up, only newlines need counting
+            first = _READABLE_TOKEN_PATTERN.search(data)
+            if first is None:
+                self._leading_breaks += data.count(b"\n")
+                return
+            self.readable_found = True
+            if not self.detect_readable:
+                return
+            self.normal_codes = bytearray()
+            self._leading_breaks += data.count(b"\n", 0, first.start())
+            data = data[first.start():]
+
+        scan_readable(data, self.readable_codes, self.breaks)
+
+    def feedFile(self, file: BinaryIO) -> None:
+        while True:
+            chunk = file.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            self.feed(chunk)
+
+    def finish(self) -> tuple[bytes, array | None]:
+        """Returns the token codes, and the newline breaks in readable mode (None otherwise)"""
+        # A leftover tail is an unfinished token, ie just a comment
+        self._tail = b""
+        if self.readable_found and self.detect_readable:
+            breaks = array('l', [0]) * self._leading_breaks
+            breaks.extend(self.breaks)
+            return bytes(self.readable_codes), breaks
+        return bytes(self.normal_codes), None
+
+
+# Smallest slice of a file that is worth handing to another process
+MIN_SHARD_SIZE = 8 << 20
+
+
+# Tokenizes bytes start to end of a file, in the given mode. Runs in a worker
+# process; breaks are relative to the shard's first token.
+def _scan_shard(path: str, start: int, end: int, readable: bool) -> tuple[bytes, array | None]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    if readable:
+        codes = bytearray()
+        breaks = array('l')
+        scan_readable(data, codes, breaks)
+        return bytes(codes), breaks
+    return data.translate(_CODE_TABLE, _COMMENT_BYTES), None
+
+
+def scan_file_parallel(path: str, detect_readable: bool, jobs: int) -> tuple[bytes, array | None, bool]:
+    """Tokenizes a file by splitting it across a pool of processes.
+
+    Returns the codes, the newline breaks in readable mode (None otherwise),
+    and whether any readable token was found.
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return b"", None, False
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            readable_found = any(mm.find(lexeme) != -1 for (lexeme, _) in _READABLE_TOKENS)
+            # Shards end just after a newline, so no readable token is split
+            shard_size = max(MIN_SHARD_SIZE, size // (jobs * 4) + 1)
+            bounds = [0]
+            while bounds[-1] < size:
+                newline = mm.find(b"\n", bounds[-1] + shard_size)
+                bounds.append(size if newline == -1 else newline + 1)
+    readable = readable_found and detect_readable
+
+    if len(bounds) == 2:
+        # Too small to be worth starting processes
+        shards = [_scan_shard(path, 0, size, readable)]
+        return shards[0] + (readable_found,)
+
+    codes = bytearray()
+    breaks = array('l') if readable else None
+    with ProcessPoolExecutor(jobs) as pool:
+        for (shard_codes, shard_breaks) in pool.map(_scan_shard, repeat(path), bounds[:-1], bounds[1:], repeat(readable)):
+            if breaks is not None:
+                breaks.extend(map(len(codes).__add__, shard_breaks))
+            codes += shard_codes
+    return bytes(codes), breaks, readable_found
+
+
 # In this context, a BasicToken is space, tab, or linefeed
 class Tokenizer():
-    def __init__(self, text: str, detect_readable: bool):
-        self.text = text
-        self.index = 0
-        self.line = 1
-        if detect_readable:
-            self.readable_mode = text.count("[Space]") > 0 or text.count("[Tab]") > 0 or text.count("[LF]") > 0
+    # With jobs > 1 and a source file on disk, the file is tokenized by that many processes
+    def __init__(self, source: str | bytes | BinaryIO, detect_readable: bool, jobs: int = 1):
+        path = getattr(source, "name", None)
+        if jobs > 1 and isinstance(path, str) and os.path.isfile(path):
+            (codes, breaks, readable_found) = scan_file_parallel(path, detect_readable, jobs)
         else:
+            scanner = SourceScanner(detect_readable)
+            if isinstance(source, str):
+                scanner.feed(source.encode("utf-8"))
+            elif isinstance(source, (bytes, bytearray, memoryview)):
+                scanner.feed(bytes(source))
+            else:
+                # Read the file in chunks, so the whole source is never held in memory
+                scanner.feedFile(source)
+            (codes, breaks) = scanner.finish()
+            readable_found = scanner.readable_found
+
+        self.index = 0
+        self.read_eof = False
+        # codes holds one byte per token. In readable mode, breaks holds the
+        # token index of every newline; in normal mode, lines are counted from
+        # the linefeed tokens themselves.
+        self.codes = codes
+        self.breaks = breaks
+        self.readable_mode = self.breaks is not None
+        if readable_found and not detect_readable:
             # Still do the check, to issue a warning
-            if text.count("[Space]") > 0 or text.count("[Tab]") > 0 or text.count("[LF]") > 0:
-                print(TerminalColors.WARNING + 
-                      "WARNING: readable mode disabled, but at least one instance of [Space], [Tab], or [LF] detected." +
-                      TerminalColors.ENDC)
- 
-            self.readable_mode = False
-
-    def returnNextToken(self):
-        self.index += 1
-        return self.nextToken()
-    
+            print(TerminalColors.WARNING + 
+                  "WARNING: readable mode disabled, but at least one instance of [Space], [Tab], or [LF] detected." +
+                  TerminalColors.ENDC)
+        self._counted_index = 0
+        self._counted_lines = 0
+
+    def lineAt(self, index: int) -> int:
+        """Line of the token at the given index of self.codes"""
+        if self.breaks is not None:
+            return bisect_right(self.breaks, index) + 1
+
+        # Lines are mostly asked for in increasing order, so keep a running count
+        if index < self._counted_index:
+            self._counted_index = 0
+            self._counted_lines = 0
+        self._counted_lines += self.codes.count(_LINEFEED_CODE, self._counted_index, index)
+        self._counted_index = index
+        return self._counted_lines + 1
+
+    @property
+    def line(self) -> int:
+        """Current line of the tokenizer, ie the line after the last token read"""
+        if self.breaks is not None:
+            if self.read_eof:
+                return len(self.breaks) + 1
+            return bisect_left(self.breaks, self.index) + 1
+        return self.lineAt(self.index)
+
+    def nextCode(self) -> int:
+        index = self.index
+        if index >= len(self.codes):
+            self.read_eof = True
+            return EOF
+        self.index = index + 1
+        return self.codes[index]
+
     def nextToken(self) -> Token:
-        if self.index >= len(self.text):
+        code = self.nextCode()
+        if code == EOF:
             return Token(TokenType.EOF, self.line)
-        if self.readable_mode:
-            if self.text[self.index] == '[':
-                end_index = self.text.index("]", self.index)
-                type = TokenType.fromString(self.text[self.index:end_index+1])
-                if type == None:
-                    return self.returnNextToken()
-                self.index = end_index + 1
-                return Token(type, self.line)
-            elif self.text[self.index] == "\n":
-                self.line += 1
-                return self.returnNextToken()
-            else:
-                return self.returnNextToken()
-        else:
-            lexeme = self.text[self.index]
-
-            if lexeme in [' ', '\t', '\n']:
-                type = TokenType.fromString(lexeme)
-                self.index += 1
-                if lexeme == '\n':
-                    self.line += 1
-                    return Token(type, self.line - 1)
-                if type == None:
-                    return self.returnNextToken()
-                return Token(type, self.line)
-            else:
-                return self.returnNextToken()
+        return Token(TokenType(code), self.lineAt(self.index - 1))
     
     def allTokens(self) -> list[Token]:
         out: list[Token] = []
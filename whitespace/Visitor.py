@@ -1,42 +1,258 @@
-from whitespace.Commands import Command, CallSub, Jump, JumpNegative, JumpZero
-from whitespace.Commands import Push, OutNum, OutChar, Discard
-from whitespace.Constants_errors import DuplicateLabels
-
-def visit_flow_control(prog: list[Command]) -> None:
-    # Maps the label to command index (ie where the PC has to go to)
-    labels: dict[int, int] = {}
-
-    # Do first pass, finding all labels
-    for (idx, command) in enumerate(prog):
-        label = command.label
-        if label != -1 and label in labels:
-            raise DuplicateLabels(f"Label {label} appears both at command {command} (location {idx}) and at location {labels[label]}")
-        
-        labels[label] = idx
-    
-    for command in prog:
-        if isinstance(command, CallSub):
-            command.target_pc = labels[command.target_label]
-        elif isinstance(command, Jump):
-            command.target_pc = labels[command.target_label]
-        elif isinstance(command, JumpZero):
-            command.target_pc = labels[command.target_label]
-        elif isinstance(command, JumpNegative):
-            command.target_pc = labels[command.target_label]
-
-def visit_asm_generation(prog: list[Command]) -> str:
+from whitespace.Program import Program, BRANCH_OPS, PUSH, OUT_CHAR, DISCARD
+from whitespace.Program import PLUS, MINUS, TIMES, INT_DIVIDE, MODULO, JUMP, JUMP_ZERO, JUMP_NEGATIVE
+from whitespace.Constants_errors import DuplicateLabels, CannotFindJumpTarget, WORD_TYPE
+from whitespace.Runtime import INT_MODES, wrap
+
+from array import array
+from typing import Callable
+import operator
+import sys
+
+# Fills in branch targets, given where each label is marked and the PCs of the
+# branches to each label. duplicate is the PC of the first label marked twice,
+# if any. Errors are not raised here but kept on the program, so that parsing
+# can finish; visit_flow_control raises them.
+def resolve_labels(prog: Program, label_pcs: dict[int, int], references: dict[int, list[int]], duplicate: int = -1) -> None:
+    lines = prog.lines
+    error: Exception | None = None
+    if duplicate != -1:
+        label = prog.labels[duplicate]
+        first = label_pcs[label]
+        error = DuplicateLabels(f"Label {label} appears both at command {prog[duplicate]} (location {duplicate}, line {lines[duplicate]}) and at location {first} (line {lines[first]})")
+
+    targets = prog.targets
+    for (label, pcs) in references.items():
+        target = label_pcs.get(label, -1)
+        if target == -1 and error is None:
+            error = CannotFindJumpTarget(f"Label {label} used by command {prog[pcs[0]]} (location {pcs[0]}, line {lines[pcs[0]]}) is never marked")
+        for pc in pcs:
+            targets[pc] = target
+
+    prog.label_error = error
+    prog.resolved = True
+    prog.code_cache.clear()
+
+def visit_flow_control(prog: Program) -> None:
+    # The parser resolves labels as it goes, so this only walks programs built some other way
+    if not prog.resolved:
+        # Maps the label to command index (ie where the PC has to go to)
+        labels: dict[int, int] = {}
+        references: dict[int, list[int]] = {}
+        duplicate = -1
+
+        for (idx, label) in enumerate(prog.labels):
+            if label != -1:
+                if label not in labels:
+                    labels[label] = idx
+                elif duplicate == -1:
+                    duplicate = idx
+
+        args = prog.args
+        for (idx, op) in enumerate(prog.ops):
+            if op in BRANCH_OPS:
+                references.setdefault(args[idx], []).append(idx)
+
+        resolve_labels(prog, labels, references, duplicate)
+
+    if prog.label_error is not None:
+        raise prog.label_error
+
+# An instruction as the optimizer sees it: (opcode, argument, label, line)
+Instruction = tuple[int, int, int, int]
+# An optimization pass rewrites the instructions of a program run with an int mode (see --int-mode)
+Pass = Callable[[list[Instruction], str | None], list[Instruction]]
+
+# Folding must give the number the stack would have held, and not create one it
+# could not hold or remove a push that would have overflowed it
+def _word(int_mode: str | None) -> Callable[[int], int | None]:
+    """How the stack holds a number in the int mode: the number it holds, or None if it overflows"""
+    (typecode, wraps) = INT_MODES[int_mode] if int_mode is not None else (WORD_TYPE, False)
+    if typecode is None:
+        return lambda num: num
+    bits = array(typecode).itemsize * 8
+    if wraps:
+        return lambda num: wrap(num, bits)
+    (low, high) = (-(1 << (bits - 1)), (1 << (bits - 1)) - 1)
+    return lambda num: num if low <= num <= high else None
+
+_FOLDABLE: dict[int, Callable[[int, int], int]] = {
+    PLUS: operator.add, MINUS: operator.sub, TIMES: operator.mul,
+    INT_DIVIDE: operator.floordiv, MODULO: operator.mod,
+}
+
+# Instructions from start up to end can be removed if nothing jumps past the
+# first of them, and its label (if any) can move to the instruction after them
+def _removable(instructions: list[Instruction], start: int, end: int) -> bool:
+    if any(instructions[i][2] != -1 for i in range(start + 1, end)):
+        return False
+    return instructions[start][2] == -1 or (end < len(instructions) and instructions[end][2] == -1)
+
+# Removes instructions from start up to end, moving the label of the first onto the next one
+def _remove(instructions: list[Instruction], start: int, end: int) -> None:
+    label = instructions[start][2]
+    del instructions[start:end]
+    if label != -1:
+        (op, arg, _, line) = instructions[start]
+        instructions[start] = (op, arg, label, line)
+
+def fold_constants(instructions: list[Instruction], int_mode: str | None = None) -> list[Instruction]:
+    """Push a; Push b; <arithmetic> becomes Push (a <arithmetic> b)"""
+    word = _word(int_mode)
+    out = list(instructions)
+    i = 0
+    while i + 2 < len(out):
+        ((first, a, label, line), (second, b, second_label, _), (op, _, op_label, _)) = out[i:i + 3]
+        if first == PUSH and second == PUSH and op in _FOLDABLE and second_label == -1 and op_label == -1:
+            (a, b) = (word(a), word(b))
+            value = None
+            if a is not None and b is not None and not (op in (INT_DIVIDE, MODULO) and b == 0):
+                value = word(_FOLDABLE[op](a, b))
+            if value is not None:
+                out[i:i + 3] = [(PUSH, value, label, line)]
+                # The result may fold with the push before it
+                i = max(i - 1, 0)
+                continue
+        i += 1
+    return out
+
+def remove_push_discard(instructions: list[Instruction], int_mode: str | None = None) -> list[Instruction]:
+    """Push n; Discard does nothing"""
+    word = _word(int_mode)
+    out = list(instructions)
+    i = 0
+    while i + 1 < len(out):
+        (op, num, _, _) = out[i]
+        if op == PUSH and out[i + 1][0] == DISCARD and word(num) is not None and _removable(out, i, i + 2):
+            _remove(out, i, i + 2)
+            # The pair may have separated another push from its discard
+            i = max(i - 1, 0)
+        else:
+            i += 1
+    return out
+
+def thread_jumps(instructions: list[Instruction], int_mode: str | None = None) -> list[Instruction]:
+    """Branches to a jump go straight to its target; jumps to the next instruction are removed"""
+    labels = {label: i for (i, (_, _, label, _)) in enumerate(instructions) if label != -1}
+    out = list(instructions)
+    for (i, (op, target, label, line)) in enumerate(out):
+        if op in BRANCH_OPS:
+            seen = {target}
+            while target in labels and out[labels[target]][0] == JUMP and out[labels[target]][1] not in seen:
+                target = out[labels[target]][1]
+                seen.add(target)
+            out[i] = (op, target, label, line)
+
+    i = 0
+    while i < len(out):
+        (op, target, _, _) = out[i]
+        if op == JUMP and i + 1 < len(out) and out[i + 1][2] == target and _removable(out, i, i + 1):
+            _remove(out, i, i + 1)
+        else:
+            i += 1
+    return out
+
+def simplify_branches(instructions: list[Instruction], int_mode: str | None = None) -> list[Instruction]:
+    """Conditional branches right after a push always go the same way: Push n; JumpZero
+    becomes Push n; Jump if n is 0, and just Push n otherwise (the branch does not pop)"""
+    word = _word(int_mode)
+    out = list(instructions)
+    i = 1
+    while i < len(out):
+        (op, target, label, line) = out[i]
+        (previous, num, _, _) = out[i - 1]
+        if previous == PUSH and label == -1 and op in (JUMP_ZERO, JUMP_NEGATIVE) and word(num) is not None:
+            num = word(num)
+            taken = num == 0 if op == JUMP_ZERO else num < 0
+            if taken:
+                out[i] = (JUMP, target, label, line)
+            else:
+                del out[i]
+                continue
+        i += 1
+    return out
+
+# Passes run at each optimization level (-O)
+OPTIMIZATION_LEVELS: dict[int, tuple[Pass, ...]] = {
+    0: (),
+    1: (remove_push_discard, thread_jumps),
+    2: (fold_constants, simplify_branches, remove_push_discard, thread_jumps),
+}
+
+def visit_optimize(prog: Program, level: int = 2, int_mode: str | None = None) -> Program:
+    """Returns a resolved copy of the program with the passes of the level applied, until they change nothing.
+
+    The program keeps doing what it did when run with the int mode (see --int-mode).
+    """
+    visit_flow_control(prog)
+    passes = OPTIMIZATION_LEVELS[level]
+    if not passes:
+        return prog
+
+    instructions = list(zip(prog.ops, prog.args, prog.labels, prog.lines))
+    while True:
+        before = instructions
+        for optimization in passes:
+            instructions = optimization(instructions, int_mode)
+        if instructions == before:
+            break
+
+    optimized = Program()
+    for (op, arg, label, line) in instructions:
+        optimized.append(op, line, arg, label)
+    visit_flow_control(optimized)
+    return optimized
+
+def find_constant_strings(prog: Program, start: int = 0, stop: int | None = None) -> dict[int, tuple[int, str]]:
+    """Runs of Push c; OutChar (c being a character) from start up to stop that nothing jumps
+    into past the start, by the PC they start at, with the PC after them and the text they write"""
+    ops = prog.ops
+    args = prog.args
+    labels = prog.labels
+    stop = len(ops) if stop is None else stop
+    strings = {}
+    pc = start
+    while pc + 1 < stop:
+        end = pc
+        while (end + 1 < stop and ops[end] == PUSH and ops[end + 1] == OUT_CHAR and 0 <= args[end] <= sys.maxunicode
+               and (end == pc or labels[end] == -1) and labels[end + 1] == -1):
+            end += 2
+        if end > pc:
+            strings[pc] = (end, "".join(chr(args[i]) for i in range(pc, end, 2)))
+            pc = end
+        else:
+            pc += 1
+    return strings
+
+def visit_asm_generation(prog: Program) -> str:
     assembly = "global _start\nsection .text\n_start:\n"
+    # Each constant string is written with one syscall, from the data section
+    strings = find_constant_strings(prog)
+    data = ""
 
-    for command in prog:
-        if isinstance(command, Push):
-            assembly += "  push " + str(command.num) + "\n"
-        elif isinstance(command, OutChar):
+    pc = 0
+    while pc < len(prog):
+        (op, arg) = (prog.ops[pc], prog.args[pc])
+        if pc in strings:
+            (end, text) = strings[pc]
+            # OutChar writes the low byte of the character
+            data += f"string_{pc}: db " + ", ".join(str(ord(char) & 0xFF) for char in text) + "\n"
+            assembly += "  mov rax, 1        ; write (\n"
+            assembly += "  mov rdi, 1        ; STDOUT_FILENO,\n"
+            assembly += f"  mov rsi, string_{pc} ; {text!r},\n"
+            assembly += f"  mov rdx, {len(text)}        ; {len(text)}\n"
+            assembly += "  syscall           ; );\n"
+            pc = end
+            continue
+        pc += 1
+        if op == PUSH:
+            assembly += "  push " + str(arg) + "\n"
+        elif op == OUT_CHAR:
             assembly += "  mov rax, 1        ; write (\n"
             assembly += "  mov rdi, 1        ; STDOUT_FILENO,\n"
             assembly += "  mov rsi, rsp      ; &top_of_stack,\n"
             assembly += "  mov rdx, 1        ; 1\n"
             assembly += "  syscall           ; );\n"
-        elif isinstance(command, Discard):
+        elif op == DISCARD:
             assembly += "  pop rax           ; pop off the top of the stack, into rax since we don't care where it goes (and we aren't storing rax anyhow) \n"
     
     # Add exit syscall
@@ -45,5 +261,7 @@ def visit_asm_generation(prog: list[Command]) -> str:
     assembly += "  mov rdi, 0     ;   EXIT_SUCCESS\n"
     assembly += "  syscall        ; );\n"
 
+    if data:
+        assembly += "section .rodata\n" + data
 
     return assembly
@@ -0,0 +1,122 @@
+from whitespace.Api import CompiledProgram, MAP_WINDOW
+from whitespace.Runner import ENGINES
+from whitespace.Runtime import Limits
+from whitespace.Constants_errors import LimitExceeded, StackError
+
+import unittest
+import io
+import itertools
+import os
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), "..", "..", "examples")
+
+COUNTDOWN = ("[Space][Space][Space][Tab][Space][Tab][Space][LF] push 10\n"
+             + "[LF][Space][Space][Tab][LF] mark label 1\n"
+             + "[Space][LF][Space] duplicate\n"
+             + "[Tab][LF][Space][Tab] output number\n"
+             + "[Space][Space][Space][Tab][LF] push 1\n"
+             + "[Tab][Space][Space][Tab] subtract\n"
+             + "[Space][LF][Space] duplicate\n"
+             + "[LF][Tab][Space][Space][LF] jump to label 0 if zero\n"
+             + "[LF][Space][LF][Tab][LF] jump to label 1\n"
+             + "[LF][Space][Space][Space][LF] mark label 0\n"
+             + "[LF][LF][LF] end\n")
+
+
+class TestApi(unittest.TestCase):
+    def test_run_many(self):
+        program = CompiledProgram.fromFile(os.path.join(EXAMPLES, "cat.ws"), True, use_cache=False)
+        for engine in ENGINES:
+            for text in ("meow\n", "héllo", ""):
+                state = program.run(text, engine=engine)
+                self.assertTrue(state.ok)
+                self.assertEqual(text + "\0", state.output)
+            state = program.run(b"purr", engine=engine)
+            self.assertEqual("purr\0", state.output)
+            # Output goes to stdout when given
+            stdout = io.StringIO()
+            self.assertIsNone(program.run("hiss", stdout, engine=engine).output)
+            self.assertEqual("hiss\0", stdout.getvalue())
+
+    def test_map(self):
+        program = CompiledProgram.fromFile(os.path.join(EXAMPLES, "cat.ws"), True, use_cache=False)
+        inputs = [f"input {i}\n" * (i % 7) for i in range(200)]
+        for engine in ENGINES:
+            states = list(program.map(inputs, 8, engine=engine))
+            self.assertEqual([text + "\0" for text in inputs], [state.output for state in states])
+        state = next(program.map([b"x" * 100], limits=Limits(steps=50)))
+        self.assertIsInstance(state.error, LimitExceeded)
+
+        # The code is compiled before the first exit state is asked for, inputs are taken
+        # a few at a time, and closing stops taking them
+        program = CompiledProgram.fromSource(COUNTDOWN, True)
+        taken = []
+        states = program.map((taken.append(i) or "" for i in itertools.count()), 2)
+        self.assertTrue(program._program.code_cache)
+        self.assertEqual([], taken)
+        self.assertEqual("10987654321", next(states).output)
+        self.assertLessEqual(len(taken), 2 * MAP_WINDOW)
+        states.close()
+        self.assertLessEqual(len(taken), 2 * MAP_WINDOW)
+
+    def test_prepare(self):
+        # Runs compile what they need through prepare, once for each engine, int mode and step limit
+        program = CompiledProgram.fromSource(COUNTDOWN, True)
+        prepared = []
+        prepare = program.prepare
+        program.prepare = lambda *args: prepared.append(args) or prepare(*args)
+        for _ in range(3):
+            for engine in ENGINES:
+                program.run(engine=engine)
+                program.run(engine=engine, int_mode="wrap32")
+                program.run(engine=engine, limits=Limits(steps=100))
+        self.assertEqual(4, len(prepared))
+        self.assertEqual(4, len(program._prepared))
+        self.assertEqual(4, len(program._program.code_cache))
+
+    def test_errors(self):
+        state = CompiledProgram.fromSource("[Space][LF][Space] duplicate\n", True).run()
+        self.assertFalse(state.ok)
+        self.assertIsInstance(state.error, StackError)
+        self.assertEqual(0, state.pc)
+
+    def test_limits(self):
+        program = CompiledProgram.fromSource(COUNTDOWN, True)
+        for engine in ENGINES:
+            self.assertEqual("10987654321", program.run(engine=engine).output)
+            state = program.run(engine=engine, limits=Limits(steps=20))
+            self.assertIsInstance(state.error, LimitExceeded)
+            # Stopped before the 21st instruction (the JIT stops between blocks), with
+            # the whole stack on the stack; branches don't pop, so the counts pile up
+            self.assertTrue("10987654321".startswith(state.output))
+            self.assertEqual([9, 8], list(state.stack)[:2])
+            if engine == "loop":
+                self.assertEqual(("1098", [9, 8, 7, 7], 6), (state.output, list(state.stack), state.pc))
+            state = program.run(engine=engine, limits=Limits(output=5))
+            self.assertIsInstance(state.error, LimitExceeded)
+            self.assertEqual("10987", state.output)
+
+    def test_int_mode(self):
+        overflow = ("[Space][Space][Space][Tab]" + "[Tab]" * 30 + "[LF] push 2147483647\n"
+                    + "[Space][Space][Space][Tab][LF] push 1\n"
+                    + "[Tab][Space][Space][Space] add\n"
+                    + "[Tab][LF][Space][Tab] output number\n"
+                    + "[LF][LF][LF] end\n")
+        self.assertEqual("2147483648", CompiledProgram.fromSource(overflow, True).run().output)
+        # Runs use the mode the program was built for, which is all an optimized program may use
+        for optimize in (0, 2):
+            program = CompiledProgram.fromSource(overflow, True, optimize, "wrap32")
+            self.assertEqual("-2147483648", program.run().output)
+            self.assertEqual("-2147483648", next(program.map([""])).output)
+        self.assertEqual("2147483648", CompiledProgram.fromSource(overflow, True, 0, "wrap32").run(int_mode="bigint").output)
+        for mode in ("wrap64", "bigint"):
+            with self.assertRaises(ValueError):
+                program.run(int_mode=mode)
+            with self.assertRaises(ValueError):
+                program.map([""], int_mode=mode)
+        with self.assertRaises(ValueError):
+            CompiledProgram.fromSource(overflow, True, 2).run(int_mode="wrap32")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+from whitespace.Batch import read_manifest, run_batch
+from whitespace.Runtime import Limits
+
+import unittest
+import json
+import os
+import shutil
+import tempfile
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), "..", "..", "examples")
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        shutil.copy(os.path.join(EXAMPLES, "cat.ws"), self.directory)
+        lines = ["# cat echoes its input, then a null", ""]
+        for i in range(20):
+            self.write(f"in{i}", f"case {i}\n")
+            self.write(f"out{i}", f"case {i}\n\0" if i != 3 else "wrong")
+            lines.append(json.dumps({"program": "cat.ws", "input": f"in{i}", "expected": f"out{i}"}))
+        lines.append(json.dumps({"program": "cat.ws"}))
+        lines.append(json.dumps({"program": "missing.ws"}))
+        self.write("manifest.jsonl", "\n".join(lines) + "\n")
+        self.manifest = os.path.join(self.directory, "manifest.jsonl")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name: str, text: str) -> None:
+        with open(os.path.join(self.directory, name), "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+
+    def test_manifest(self):
+        cases = read_manifest(self.manifest)
+        self.assertEqual(22, len(cases))
+        self.assertEqual(os.path.join(self.directory, "in0"), cases[0].input)
+        self.assertIsNone(cases[20].expected)
+        self.write("bad.jsonl", '{"input": "in0"}\n')
+        self.assertRaisesRegex(ValueError, "line 1", lambda: read_manifest(os.path.join(self.directory, "bad.jsonl")))
+
+    def test_run_batch(self):
+        cases = read_manifest(self.manifest)
+        for jobs in (1, 2):
+            results = list(run_batch(cases, jobs, loose=True, use_cache=False))
+            self.assertEqual(list(range(22)), [result["case"] for result in results])
+            statuses = [result["status"] for result in results]
+            self.assertEqual(["pass"] * 3 + ["fail"] + ["pass"] * 16 + ["ok", "error"], statuses)
+            self.assertEqual("case 3\n\0", results[3]["output"])
+            self.assertEqual("\0", results[20]["output"])
+            self.assertIn("FileNotFoundError", results[21]["error"])
+
+        results = list(run_batch(cases[:1], 1, loose=True, use_cache=False, limits=Limits(steps=5)))
+        self.assertEqual("error", results[0]["status"])
+        self.assertIn("LimitExceeded", results[0]["error"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+from whitespace import Cache
+from whitespace.Runner import load, load_file
+
+import unittest
+import tempfile
+import os
+
+
+class TestCache(unittest.TestCase):
+    source = ("[LF][Space][Space][Tab][LF] mark label 1\n"
+              + "[Space][Space][Space][Tab][Space][LF] push 2\n"
+              + "[LF][Space][LF][Tab][LF] jump to label 1\n")
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "program.ws")
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(self.source)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        program = load_file(self.path, detect_readable=True)
+        self.assertTrue(os.path.exists(Cache.cache_path(self.path)))
+
+        key = Cache.source_key(self.path, True)
+        cached = Cache.read(self.path, True, key)
+        self.assertEqual(program, cached)
+        self.assertEqual(0, cached.targets[1])
+
+    def test_large_numbers(self):
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write("[Space][Space][Space]" + "[Tab]" * 80 + "[LF]")
+        load_file(self.path, detect_readable=True)
+        cached = load_file(self.path, detect_readable=True)
+        self.assertEqual((1 << 80) - 1, cached[0].num)
+
+    def test_invalidation(self):
+        load_file(self.path, detect_readable=True)
+        key = Cache.source_key(self.path, True)
+
+        # Different flag
+        self.assertIsNone(Cache.read(self.path, False, Cache.source_key(self.path, False)))
+
+        # Different contents
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("[LF][LF][LF]")
+        new_key = Cache.source_key(self.path, True)
+        self.assertNotEqual(key, new_key)
+        self.assertIsNone(Cache.read(self.path, True, new_key))
+        self.assertEqual(load(self.source + "[LF][LF][LF]", True), load_file(self.path, detect_readable=True))
+
+    def test_corrupt(self):
+        load_file(self.path, detect_readable=True)
+        with open(Cache.cache_path(self.path), "r+b") as f:
+            f.truncate(50)
+        self.assertIsNone(Cache.read(self.path, True, Cache.source_key(self.path, True)))
+        self.assertEqual(load(self.source, True), load_file(self.path, detect_readable=True))
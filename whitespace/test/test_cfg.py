@@ -0,0 +1,72 @@
+from whitespace.Cfg import ControlFlowGraph, find_leaders, stack_depths, block_stack_effect
+from whitespace.Runner import load
+
+import unittest
+
+PROGRAM = ("[Space][Space][Space][Tab][LF] push 1\n"
+           + "[LF][Space][Space][Tab][LF] mark label 1\n"
+           + "[Space][LF][Space] duplicate\n"
+           + "[LF][Tab][Space][Tab][LF] jump to label 1 if zero\n"
+           + "[LF][Space][Tab][Tab][Space][LF] call label 2\n"
+           + "[LF][LF][LF] end\n"
+           + "[LF][Space][Space][Tab][Space][LF] mark label 2\n"
+           + "[LF][Tab][LF] return\n"
+           + "[LF][Space][Space][Tab][Tab][LF] mark label 3\n"
+           + "[LF][LF][LF] end\n")
+
+
+class TestCfg(unittest.TestCase):
+    def test_leaders(self):
+        program = load("[Space][Space][Space][Tab][LF] push 1\n"
+                       + "[LF][Space][Space][Tab][LF] mark label 1\n"
+                       + "[Space][LF][Space] duplicate\n"
+                       + "[LF][Tab][Space][Tab][LF] jump to label 1 if zero\n"
+                       + "[LF][Space][Tab][Tab][LF] call label 1\n"
+                       + "[LF][LF][LF] end\n", True)
+        self.assertEqual([0, 1, 3, 4], find_leaders(program))
+        self.assertEqual([0, 1, 2, 3, 4], find_leaders(program, [2, 9]))
+
+    def test_blocks(self):
+        cfg = ControlFlowGraph(load(PROGRAM, True))
+        self.assertEqual([(0, 1), (1, 3), (3, 4), (4, 5), (5, 6), (6, 7)], [(block.start, block.end) for block in cfg])
+        self.assertEqual({0: [1], 1: [1, 3], 3: [5], 4: [], 5: [3], 6: []},
+                         {block.start: block.successors for block in cfg})
+        self.assertEqual({0: [], 1: [0, 1], 3: [1, 5], 4: [], 5: [3], 6: []},
+                         {block.start: sorted(block.predecessors) for block in cfg})
+        self.assertIs(cfg.blocks[1], cfg.block_at(2))
+
+    def test_calls(self):
+        cfg = ControlFlowGraph(load(PROGRAM, True))
+        self.assertEqual({0: {0, 1, 3}, 5: {5}}, cfg.subroutines)
+        self.assertEqual({0: {5}, 5: set()}, cfg.calls)
+        # Returns go back to the call, so the end after it never runs
+        self.assertEqual({0, 1, 3, 5}, cfg.reachable())
+        self.assertEqual({4}, cfg.reachable([4]))
+        self.assertEqual({0, 1, 3, 4, 5}, ControlFlowGraph(cfg.program, [4]).reachable())
+
+    def test_stack_depths(self):
+        program = load("[Space][Space][Space][Tab][Tab][LF] push 3\n"
+                       + "[LF][Space][Space][Tab][LF] mark label 1\n"
+                       + "[Space][LF][Space] duplicate\n"
+                       + "[LF][Tab][Space][Space][LF] jump to label 0 if zero\n"
+                       + "[Space][Space][Space][Tab][LF] push 1\n"
+                       + "[Tab][Space][Space][Tab] subtract\n"
+                       + "[LF][Space][LF][Tab][LF] jump to label 1\n"
+                       + "[LF][Space][Space][Space][LF] mark label 0\n"
+                       + "[Tab][Space][Space][Space] add\n", True)
+        cfg = ControlFlowGraph(program)
+        self.assertEqual((1, 1), block_stack_effect(program, cfg.blocks[1]))
+        self.assertEqual((1, 0), block_stack_effect(program, cfg.blocks[3]))
+        # The loop keeps the count on the stack
+        self.assertEqual({0: 0, 1: 1, 3: 2, 6: 2}, stack_depths(cfg))
+        self.assertEqual({0: 2, 1: 3, 3: 4, 6: 4}, stack_depths(cfg, {0: 2}))
+
+        # A loop shrinking the stack ends up with nothing known
+        program = load("[LF][Space][Space][Tab][LF] mark label 1\n"
+                       + "[Space][LF][LF] discard\n"
+                       + "[LF][Space][LF][Tab][LF] jump to label 1\n", True)
+        self.assertEqual({0: 0}, stack_depths(ControlFlowGraph(program), {0: 100}))
+
+
+if __name__ == "__main__":
+    unittest.main()
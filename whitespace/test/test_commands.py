@@ -77,7 +77,9 @@ class TestCommands(unittest.TestCase):
         stack.append(97)
 
         # Run
-        ret = out_char.execute(Runtime(stack=stack, file_out=file))
+        runtime = Runtime(stack=stack, file_out=file)
+        ret = out_char.execute(runtime)
+        runtime.output.flush()
 
         # Assert
         self.assertEqual(ret, 1)
@@ -93,7 +95,9 @@ class TestCommands(unittest.TestCase):
         stack.append(97)
 
         # Run
-        ret = out_char.execute(Runtime(stack=stack, file_out=file))
+        runtime = Runtime(stack=stack, file_out=file)
+        ret = out_char.execute(runtime)
+        runtime.output.flush()
 
         # Assert
         self.assertEqual(ret, 1)
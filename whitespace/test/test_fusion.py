@@ -0,0 +1,120 @@
+from whitespace.Fusion import Profile, Fused, fuse, fusable_length
+from whitespace.Runner import load, run
+from whitespace.Runtime import Runtime
+from whitespace.Jit import stack_range
+from whitespace.Constants_errors import StackError
+
+import unittest
+import contextlib
+import io
+import os
+import tempfile
+
+# Adds 1 to the heap at address 0 three times, then prints it
+COUNTER = ("[Space][Space][Space][Tab][Tab][LF] push 3\n"
+           + "[LF][Space][Space][Tab][LF] mark label 1\n"
+           + "[Space][Space][Space][Space][LF] push 0\n"
+           + "[Space][Space][Space][Space][LF] push 0\n"
+           + "[Tab][Tab][Tab] retrieve\n"
+           + "[Space][Space][Space][Tab][LF] push 1\n"
+           + "[Tab][Space][Space][Space] add\n"
+           + "[Tab][Tab][Space] store\n"
+           + "[Space][Space][Space][Tab][LF] push 1\n"
+           + "[Tab][Space][Space][Tab] subtract\n"
+           + "[LF][Tab][Space][Space][LF] jump to label 0 if zero\n"
+           + "[LF][Space][LF][Tab][LF] jump to label 1\n"
+           + "[LF][Space][Space][Space][LF] mark label 0\n"
+           + "[Space][Space][Space][Space][LF] push 0\n"
+           + "[Tab][Tab][Tab] retrieve\n"
+           + "[Tab][LF][Space][Tab] output number\n"
+           + "[LF][LF][LF] end\n")
+
+
+class TestFusion(unittest.TestCase):
+    def run_counter(self, **options) -> Runtime:
+        runtime = Runtime(file_out=io.StringIO())
+        run(load(COUNTER, True), False, False, False, runtime=runtime, **options)
+        return runtime
+
+    def test_verbose_steps(self):
+        # Stepping through shows every OutChar, rather than the string they write
+        program = load("[Space][Space][Space][Tab][Space][Space][Tab][Space][Space][Space][LF] push 'H'\n"
+                       + "[Tab][LF][Space][Space] output character\n"
+                       + "[Space][Space][Space][Tab][Tab][Space][Tab][Space][Space][Tab][LF] push 'i'\n"
+                       + "[Tab][LF][Space][Space] output character\n", True)
+        runtime = Runtime(file_out=io.StringIO())
+        with contextlib.redirect_stdout(io.StringIO()) as printed:
+            run(program, False, True, False, runtime=runtime)
+        self.assertEqual("Hi", runtime.file_out.getvalue())
+        self.assertNotIn("OutString", printed.getvalue())
+        self.assertEqual(4, len(printed.getvalue().splitlines()))
+
+    def test_fusable_length(self):
+        program = load(COUNTER, True)
+        # Not into a labelled instruction, but from one
+        self.assertEqual(1, fusable_length(program, 0))
+        self.assertEqual(4, fusable_length(program, 1))
+        self.assertEqual(2, fusable_length(program, 1, 2))
+        # Up to and including a branch
+        self.assertEqual(2, fusable_length(program, 8))
+        self.assertEqual(1, fusable_length(program, 9))
+        self.assertEqual(4, fusable_length(program, 11))
+
+    def test_record(self):
+        profile = Profile()
+        self.run_counter(profile=profile)
+        # Push 0; Push 0 runs on each of the three iterations
+        self.assertEqual(3, profile.counts[("Push", "Push")])
+        self.assertEqual(3, profile.counts[("Push", "Push", "Read_Heap", "Push")])
+        # Never crosses the label on the second instruction
+        self.assertNotIn(("Push", "Push", "Push"), profile.counts)
+        self.assertEqual(1, profile.counts[("Push", "Read_Heap", "OutNum", "End")])
+        # Fusing four instructions saves three dispatches per run
+        best = profile.best(1)[0]
+        self.assertEqual((4, 3), (len(best), profile.counts[best]))
+
+    def test_save(self):
+        profile = Profile()
+        self.run_counter(profile=profile)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "profile.json")
+            profile.save(path)
+            loaded = Profile.load(path)
+        self.assertEqual(profile.counts, loaded.counts)
+
+        loaded.merge(profile)
+        self.assertEqual(6, loaded.counts[("Push", "Push")])
+
+    def test_fuse(self):
+        profile = Profile()
+        self.run_counter(profile=profile)
+        program = load(COUNTER, True)
+        fused = fuse(program, profile, stack_range(Runtime().stack))
+        self.assertIsInstance(fused[1], Fused)
+        self.assertEqual([program[pc] for pc in range(1, 5)], fused[1].commands)
+        # No sequence starts inside another
+        for (pc, command) in fused.items():
+            for inner in range(pc + 1, pc + len(command.commands)):
+                self.assertNotIn(inner, fused)
+                self.assertEqual(-1, program.labels[inner])
+
+        for engine in ("loop", "threaded"):
+            self.assertEqual("3", self.run_counter(engine=engine, superinstructions=profile).file_out.getvalue())
+
+    def test_errors(self):
+        program = load("[Space][Space][Space][Tab][LF] push 1\n"
+                       + "[Space][Space][Space][Tab][LF] push 1\n"
+                       + "[Tab][Space][Space][Space] add\n"
+                       + "[Tab][Space][Space][Space] add\n", True)
+        profile = Profile({("Push", "Push", "Plus", "Plus"): 1})
+        for engine in ("loop", "threaded"):
+            runtime = Runtime()
+            with self.assertRaisesRegex(StackError, "Need two elements to add"):
+                run(program, False, False, False, engine, runtime, superinstructions=profile)
+            # Points at the failing instruction, with the stack as it was there
+            self.assertEqual(3, runtime.PC)
+            self.assertEqual([2], list(runtime.stack))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,9 @@
-from whitespace.Heap import Heap
+from whitespace.Heap import Heap, MappedHeap, PAGE_SIZE
 from whitespace.Constants_errors import HeapError
 import unittest
+import os
+import tempfile
+from array import array
 
 
 class TestHeap(unittest.TestCase):
@@ -43,3 +46,64 @@ class TestHeap(unittest.TestCase):
         self.assertEqual(0, heap.read(0))
         self.assertEqual(0, heap.read(12))
 
+    def test_reads_dont_allocate(self):
+        heap = Heap()
+        self.assertEqual(0, heap.read(10 ** 12))
+        self.assertEqual(4, len(heap.arr))
+        self.assertEqual({}, heap.pages)
+
+    def test_sparse(self):
+        heap = Heap()
+        heap.write(10 ** 9, 5)
+        heap.write(10 ** 9 + 1, 6)
+        # One page, rather than gigabytes of array
+        self.assertEqual(4, len(heap.arr))
+        self.assertEqual(1, len(heap.pages))
+        self.assertEqual([5, 6, 0], [heap.read(10 ** 9 + i) for i in range(3)])
+
+    def test_dense_takes_over_pages(self):
+        heap = Heap()
+        heap.write(PAGE_SIZE + 1, 7)
+        self.assertEqual(1, len(heap.pages))
+        # Writing upwards from the bottom keeps doubling the array, past the page
+        for address in range(2 * PAGE_SIZE + 1):
+            if address != PAGE_SIZE + 1:
+                heap.write(address, 1)
+        self.assertEqual({}, heap.pages)
+        self.assertEqual(7, heap.read(PAGE_SIZE + 1))
+        self.assertEqual(1, heap.read(PAGE_SIZE))
+
+    def test_negative_address(self):
+        heap = Heap()
+        heap.write(3, 1)
+        self.assertRaises(HeapError, lambda: heap.read(-1))
+        self.assertRaises(HeapError, lambda: heap.write(-1, 2))
+        self.assertEqual(1, heap.read(3))
+
+
+    def test_mapped(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "heap")
+            with MappedHeap(path, capacity=16) as heap:
+                heap.write(3, 123)
+                self.assertEqual(0, heap.read(100))
+                self.assertEqual(16, len(heap.cells))
+                # Grows to fit
+                heap.write(100, -5)
+                self.assertEqual(128, len(heap.cells))
+                self.assertEqual([123, -5], [heap.read(3), heap.read(100)])
+                self.assertRaises(HeapError, lambda: heap.write(-1, 1))
+            # The file keeps the heap image
+            with open(path, "rb") as f:
+                image = array(heap.typecode, f.read())
+            self.assertEqual(128, len(image))
+            self.assertEqual((123, -5), (image[3], image[100]))
+
+    def test_mapped_overflow(self):
+        with MappedHeap(typecode='i') as heap:
+            self.assertRaises(OverflowError, lambda: heap.write(0, 1 << 40))
+        self.assertRaises(ValueError, lambda: MappedHeap(typecode=None))
+
+
+if __name__ == "__main__":
+    unittest.main()
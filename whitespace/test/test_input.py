@@ -0,0 +1,66 @@
+from whitespace.Input import Input
+from whitespace.Output import Output
+
+import unittest
+import io
+
+
+class TestInput(unittest.TestCase):
+    def test_read_char(self):
+        # Blocks split the multi-byte characters
+        data = "a☺é\0b".encode("utf-8")
+        for file in (io.BytesIO(data), io.BufferedReader(io.BytesIO(data)), io.StringIO("a☺é\0b")):
+            input = Input(file, 2)
+            self.assertEqual([97, 0x263A, 0xE9, 0, 98, 0, 0], [input.read_char() for _ in range(7)])
+
+        self.assertRaises(UnicodeDecodeError, lambda: Input(io.BytesIO(b"\xff")).read_char())
+
+    def test_read_num(self):
+        input = Input(io.BytesIO(b"  12\n-345678\n7"), 3)
+        self.assertEqual([12, -345678, 7, 0], [input.read_num() for _ in range(4)])
+
+        input = Input(io.BytesIO(b"1\nx\n2\nab"))
+        self.assertEqual(1, input.read_num())
+        self.assertRaises(ValueError, input.read_num)
+        # Numbers and characters come from the same buffer
+        self.assertEqual(50, input.read_char())
+        self.assertEqual(10, input.read_char())
+        self.assertEqual(97, input.read_char())
+
+    def test_tie(self):
+        file_out = io.StringIO()
+        output = Output(file_out)
+        input = Input(io.BytesIO(b"ab"), tie=output)
+        output.write_char(63)
+        self.assertEqual(97, input.read_char())
+        self.assertEqual("?", file_out.getvalue())
+        # Reading what is buffered doesn't flush
+        output.write_char(33)
+        self.assertEqual(98, input.read_char())
+        self.assertEqual("?", file_out.getvalue())
+
+    def test_tie_terminal(self):
+        # A terminal may have lines typed ahead in the buffer, so every read flushes
+        class Terminal(io.BytesIO):
+            def isatty(self) -> bool:
+                return True
+        file_out = io.StringIO()
+        output = Output(file_out)
+        input = Input(Terminal(b"1\n2\n"), tie=output)
+        output.write_char(63)
+        self.assertEqual(1, input.read_num())
+        output.write_char(33)
+        self.assertEqual(2, input.read_num())
+        self.assertEqual("?!", file_out.getvalue())
+
+    def test_read_line(self):
+        # The debugger's commands come from the buffer the program reads
+        input = Input(io.BytesIO(b"ni\n42\nnexti"), 2)
+        self.assertEqual("ni", input.read_line())
+        self.assertEqual(42, input.read_num())
+        self.assertEqual("nexti", input.read_line())
+        self.assertRaises(EOFError, input.read_line)
+
+
+if __name__ == "__main__":
+    unittest.main()
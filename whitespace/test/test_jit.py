@@ -0,0 +1,203 @@
+from whitespace import Jit
+from whitespace.Jit import run_jit, generate_source, cached_blocks
+from whitespace.Cfg import ControlFlowGraph, stack_depths
+from whitespace.Runner import load, run
+from whitespace.Runtime import Runtime
+from whitespace.Program import Program, PUSH, DUPLICATE, SWAP, DISCARD, COPY, SLIDE
+from whitespace.Program import PLUS, MINUS, TIMES, INT_DIVIDE, MODULO, OUT_CHAR, OUT_NUM
+from whitespace.Program import END, JUMP, JUMP_ZERO, JUMP_NEGATIVE, READ_HEAP, WRITE_HEAP
+from whitespace.Visitor import visit_flow_control
+from whitespace.Constants_errors import StackError, WORD_TYPE
+
+import unittest
+import io
+import os
+import random
+from array import array
+from unittest import mock
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), "..", "..", "examples")
+
+
+class TestJit(unittest.TestCase):
+    # Runs the program with the loop engine and the JIT, checking they end the same way
+    def assertSameAsLoop(self, program: Program, stdin: str = "", stack: list[int] | array | None = None) -> Runtime:
+        results = []
+        for engine in ("loop", "jit"):
+            runtime = Runtime(stack=None if stack is None else stack[:], file_in=io.StringIO(stdin), file_out=io.StringIO())
+            try:
+                run(program, False, False, False, engine, runtime)
+                error = None
+            except Exception as e:
+                error = (type(e), str(e))
+            results.append((error, list(runtime.stack), list(runtime.heap.arr), runtime.file_out.getvalue(), runtime.PC))
+        self.assertEqual(results[0], results[1])
+        return runtime
+
+    def test_examples(self):
+        with open(os.path.join(EXAMPLES, "hello-world.ws"), encoding="utf-8") as f:
+            runtime = self.assertSameAsLoop(load(f.read(), True))
+        self.assertEqual("Hello, world", runtime.file_out.getvalue().strip())
+
+        with open(os.path.join(EXAMPLES, "cat.ws"), encoding="utf-8") as f:
+            runtime = self.assertSameAsLoop(load(f.read(), True), "meow\n")
+        self.assertEqual("meow\n\0", runtime.file_out.getvalue())
+
+    def test_errors(self):
+        # Fails with values pushed in the same block still held in locals
+        program = load("[Space][Space][Space][Tab][LF] push 1\n"
+                       + "[Space][Space][Space][Tab][Space][LF] push 2\n"
+                       + "[Space][Tab][Space][Space][Tab][Tab][LF] copy 3rd\n", True)
+        runtime = self.assertSameAsLoop(program)
+        self.assertRaisesRegex(StackError, "it is only 2 long", lambda: run_jit(program, Runtime()))
+        self.assertEqual(2, runtime.PC)
+
+        # Divides by zero after taking both values
+        self.assertSameAsLoop(load("[Space][Space][Space][Tab][LF][Space][Space][Space][Space][LF][Tab][Space][Tab][Space]", True), stack=[5])
+
+        # Overflows the array stack
+        program = Program()
+        program.append(PUSH, 1, 1 << 62)
+        program.append(DUPLICATE, 2)
+        program.append(PLUS, 3)
+        program.append(PUSH, 4, 1 << 64)
+        self.assertSameAsLoop(program)
+        runtime = Runtime()
+        self.assertRaises(OverflowError, lambda: run_jit(program, runtime))
+        self.assertEqual(2, runtime.PC)
+
+        # Returning with an empty callstack
+        self.assertSameAsLoop(load("[Space][Space][Space][Tab][LF][LF][Tab][LF]", True))
+
+    def test_return(self):
+        # Returns go to the PCs on the callstack, even in the middle of a block
+        program = load("[Space][Space][Space][Tab][LF] push 1\n"
+                       + "[Tab][LF][Space][Tab] output number\n"
+                       + "[LF][Tab][LF] return\n"
+                       + "[LF][LF][LF] end\n", True)
+        runtime = Runtime(callstack=array(WORD_TYPE, [3, 1]), stack=[7], file_out=io.StringIO())
+        run_jit(program, runtime)
+        runtime.output.flush()
+        self.assertEqual("17", runtime.file_out.getvalue())
+        self.assertEqual(-1, runtime.PC)
+
+    def test_random_programs(self):
+        # Straight-line programs with forward branches, so they always end
+        ops = [PUSH, PUSH, PUSH, PUSH, PUSH, PUSH, DUPLICATE, SWAP, DISCARD, COPY, SLIDE, PLUS, MINUS, TIMES, INT_DIVIDE, MODULO,
+               OUT_NUM, OUT_CHAR, READ_HEAP, WRITE_HEAP, JUMP, JUMP_ZERO, JUMP_NEGATIVE, END]
+        generator = random.Random(1234)
+        for _ in range(300):
+            program = Program()
+            length = generator.randint(1, 30)
+            targets = set()
+            for pc in range(length):
+                op = generator.choice(ops)
+                if op in (JUMP, JUMP_ZERO, JUMP_NEGATIVE):
+                    target = generator.randint(pc + 1, length)
+                    targets.add(target)
+                    program.append(op, pc, target)
+                else:
+                    program.append(op, pc, generator.randint(-3, 70))
+            program.append(END, length)
+            # Labels are named after the PC they mark
+            for target in targets:
+                program.labels[target] = target
+            visit_flow_control(program)
+            stack = [generator.randint(-2, 9) for _ in range(generator.randint(0, 4))]
+            # Lists and arrays differ on overflow
+            self.assertSameAsLoop(program, stack=stack)
+            self.assertSameAsLoop(program, stack=array(WORD_TYPE, stack))
+
+    def test_generated_source(self):
+        program = load("[Space][Space][Space][Tab][LF][Space][Space][Space][Tab][Space][LF][Tab][Space][Space][Space]", True)
+        source = generate_source(ControlFlowGraph(program))
+        # Neither value reaches the stack before the add
+        self.assertIn("t1 = 1 + 2", source)
+        self.assertNotIn("pop()", source)
+
+    def test_constant_strings(self):
+        with open(os.path.join(EXAMPLES, "hello-world.ws"), encoding="utf-8") as f:
+            source = generate_source(ControlFlowGraph(load(f.read(), True)))
+        self.assertIn("write('Hello, world')", source)
+        self.assertNotIn("write_char(", source)
+
+    def test_stack_checks(self):
+        program = load("[Space][Space][Space][Tab][LF] push 1\n"
+                       + "[Space][Space][Space][Tab][Space][LF] push 2\n"
+                       + "[Tab][Space][Space][Space] add\n"
+                       + "[Space][LF][Space] duplicate\n"
+                       + "[Tab][Space][Space][Space] add\n"
+                       + "[Tab][Space][Space][Space] add\n"
+                       + "[Tab][LF][Space][Tab] output number\n", True)
+        # One check for the whole block before anything runs, falling back to a copy checking the last add
+        source = generate_source(ControlFlowGraph(program))
+        self.assertEqual(2, source.count("if len(stack) < 1:"))
+        self.assertIn("return checked_0()", source)
+        # Which still fails at the same instruction
+        runtime = self.assertSameAsLoop(program)
+        self.assertEqual(5, runtime.PC)
+        self.assertEqual("13", self.assertSameAsLoop(program, stack=[7]).file_out.getvalue())
+        # Or none, when the stack is known to be deep enough
+        self.assertNotIn("len(stack)", generate_source(ControlFlowGraph(program), depths={0: 1}))
+
+    def test_cached_top(self):
+        # Counts down from 3, printing each number, then discards one value too many
+        program = load("[Space][Space][Space][Tab][Tab][LF] push 3\n"
+                       + "[LF][Space][Space][Tab][LF] mark label 1\n"
+                       + "[LF][Tab][Space][Space][LF] jump to label 0 if zero\n"
+                       + "[Space][LF][Space] duplicate\n"
+                       + "[Tab][LF][Space][Tab] output number\n"
+                       + "[Space][Space][Space][Tab][LF] push 1\n"
+                       + "[Tab][Space][Space][Tab] subtract\n"
+                       + "[LF][Space][LF][Tab][LF] jump to label 1\n"
+                       + "[LF][Space][Space][Space][LF] mark label 0\n"
+                       + "[Space][LF][LF] discard\n"
+                       + "[Space][LF][LF] discard\n", True)
+        cfg = ControlFlowGraph(program)
+        self.assertEqual({1, 2, 7}, cached_blocks(cfg, stack_depths(cfg)))
+        # The loop never touches the stack
+        source = generate_source(cfg, depths=stack_depths(cfg))
+        self.assertIn("return 7 if tos == 0 else 2", source)
+        self.assertNotIn("pop()", source.split("def checked_7")[0])
+        self.assertNotIn("tos", generate_source(cfg, depths=stack_depths(cfg), cache_top=False))
+
+        runtime = self.assertSameAsLoop(program)
+        self.assertEqual("321", runtime.file_out.getvalue())
+        self.assertEqual(8, runtime.PC)
+        runtime = self.assertSameAsLoop(program, stack=[5])
+        self.assertEqual([], list(runtime.stack))
+
+    def test_many_blocks(self):
+        # Thousands of labels, each starting a block; compiling takes time linear in their number,
+        # as the blocks are flat functions rather than closures nested in one function
+        program = Program()
+        for i in range(3000):
+            program.append(PUSH, i, i)
+            program.append(OUT_NUM, i)
+            program.append(PUSH, i, i % 2)
+            program.append(JUMP_ZERO, i, 4 * (i + 1))
+        program.append(END, 3000)
+        for i in range(3000):
+            program.labels[4 * (i + 1)] = 4 * (i + 1)
+        visit_flow_control(program)
+        source = generate_source(ControlFlowGraph(program))
+        self.assertEqual(3001, source.count("def block_"))
+        self.assertNotIn(" def ", source)
+        runtime = self.assertSameAsLoop(program)
+        self.assertEqual("".join(map(str, range(3000))), runtime.file_out.getvalue())
+
+    def test_code_cache(self):
+        with open(os.path.join(EXAMPLES, "cat.ws"), encoding="utf-8") as f:
+            program = load(f.read(), True)
+        self.assertSameAsLoop(program, "meow\n")
+        # Later runs reuse the compiled code without building the graph again
+        with mock.patch.object(Jit, "ControlFlowGraph", wraps=ControlFlowGraph) as graph:
+            runtime = self.assertSameAsLoop(program, "purr\n")
+            self.assertEqual("purr\n\0", runtime.file_out.getvalue())
+            self.assertEqual(0, graph.call_count)
+            run(program, False, False, False, "jit", Runtime(stack=[1], file_in=io.StringIO(), file_out=io.StringIO()))
+            self.assertEqual(1, graph.call_count)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+from whitespace.Output import Output
+from whitespace.Runner import load, run, ENGINES
+from whitespace.Runtime import Runtime
+
+import unittest
+import io
+import os
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), "..", "..", "examples")
+
+
+# Input that records what had been output by each read, and hands it over a
+# character at a time, like a terminal would a line at a time
+class Prompted(io.StringIO):
+    def __init__(self, text: str, output: io.StringIO):
+        super().__init__(text)
+        self.output = output
+        self.seen: list[str] = []
+
+    def read(self, size: int = -1) -> str:
+        self.seen.append(self.output.getvalue())
+        return super().read(1)
+
+
+class TestOutput(unittest.TestCase):
+    def test_buffer(self):
+        file = io.StringIO()
+        output = Output(file, 8)
+        output.write_char(ord("a"))
+        output.write_num(-12)
+        self.assertEqual("", file.getvalue())
+        # Three bytes of UTF-8
+        output.write_char(0x263A)
+        self.assertEqual("", file.getvalue())
+        output.write_num(5)
+        self.assertEqual("a-12☺5", file.getvalue())
+        output.write("b")
+        output.flush()
+        self.assertEqual("a-12☺5b", file.getvalue())
+        self.assertRaises(ValueError, lambda: output.write_char(-1))
+
+    def test_raw(self):
+        file = io.BytesIO()
+        output = Output(file, raw=True)
+        for char in "hé\0":
+            output.write_char(ord(char))
+        output.write_num(42)
+        output.flush()
+        self.assertEqual("hé\0".encode("utf-8") + b"42", file.getvalue())
+
+    def test_flushed_before_reads(self):
+        with open(os.path.join(EXAMPLES, "cat.ws"), encoding="utf-8") as f:
+            program = load(f.read(), True)
+        for engine in ENGINES:
+            file_out = io.StringIO()
+            file_in = Prompted("ab", file_out)
+            run(program, False, False, False, engine, Runtime(file_in=file_in, file_out=file_out))
+            self.assertEqual(["", "a", "ab"], file_in.seen, engine)
+            self.assertEqual("ab\0", file_out.getvalue(), engine)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -89,6 +89,21 @@ class TestParser(unittest.TestCase):
         self.run_test("[LF][Tab][Tab][Tab][Tab][Tab][Space][LF]", [JumpNegative(1, -1, 14)])
         self.run_test("[LF][Tab][LF]", [EndSub(1, -1)])
 
+    def test_numbers(self):
+        self.run_test("[Space][Space][Tab][Tab][Space][LF]", [Push(1, -2)])
+        self.run_test("[Space][Space][Space][LF]", [Push(1, 0)])
+        # A number without a sign is -1
+        self.run_test("[Space][Space][LF]", [Push(1, -1)])
+        self.run_test("[Space][Space][Space]" + "[Tab]" * 80 + "[LF]", [Push(1, (1 << 80) - 1)])
+
+    def test_errors(self):
+        with self.assertRaisesRegex(Exception, "line 2 index 3"):
+            Parser("\t\t\n\t\n", detect_readable=False).allCommands()
+        with self.assertRaisesRegex(Exception, "line 3"):
+            Parser("[LF][LF][LF]\n\n[Tab][Space]", detect_readable=True).allCommands()
+        # A label mark must be followed by a command
+        with self.assertRaisesRegex(Exception, "line 1"):
+            Parser("[LF][Space][Space][Tab][LF]", detect_readable=True).allCommands()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,42 @@
+from whitespace.Program import Program, PUSH, JUMP, OUT_CHAR
+from whitespace.Commands import Push, Jump, OutChar, End
+from whitespace.Parser import Parser
+from whitespace.Visitor import visit_flow_control
+
+import unittest
+
+
+class TestProgram(unittest.TestCase):
+    def test_view(self):
+        program = Program()
+        program.append(PUSH, 1, 72, label=3)
+        program.append(OUT_CHAR, 2)
+        program.append(JUMP, 3, 3)
+
+        self.assertEqual(3, len(program))
+        self.assertEqual(Push(1, 72, 3), program[0])
+        self.assertEqual(OutChar(2), program[1])
+        self.assertEqual(Jump(3, -1, 3), program[-1])
+        self.assertEqual([Push(1, 72, 3), OutChar(2), Jump(3, -1, 3)], list(program))
+
+    def test_from_commands(self):
+        commands = [Push(1, 72, 3), OutChar(2), Jump(3, -1, 3), End(4)]
+        program = Program.fromCommands(commands)
+        self.assertEqual(commands, program)
+
+        visit_flow_control(program)
+        self.assertEqual(0, program[2].target_pc)
+        self.assertEqual(0, program.targets[2])
+
+    def test_large_numbers(self):
+        # Numbers past 64 bits do not fit the arg array, so it becomes a list
+        program = Program()
+        program.append(PUSH, 1, 5)
+        program.append(PUSH, 1, 1 << 70)
+        self.assertEqual(5, program[0].num)
+        self.assertEqual(1 << 70, program[1].num)
+
+    def test_parsed(self):
+        program = Parser("[Space][Space][Space][Tab][LF]\n[LF][LF][LF]", detect_readable=True).allCommands()
+        self.assertEqual(bytes(program.ops), bytes([PUSH, 15]))
+        self.assertEqual(list(program.lines), [1, 2])
@@ -0,0 +1,69 @@
+from whitespace.Runtime import Runtime, wrap
+from whitespace.Runner import load, run, ENGINES
+from whitespace.Stack import Stack
+
+import unittest
+import io
+
+# Pushes 2^31 - 1, adds 1 and prints the result
+OVERFLOW = ("[Space][Space][Space]" + "[Tab]" * 31 + "[LF] push 2147483647\n"
+            + "[Space][Space][Space][Tab][LF] push 1\n"
+            + "[Tab][Space][Space][Space] add\n"
+            + "[Tab][LF][Space][Tab] output number\n")
+
+
+class TestRuntime(unittest.TestCase):
+    def run_all(self, source: str, int_mode: str) -> list[str]:
+        program = load(source, True)
+        outputs = []
+        for engine in ENGINES:
+            runtime = Runtime(file_out=io.StringIO(), int_mode=int_mode)
+            run(program, False, False, False, engine, runtime)
+            outputs.append(runtime.file_out.getvalue())
+        return outputs
+
+    def test_wrap(self):
+        self.assertEqual(-2 ** 31, wrap(2 ** 31, 32))
+        self.assertEqual(-1, wrap(2 ** 64 - 1, 64))
+        self.assertEqual(5, wrap(5, 32))
+
+    def test_int_modes(self):
+        self.assertEqual(["-2147483648"] * 3, self.run_all(OVERFLOW, "wrap32"))
+        self.assertEqual(["2147483648"] * 3, self.run_all(OVERFLOW, "wrap64"))
+        self.assertEqual(["2147483648"] * 3, self.run_all(OVERFLOW, "bigint"))
+
+    def test_push_wrapped(self):
+        runtime = Runtime(int_mode="wrap32")
+        runtime.push_wrapped(2 ** 31, OverflowError())
+        self.assertEqual([-2 ** 31], list(runtime.stack))
+        # Without a wrapping int mode, the error is raised, whether or not one is being handled
+        error = OverflowError("too big")
+        with self.assertRaises(OverflowError) as raised:
+            Runtime().push_wrapped(2 ** 64, error)
+        self.assertIs(error, raised.exception)
+
+    def test_representation(self):
+        runtime = Runtime(stack=[1, 2 ** 40], int_mode="wrap32")
+        self.assertIsInstance(runtime.stack, Stack)
+        self.assertEqual(4, runtime.stack.itemsize)
+        self.assertEqual([1, 0], list(runtime.stack))
+        self.assertEqual(32, runtime.wrap_bits)
+
+        runtime = Runtime(int_mode="bigint")
+        self.assertIsInstance(runtime.stack, list)
+        self.assertIsInstance(runtime.heap.arr, list)
+        self.assertIsNone(runtime.wrap_bits)
+
+        self.assertRaises(ValueError, lambda: Runtime(int_mode="wrap16"))
+
+    def test_read_num(self):
+        program = load("[Space][Space][Space][Space][LF] push 0\n"
+                       + "[Tab][LF][Tab][Tab] read number\n", True)
+        for engine in ENGINES:
+            runtime = Runtime(file_in=io.StringIO("4294967297\n"), int_mode="wrap32")
+            run(program, False, False, False, engine, runtime)
+            self.assertEqual(1, runtime.heap.read(0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+from whitespace.Stack import Stack
+from whitespace.Commands import Slide, Copy
+from whitespace.Runtime import Runtime
+from whitespace.Constants_errors import StackError
+
+import unittest
+import pickle
+
+class TestStack(unittest.TestCase):
+    def test_slide(self):
+        stack = Stack(range(10, 20))
+        stack.slide(3)
+        self.assertEqual([10, 11, 12, 13, 14, 15, 19], stack.tolist())
+        stack.slide(0)
+        self.assertEqual(7, len(stack))
+        self.assertRaisesRegex(StackError, "it is only 7 long", lambda: stack.slide(6))
+
+    def test_copy(self):
+        stack = Stack([1, 2, 3])
+        stack.copy(2)
+        self.assertEqual([1, 2, 3, 1], stack.tolist())
+        self.assertRaisesRegex(StackError, "Cannot copy 4th num", lambda: stack.copy(4))
+
+    def test_view(self):
+        stack = Stack([1, 2, 3])
+        with stack.view() as view:
+            self.assertEqual([1, 2, 3], view.tolist())
+            # Held views stop the stack from moving
+            self.assertRaises(BufferError, lambda: stack.append(4))
+        stack.append(4)
+        self.assertEqual(4, len(stack))
+
+    def test_slide_in_place(self):
+        # The loop engine keeps the runtime's stack, so bound methods stay valid
+        runtime = Runtime()
+        stack = runtime.stack
+        self.assertIsInstance(stack, Stack)
+        stack.extend(range(100))
+        Slide(1, 98).execute(runtime)
+        self.assertIs(stack, runtime.stack)
+        self.assertEqual([0, 99], stack.tolist())
+
+    def test_list_stack(self):
+        # bigint mode keeps the stack in a list, which slides and copies the same way
+        runtime = Runtime(int_mode="bigint")
+        stack = runtime.stack
+        stack.extend([1 << 80, 2, 3])
+        Copy(1, 2).execute(runtime)
+        Slide(1, 2).execute(runtime)
+        self.assertIs(stack, runtime.stack)
+        self.assertEqual([1 << 80, 1 << 80], stack)
+        self.assertRaisesRegex(StackError, "it is only 2 long", lambda: Slide(1, 1).execute(runtime))
+        self.assertRaisesRegex(StackError, "Cannot copy 2th num", lambda: Copy(1, 2).execute(runtime))
+
+    def test_pickle(self):
+        stack = Stack([5, -6])
+        copied = pickle.loads(pickle.dumps(stack))
+        self.assertIsInstance(copied, Stack)
+        self.assertEqual(stack, copied)
+
+
+if __name__ == "__main__":
+    unittest.main()
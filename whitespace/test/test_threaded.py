@@ -0,0 +1,73 @@
+from whitespace.Threaded import run_threaded
+from whitespace.Runner import load, run
+from whitespace.Runtime import Runtime
+from whitespace.Constants_errors import StackError
+
+import unittest
+import io
+import os
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), "..", "..", "examples")
+
+
+class TestThreaded(unittest.TestCase):
+    # Runs the program with both engines, checking they end in the same state
+    def assertSameAsLoop(self, source: str, stdin: str = "") -> Runtime:
+        program = load(source, True)
+        expected = run(program, False, False, False, "loop", Runtime(file_in=io.StringIO(stdin), file_out=io.StringIO()))
+        runtime = run(program, False, False, False, "threaded", Runtime(file_in=io.StringIO(stdin), file_out=io.StringIO()))
+        self.assertEqual(list(expected.stack), list(runtime.stack))
+        self.assertEqual(list(expected.callstack), list(runtime.callstack))
+        self.assertEqual(expected.heap.arr, runtime.heap.arr)
+        self.assertEqual(expected.file_out.getvalue(), runtime.file_out.getvalue())
+        self.assertEqual(expected.PC, runtime.PC)
+        return runtime
+
+    def test_examples(self):
+        with open(os.path.join(EXAMPLES, "hello-world.ws"), encoding="utf-8") as f:
+            runtime = self.assertSameAsLoop(f.read())
+        self.assertEqual("Hello, world", runtime.file_out.getvalue().strip())
+
+        with open(os.path.join(EXAMPLES, "cat.ws"), encoding="utf-8") as f:
+            runtime = self.assertSameAsLoop(f.read(), "meow\n")
+        self.assertEqual("meow\n\0", runtime.file_out.getvalue())
+
+    def test_stack(self):
+        runtime = self.assertSameAsLoop("[Space][Space][Space][Tab][LF] push 1\n"
+                                        + "[Space][Space][Space][Tab][Space][LF] push 2\n"
+                                        + "[Space][Space][Space][Tab][Tab][LF] push 3\n"
+                                        + "[Space][LF][Space] duplicate\n"
+                                        + "[Space][Tab][Space][Space][Tab][Space][LF] copy 2nd\n"
+                                        + "[Space][LF][Tab] swap\n"
+                                        + "[Space][Tab][LF][Space][Tab][LF] slide 1\n")
+        self.assertEqual([1, 2, 3, 3], list(runtime.stack))
+
+    def test_arithmetic_and_heap(self):
+        runtime = self.assertSameAsLoop("[Space][Space][Space][Tab][Space][LF] push 2 (address)\n"
+                                        + "[Space][Space][Space][Tab][Tab][Tab][LF] push 7\n"
+                                        + "[Space][Space][Tab][Tab][Space][LF] push -2\n"
+                                        + "[Tab][Space][Tab][Space] divide\n"
+                                        + "[Space][Space][Space][Tab][Space][Tab][LF] push 5\n"
+                                        + "[Tab][Space][Space][LF] times\n"
+                                        + "[Tab][Tab][Space] store\n"
+                                        + "[Space][Space][Space][Tab][Space][LF] push 2\n"
+                                        + "[Tab][Tab][Tab] retrieve\n"
+                                        + "[Tab][LF][Space][Tab] output number\n"
+                                        + "[LF][LF][LF] end\n")
+        self.assertEqual("-20", runtime.file_out.getvalue())
+        self.assertEqual(-1, runtime.PC)
+
+    def test_errors(self):
+        program = load("[Space][Space][Space][Tab][LF] push 1\n[Tab][Space][Space][Space] add\n", True)
+        runtime = Runtime()
+        with self.assertRaisesRegex(StackError, "Need two elements to add"):
+            run_threaded(program, runtime)
+        # Stopped on the failing instruction
+        self.assertEqual(1, runtime.PC)
+
+        program = load("[LF][Tab][LF]", True)
+        self.assertRaises(StackError, lambda: run_threaded(program, Runtime()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,8 @@
-from whitespace.Tokenizer import Tokenizer, Token, TokenType
+from whitespace.Tokenizer import Tokenizer, Token, TokenType, TAB, SPACE, LINEFEED, EOF
+import whitespace.Tokenizer
+import io
+import os
+import tempfile
 import unittest
 
 
@@ -47,7 +51,61 @@ class TestTokenizer(unittest.TestCase):
                        Token(TokenType.TAB, 1), Token(TokenType.SPACE, 1),
                        Token(TokenType.SPACE, 1), Token(TokenType.SPACE, 1),
                        Token(TokenType.SPACE, 1), Token(TokenType.LINEFEED, 1)])
-        
+
+    def test_long_comment(self):
+        # Comments are dropped in bulk, so this must not recurse per character
+        source = " " + "x" * 100000 + "\t\n" + "[comment]" * 10000 + " "
+        self.run_test(source, [Token(TokenType.SPACE, 1), Token(TokenType.TAB, 1),
+                               Token(TokenType.LINEFEED, 1), Token(TokenType.SPACE, 2)])
+
+    def test_codes(self):
+        t = Tokenizer(" a\tb\nc", detect_readable=False)
+        self.assertEqual(SPACE, t.nextCode())
+        self.assertEqual(TAB, t.nextCode())
+        self.assertEqual(LINEFEED, t.nextCode())
+        self.assertEqual(EOF, t.nextCode())
+        self.assertEqual(2, t.line)
+
+        t = Tokenizer("[Tab]\n\n[LF]\n", detect_readable=True)
+        self.assertEqual(bytes([TAB, LINEFEED]), t.codes)
+        self.assertEqual(1, t.lineAt(0))
+        self.assertEqual(3, t.lineAt(1))
+
+
+    def test_chunked_file(self):
+        source = b"[LF][Space]\n[Space]a[Tab]\n[Tab][Space][LF]"
+        whole = Tokenizer(source, detect_readable=True)
+        old_size = whitespace.Tokenizer.CHUNK_SIZE
+        try:
+            # Tokens split across chunks must still be found
+            for size in range(1, 8):
+                whitespace.Tokenizer.CHUNK_SIZE = size
+                chunked = Tokenizer(io.BytesIO(source), detect_readable=True)
+                self.assertEqual(whole.codes, chunked.codes)
+                self.assertEqual(whole.breaks, chunked.breaks)
+        finally:
+            whitespace.Tokenizer.CHUNK_SIZE = old_size
+
+
+    def test_parallel(self):
+        sources = [b" \t\n  comment \n\t" * 200 + b"\n\n\n",
+                   b"[Space]x[Tab]\n\n[LF] [Tab]\n" * 200]
+        old_size = whitespace.Tokenizer.MIN_SHARD_SIZE
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "program.ws")
+            try:
+                whitespace.Tokenizer.MIN_SHARD_SIZE = 100
+                for source in sources:
+                    with open(path, "wb") as f:
+                        f.write(source)
+                    serial = Tokenizer(source, detect_readable=True)
+                    with open(path, "rb") as f:
+                        parallel = Tokenizer(f, detect_readable=True, jobs=3)
+                    self.assertEqual(serial.codes, parallel.codes)
+                    self.assertEqual(serial.breaks, parallel.breaks)
+            finally:
+                whitespace.Tokenizer.MIN_SHARD_SIZE = old_size
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,10 +1,14 @@
 from whitespace.Commands import Command, CallSub, Jump, JumpNegative, JumpZero
-from whitespace.Constants_errors import DuplicateLabels
+from whitespace.Constants_errors import DuplicateLabels, CannotFindJumpTarget
+from whitespace.Program import Program, PUSH, DISCARD, TIMES, INT_DIVIDE, OUT_NUM, END, JUMP
+from whitespace.Runner import run
+from whitespace.Runtime import Runtime
 from whitespace.Parser import Parser
-from whitespace.Visitor import visit_flow_control
+from whitespace.Visitor import visit_flow_control, visit_optimize, find_constant_strings, visit_asm_generation
 from whitespace.Constants_errors import DuplicateLabels
 
 import unittest
+import io
 
 class TestVisitor(unittest.TestCase):
     def test_duplicates_detected(self):
@@ -16,3 +20,117 @@ class TestVisitor(unittest.TestCase):
         self.assertRaises(DuplicateLabels, lambda: visit_flow_control(program))
         # TODO finish this
     
+
+    def test_resolved_while_parsing(self):
+        program = Parser("[LF][Space][LF] [Tab][LF] jump to label 1\n" +
+                         "[LF][Space][Space] [Tab][LF] mark label 1\n" +
+                         "[Space][Space] [Space][Tab][LF] push 1\n" +
+                         "[LF][Space][LF] [Tab][LF] jump to label 1\n", detect_readable=True).allCommands()
+        self.assertTrue(program.resolved)
+        self.assertEqual([1, -1, 1], list(program.targets))
+        visit_flow_control(program)
+
+    def test_missing_label(self):
+        program = Parser("[Space][Space] [Space][Tab][LF] push 1\n" +
+                         "[LF][Tab][Space] [Tab][Tab][LF] jump to label 3\n", detect_readable=True).allCommands()
+        with self.assertRaisesRegex(CannotFindJumpTarget, "line 2"):
+            visit_flow_control(program)
+
+    def test_unparsed_program(self):
+        # Programs not built by the parser are walked by the visitor
+        program = Program.fromCommands([Jump(1, -1, 4), CallSub(2, 4, 4)])
+        self.assertFalse(program.resolved)
+        visit_flow_control(program)
+        self.assertEqual([1, 1], list(program.targets))
+        self.assertRaises(DuplicateLabels, lambda: visit_flow_control(Program.fromCommands([Jump(1, 4, 4), CallSub(2, 4, 4)])))
+
+    def test_fold_constants(self):
+        program = Parser("[Space][Space] [Space][Tab][LF] push 1\n" +
+                         "[Space][Space] [Space][Tab][Space][LF] push 2\n" +
+                         "[Space][Space] [Space][Tab][Tab][LF] push 3\n" +
+                         "[Tab][Space][Space][Space] add\n" +
+                         "[Tab][Space][Space][Space] add\n" +
+                         "[Space][Space] [Space][Space][LF] push 0\n" +
+                         "[Tab][Space][Tab][Space] divide\n" +
+                         "[Tab][LF][Space][Tab] output number\n", detect_readable=True).allCommands()
+        optimized = visit_optimize(program)
+        # Division by zero is left to fail at runtime
+        self.assertEqual([PUSH, PUSH, INT_DIVIDE, OUT_NUM], list(optimized.ops))
+        self.assertEqual(6, optimized.args[0])
+        self.assertEqual(program, visit_optimize(program, 0))
+
+    def test_fold_int_modes(self):
+        # 2147483647 * 2 wraps around to -2 in 32 bits, so it divides to -1
+        program = Program()
+        for (op, arg) in ((PUSH, 2147483647), (PUSH, 2), (TIMES, 0), (PUSH, 2), (INT_DIVIDE, 0), (OUT_NUM, 0)):
+            program.append(op, 1, arg)
+        for (int_mode, expected) in (("wrap32", "-1"), ("wrap64", "2147483647"), ("bigint", "2147483647")):
+            for level in (0, 2):
+                runtime = Runtime(file_out=io.StringIO(), int_mode=int_mode)
+                run(visit_optimize(program, level, int_mode), False, False, False, "loop", runtime)
+                self.assertEqual(expected, runtime.file_out.getvalue())
+        optimized = visit_optimize(program, 2, "wrap32")
+        self.assertEqual(([PUSH, OUT_NUM], -1), (list(optimized.ops), optimized.args[0]))
+
+    def test_push_discard(self):
+        program = Parser("[Space][Space] [Space][Tab][LF] push 1\n" +
+                         "[LF][Space][Space] [Tab][LF] mark label 1\n" +
+                         "[Space][Space] [Space][Tab][Space][LF] push 2\n" +
+                         "[Space][LF][LF] discard\n" +
+                         "[Space][LF][LF] discard\n" +
+                         "[Tab][LF][Space][Tab] output number\n" +
+                         "[LF][Space][LF] [Tab][LF] jump to label 1\n", detect_readable=True).allCommands()
+        optimized = visit_optimize(program, 1)
+        # The label moves onto the instruction after the removed pair
+        self.assertEqual([PUSH, DISCARD, OUT_NUM, JUMP], list(optimized.ops))
+        self.assertEqual([-1, 1, -1, -1], list(optimized.labels))
+        self.assertEqual(1, optimized.targets[3])
+
+    def test_thread_jumps(self):
+        program = Parser("[LF][Space][LF] [Tab][LF] jump to label 1\n" +
+                         "[LF][Space][Space] [Space][LF] mark label 0\n" +
+                         "[LF][LF][LF] end\n" +
+                         "[LF][Space][Space] [Tab][LF] mark label 1\n" +
+                         "[LF][Space][LF] [Tab][Space][LF] jump to label 2\n" +
+                         "[LF][Space][Space] [Tab][Space][LF] mark label 2\n" +
+                         "[LF][Space][LF] [Space][LF] jump to label 0\n", detect_readable=True).allCommands()
+        optimized = visit_optimize(program, 1)
+        # Every jump now goes straight to label 0, so the first one falls through to it
+        self.assertEqual([END, JUMP, JUMP], list(optimized.ops))
+        self.assertEqual([0, 0], list(optimized.args[1:]))
+        # Jumps to themselves are left alone
+        program = Parser("[LF][Space][Space] [Tab][LF] mark label 1\n" +
+                         "[LF][Space][LF] [Tab][LF] jump to label 1\n", detect_readable=True).allCommands()
+        self.assertEqual(program, visit_optimize(program))
+
+    def test_simplify_branches(self):
+        program = Parser("[Space][Space] [Space][Space][LF] push 0\n" +
+                         "[LF][Tab][Tab] [Tab][LF] jump to label 1 if negative\n" +
+                         "[LF][Tab][Space] [Tab][LF] jump to label 1 if zero\n" +
+                         "[Space][Space] [Space][Tab][LF] push 1\n" +
+                         "[LF][Space][Space] [Tab][LF] mark label 1\n" +
+                         "[Tab][LF][Space][Tab] output number\n" +
+                         "[LF][LF][LF] end\n", detect_readable=True).allCommands()
+        optimized = visit_optimize(program)
+        # The zero is still printed, since the branches don't pop it
+        self.assertEqual([PUSH, JUMP, PUSH, OUT_NUM, END], list(optimized.ops))
+        self.assertEqual(3, optimized.targets[1])
+
+    def test_constant_strings(self):
+        program = Parser("[Space][Space] [Space][Tab][Space][Space][Tab][Space][Space][Space][LF] push 'H'\n" +
+                         "[Tab][LF][Space][Space] output char\n" +
+                         "[Space][Space] [Space][Tab][Tab][Space][Tab][Space][Space][Tab][LF] push 'i'\n" +
+                         "[Tab][LF][Space][Space] output char\n" +
+                         "[LF][Space][Space] [Tab][LF] mark label 1\n" +
+                         "[Space][Space] [Space][Tab][Space][Space][Space][Space][Tab][LF] push '!'\n" +
+                         "[Tab][LF][Space][Space] output char\n" +
+                         "[Space][Space] [Tab][Tab][LF] push -1\n" +
+                         "[Tab][LF][Space][Space] output char\n", detect_readable=True).allCommands()
+        # A run may start at a label, but not go past one; -1 isn't a character
+        self.assertEqual({0: (4, "Hi"), 4: (6, "!")}, find_constant_strings(program))
+        self.assertEqual({2: (4, "i")}, find_constant_strings(program, 1, 5))
+
+        assembly = visit_asm_generation(program)
+        # One write for each string, and one for the -1
+        self.assertEqual(3, assembly.count("syscall           ; );"))
+        self.assertIn("string_0: db 72, 105\n", assembly)